@@ -0,0 +1,692 @@
+"""
+Library API for the CTA L ridership analyses.
+
+These functions answer the same questions as the commands in main.py, but
+take plain parameters and return compact records (or iterators of
+records) instead of printing, prompting or plotting:
+
+    import sqlite3, api
+    dbConn = sqlite3.connect("CTA2_L_daily_ridership.db")
+    station = api.find_station(dbConn, "Clark%")
+    for point in api.yearly_ridership(dbConn, station.station_id):
+        print(point.period, point.riders)
+
+The records use __slots__, so millions of them stay small, and as_dict()
+turns any record into a dictionary (e.g. for JSON). main.py and service.py
+are formatting layers over this module.
+"""
+
+import columnar
+import queries
+import ranking
+import rollups
+import spatial
+import stations
+import topology
+
+
+class record:
+    """
+    Base class of the result records: fixed fields in __slots__.
+    """
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.as_tuple() == other.as_tuple()
+
+    def as_tuple(self):
+        """
+        This function returns the fields of the record in order.
+
+        Returns:
+            A tuple of the field values
+        """
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def as_dict(self):
+        """
+        This function returns the fields of the record by name.
+
+        Returns:
+            A dictionary mapping each field name to its value
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+class station(record):
+    __slots__ = ("station_id", "station_name")
+
+class station_location(record):
+    __slots__ = ("station_name", "latitude", "longitude", "distance")
+
+    def __init__(self, station_name, latitude, longitude, distance=None):
+        super().__init__(station_name, latitude, longitude, distance)
+
+class general_stats(record):
+    __slots__ = ("num_stations", "num_stops", "num_rides", "first_date", "last_date", "total")
+
+class day_type_ridership(record):
+    __slots__ = ("station_id", "station_name", "weekday", "saturday", "sunday_holiday")
+
+    @property
+    def total(self):
+        return self.weekday + self.saturday + self.sunday_holiday
+
+class range_ridership(record):
+    __slots__ = ("station_id", "station_name", "range_start", "range_end", "weekday", "saturday", "sunday_holiday",
+                 "weekday_days", "saturday_days", "sunday_holiday_days")
+
+    @property
+    def total(self):
+        return self.weekday + self.saturday + self.sunday_holiday
+
+    @property
+    def num_days(self):
+        return self.weekday_days + self.saturday_days + self.sunday_holiday_days
+
+class station_share(record):
+    __slots__ = ("station_id", "station_name", "riders", "percentage")
+
+class ridership_point(record):
+    __slots__ = ("period", "riders")
+
+class line_stop(record):
+    __slots__ = ("stop_id", "stop_name", "ada", "station_id", "latitude", "longitude")
+
+class line_count(record):
+    __slots__ = ("color", "direction", "count", "percentage")
+
+class ridership_pivot(record):
+    __slots__ = ("periods", "stations", "riders")
+
+    def rows(self):
+        """
+        This function pairs each station with its row of the pivot.
+
+        Returns:
+            A list of (station record, list of riders per period) tuples
+        """
+        return list(zip(self.stations, self.riders))
+
+class station_trend(record):
+    __slots__ = ("station_id", "station_name", "rolling_average", "yoy_change",
+                 "weekday_share", "saturday_share", "sunday_holiday_share", "mix_shift", "outlier_days")
+
+class outlier_day(record):
+    __slots__ = ("station_id", "station_name", "date", "day_type", "riders", "z_score")
+
+class station_ridership(record):
+    __slots__ = ("station_id", "station_name", "latitude", "longitude", "riders")
+
+
+class station_lookup_error(LookupError):
+    """
+    Raised when a station name matches no station, or more than one.
+    """
+    def __init__(self, pattern, matches):
+        if(len(matches) == 0):
+            super().__init__(f"No station found: {pattern}")
+        else:
+            super().__init__(f"Multiple stations found: {', '.join(match.station_name for match in matches)}")
+        self.pattern = pattern
+        self.matches = matches
+
+
+def stats(dbConn, pool=None):
+    """
+    This function finds the general statistics of the database.
+
+    Args:
+        dbConn: connection to the CTA database
+        pool: a database.connection_pool to compute them in parallel, or None
+
+    Returns:
+        A general_stats record
+    """
+    return general_stats(*rollups.general_stats(dbConn, pool))
+
+def find_stations(dbConn, pattern):
+    """
+    This function finds the stations whose names match a pattern.
+
+    Args:
+        dbConn: connection to the CTA database
+        pattern: the station name (wildcards _ and %)
+
+    Returns:
+        A list of station records sorted by name
+    """
+    return [station(station_id, station_name) for station_id, station_name in stations.get_station_resolver(dbConn).match(pattern)]
+
+def find_station(dbConn, pattern):
+    """
+    This function finds the one station whose name matches a pattern.
+
+    Args:
+        dbConn: connection to the CTA database
+        pattern: the station name (wildcards _ and %)
+
+    Returns:
+        A station record
+
+    Raises:
+        station_lookup_error if no station or more than one station matches
+    """
+    matches = find_stations(dbConn, pattern)
+    if(len(matches) != 1):
+        raise station_lookup_error(pattern, matches)
+    return matches[0]
+
+def week_stats(dbConn, station_name):
+    """
+    This function finds the ridership of a station for each type of day (command 2).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_name: the exact name of the station
+
+    Returns:
+        A day_type_ridership record, or None if there is no such station or it has no ridership
+    """
+    station_ids = stations.get_station_resolver(dbConn).exact(station_name)
+    if(len(station_ids) == 0):
+        return None
+    return day_types(dbConn, station(station_ids[0], station_name))
+
+def day_types(dbConn, station_record):
+    """
+    This function finds the ridership of a station for each type of day.
+
+    Args:
+        dbConn: connection to the CTA database
+        station_record: a station record
+
+    Returns:
+        A day_type_ridership record, or None if the station has no ridership
+    """
+    day_totals = queries.day_type_totals(dbConn, station_record.station_id)
+    if(len(day_totals) == 0):
+        return None
+    return day_type_ridership(station_record.station_id, station_record.station_name, day_totals.get('W', 0),
+                              day_totals.get('A', 0), day_totals.get('U', 0))
+
+def range_totals(dbConn, station_record, date_range):
+    """
+    This function finds the ridership of a station for each type of day within any
+    date range, in constant time (see queries.range_totals).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_record: a station record
+        date_range: a (first day, day after the last day) tuple
+
+    Returns:
+        A range_ridership record
+    """
+    totals = queries.range_totals(dbConn, station_record.station_id, date_range)
+    return range_ridership(station_record.station_id, station_record.station_name, date_range[0], date_range[1],
+                           totals['W'][0], totals['A'][0], totals['U'][0],
+                           totals['W'][1], totals['A'][1], totals['U'][1])
+
+def station_position(dbConn, station_record):
+    """
+    This function finds where a station is (the middle of its stops).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_record: a station record
+
+    Returns:
+        A station_location record, or None if the station has no stops
+    """
+    position = queries.station_position(dbConn, station_record.station_id)
+    if(position == None):
+        return None
+    return station_location(station_record.station_name, position[0], position[1])
+
+def weekday_ridership(dbConn):
+    """
+    This function finds the weekday ridership of each station and its share of the total (command 3).
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A list of station_share records, one per station name (with the lowest Station_ID
+        of the name), highest ridership first
+    """
+    resolver = stations.get_station_resolver(dbConn)
+
+    columns = columnar.get_columns(dbConn)
+    if(columns == None):
+        station_totals = [(station_id, riders) for station_id, riders, percentage in ranking.rank_stations(dbConn, ['W'])]
+    else:
+        station_totals = columns.station_totals('W')
+
+    #add up stations with the same name (the original query grouped by name), on both engines
+    total = sum(station_total for station_id, station_total in station_totals)
+    name_totals = {}
+    name_ids = {}
+    for station_id, station_total in station_totals:
+        station_name = resolver.name(station_id)
+        if(station_name != None):
+            name_totals[station_name] = name_totals.get(station_name, 0) + station_total
+            name_ids[station_name] = min(station_id, name_ids.get(station_name, station_id))
+    ranked = sorted(name_totals.items(), key=lambda row: (-row[1], row[0])) #ties by name, the same on both engines
+    return [station_share(name_ids[station_name], station_name, station_total, (station_total/total)*100)
+            for station_name, station_total in ranked]
+
+def rank_stations(dbConn, day_types=("W",), date_range=None, top=None):
+    """
+    This function ranks the stations by ridership for the given types of day and date range.
+
+    Args:
+        dbConn: connection to the CTA database
+        day_types: a list of day types ('W' weekday, 'A' Saturday, 'U' Sunday/holiday)
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+        top: the number of stations, or None for every station
+
+    Returns:
+        An iterator of station_share records, highest ridership first
+    """
+    resolver = stations.get_station_resolver(dbConn)
+    for station_id, riders, percentage in ranking.rank_stations(dbConn, day_types, date_range, top):
+        yield station_share(station_id, resolver.name(station_id), riders, percentage)
+
+def has_line(dbConn, color):
+    """
+    This function checks if there is a line with the given color.
+
+    Args:
+        dbConn: connection to the CTA database
+        color: the line color (e.g. Red or Purple-Express)
+
+    Returns:
+        True if the line exists
+        False otherwise
+    """
+    return topology.get_line_topology(dbConn).has_line(color)
+
+def line_stops(dbConn, color, direction):
+    """
+    This function finds the stops of a line in one direction (command 4).
+
+    Args:
+        dbConn: connection to the CTA database
+        color: the line color (e.g. Red or Purple-Express)
+        direction: the direction (N/S/E/W)
+
+    Returns:
+        A list of line_stop records sorted by stop name,
+        empty if there is no such line or it does not run in that direction
+    """
+    return [line_stop(*stop) for stop in topology.get_line_topology(dbConn).stops(color, direction)]
+
+def line_directions(dbConn):
+    """
+    This function lists every line and the directions it runs in.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A list of (color, direction) tuples sorted by color and direction
+    """
+    lines = topology.get_line_topology(dbConn)
+    return [(color, direction) for color in lines.colors() for direction in lines.directions(color)]
+
+def stop_counts(dbConn):
+    """
+    This function counts the stops of each line by direction (command 5).
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A list of line_count records sorted by color and direction
+    """
+    lines = topology.get_line_topology(dbConn)
+    counts = []
+    for color, direction in line_directions(dbConn):
+        count = len(lines.stops(color, direction))
+        counts.append(line_count(color, direction, count, (count/lines.total_stops)*100))
+    return counts
+
+def yearly_ridership(dbConn, station_id):
+    """
+    This function finds the ridership of a station for each year (command 6).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_id: the Station_ID
+
+    Returns:
+        A list of ridership_point records ("YYYY", riders) sorted by year
+    """
+    return [ridership_point(year, riders) for year, riders in queries.yearly(dbConn, station_id)]
+
+def monthly_ridership(dbConn, station_id, year):
+    """
+    This function finds the ridership of a station for each month of a year (command 7).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_id: the Station_ID
+        year: the year (e.g. "2020")
+
+    Returns:
+        A list of ridership_point records ("MM/YYYY", riders) sorted by month
+    """
+    return [ridership_point(month, riders) for month, riders in queries.monthly(dbConn, station_id, str(year))]
+
+def make_pivot(station_list, rows_by_station):
+    """
+    This function lays per-station series out as a station x period pivot.
+
+    Args:
+        station_list: a list of station records
+        rows_by_station: a dictionary mapping each Station_ID to a list of (period, riders) tuples
+
+    Returns:
+        A ridership_pivot. The periods are sorted (months by year, then month), and riders
+        has one row per station with None for periods the station has no ridership
+    """
+    periods = sorted({period for rows in rows_by_station.values() for period, riders in rows},
+                     key=lambda period: period[-4:] + period)
+    columns = {period: number for number, period in enumerate(periods)}
+    riders = []
+    for station in station_list:
+        row = [None] * len(periods)
+        for period, total in rows_by_station[station.station_id]:
+            row[columns[period]] = total
+        riders.append(row)
+    return ridership_pivot(periods, station_list, riders)
+
+def yearly_pivot(dbConn, station_list):
+    """
+    This function finds the ridership of several stations for each year, with one
+    grouped query (see queries.yearly_pivot).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_list: a list of station records (e.g. from find_stations)
+
+    Returns:
+        A ridership_pivot of stations x years ("YYYY")
+    """
+    return make_pivot(station_list, queries.yearly_pivot(dbConn, [station.station_id for station in station_list]))
+
+def monthly_pivot(dbConn, station_list, year):
+    """
+    This function finds the ridership of several stations for each month of a year,
+    with one grouped query (see queries.monthly_pivot).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_list: a list of station records (e.g. from find_stations)
+        year: the year (e.g. "2020")
+
+    Returns:
+        A ridership_pivot of stations x months ("MM/YYYY")
+    """
+    return make_pivot(station_list, queries.monthly_pivot(dbConn, [station.station_id for station in station_list], str(year)))
+
+def daily_ridership(dbConn, station_ids, date_range):
+    """
+    This function finds the daily ridership of one or more stations within a date range (command 8).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_ids: a list of Station_IDs
+        date_range: a (first day, day after the last day) tuple (see queries.year_bounds and queries.date_bounds)
+
+    Returns:
+        A dictionary mapping each Station_ID to a list of ridership_point records
+        ("YYYY-MM-DD", riders) sorted by day
+    """
+    return {station_id: [ridership_point(day, riders) for day, riders in rows]
+            for station_id, rows in queries.daily(dbConn, station_ids, date_range).items()}
+
+def stations_nearby(dbConn, latitude, longitude, miles=1.0):
+    """
+    This function finds the stations within a radius of a location (command 9).
+
+    Args:
+        dbConn: connection to the CTA database
+        latitude: the latitude
+        longitude: the longitude
+        miles: the radius in miles
+
+    Returns:
+        A list of station_location records sorted by name, north to south and east to west
+    """
+    return [station_location(*row) for row in spatial.get_stop_index(dbConn).within(latitude, longitude, miles)]
+
+def nearest_stations(dbConn, locations, k=1):
+    """
+    This function finds the k closest stations to each of many locations.
+
+    Args:
+        dbConn: connection to the CTA database
+        locations: a list of (latitude, longitude) pairs
+        k: the number of stations for each location
+
+    Returns:
+        A list with, for each location, a list of up to k station_location records, closest first
+    """
+    return [[station_location(*match) for match in matches]
+            for matches in spatial.get_stop_index(dbConn).nearest_many(locations, k)]
+
+def optional_float(value):
+    """
+    This function converts a NumPy number into a float, or None if it is not a number.
+
+    Args:
+        value: the number
+
+    Returns:
+        The float, or None for NaN or infinity
+    """
+    value = float(value)
+    if(value != value or value in (float("inf"), float("-inf"))):
+        return None
+    return value
+
+def trend_years(dbConn):
+    """
+    This function lists the years of the history the trends can be computed for. Requires NumPy.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A sorted list of years (numbers)
+    """
+    import trends #loads NumPy, so only the trend commands import it
+    return list(trends.get_station_day_matrix(dbConn).year_list)
+
+def network_trends(dbConn, year=None, window=28, threshold=3.0):
+    """
+    This function computes the trends of every station for a year in one pass over
+    the station x day matrix (see trends.py). Requires NumPy.
+
+    Args:
+        dbConn: connection to the CTA database
+        year: the year (e.g. 2021), or None for the last year of the history
+        window: the rolling average window in days
+        threshold: how many standard deviations from normal make a day an outlier
+
+    Returns:
+        A list of station_trend records sorted by Station_ID, empty if the year has no data.
+        rolling_average is the average riders per day over the window ending on the last day
+        of the year. yoy_change is the percentage change of the average riders per day from
+        the year before. The shares are percentages of the year's riders, and mix_shift is
+        how many percentage points of the riders moved between types of day since the year
+        before. A value is None when it cannot be computed.
+    """
+    import trends #loads NumPy, so only the trend commands import it
+    matrix = trends.get_station_day_matrix(dbConn)
+    number = matrix.year_number(year)
+    if(number == None):
+        return []
+    columns = matrix.year_columns(number)
+    resolver = stations.get_station_resolver(dbConn)
+
+    rolling = matrix.rolling_average(window)[:, columns.stop - 1]
+    outliers = (abs(matrix.z_scores()[:, columns]) > threshold).sum(axis=1)
+
+    riders, days = matrix.yearly()
+    np = trends.np
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = riders.sum(axis=2) / days.sum(axis=2) #riders per day with data, station x year
+        shares = riders / riders.sum(axis=2, keepdims=True) * 100
+        if(number > 0):
+            yoy_change = (averages[:, number] / averages[:, number - 1] - 1) * 100
+            mix_shift = abs(shares[:, number] - shares[:, number - 1]).sum(axis=1) / 2
+        else:
+            yoy_change = np.full(len(matrix.station_ids), np.nan)
+            mix_shift = yoy_change
+
+    results = []
+    for row, station_id in enumerate(matrix.station_ids.tolist()):
+        if(days[row, number].sum() == 0):
+            continue
+        results.append(station_trend(station_id, resolver.name(station_id), optional_float(rolling[row]),
+                                     optional_float(yoy_change[row]), optional_float(shares[row, number, 0]),
+                                     optional_float(shares[row, number, 1]), optional_float(shares[row, number, 2]),
+                                     optional_float(mix_shift[row]), int(outliers[row])))
+    return results
+
+def outlier_days(dbConn, year=None, threshold=3.0):
+    """
+    This function finds the days of a year whose ridership was unusual for their station
+    and type of day (see trends.py). Requires NumPy.
+
+    Args:
+        dbConn: connection to the CTA database
+        year: the year (e.g. 2021), or None for the last year of the history
+        threshold: how many standard deviations from normal make a day an outlier
+
+    Returns:
+        A list of outlier_day records, most unusual first
+    """
+    import trends #loads NumPy, so only the trend commands import it
+    matrix = trends.get_station_day_matrix(dbConn)
+    number = matrix.year_number(year)
+    if(number == None):
+        return []
+    columns = matrix.year_columns(number)
+    resolver = stations.get_station_resolver(dbConn)
+
+    scores = matrix.z_scores()[:, columns]
+    rows, cols = (abs(scores) > threshold).nonzero()
+    order = (-abs(scores[rows, cols])).argsort(kind="stable")
+
+    results = []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        station_id = int(matrix.station_ids[row])
+        column = columns.start + col
+        results.append(outlier_day(station_id, resolver.name(station_id), matrix.date(column),
+                                   columnar.DAY_TYPES[matrix.day_type[row, column]],
+                                   int(matrix.riders[row, column]), float(scores[row, col])))
+    return results
+
+def rolling_averages(dbConn, station_ids, year=None, window=28):
+    """
+    This function finds the rolling average ridership of stations for each day of a year.
+    Requires NumPy.
+
+    Args:
+        dbConn: connection to the CTA database
+        station_ids: a list of Station_IDs
+        year: the year (e.g. 2021), or None for the last year of the history
+        window: the window in days
+
+    Returns:
+        A dictionary mapping each Station_ID to a list of ridership_point records
+        ("YYYY-MM-DD", average riders per day) sorted by day, skipping days with no data in the window
+    """
+    import trends #loads NumPy, so only the trend commands import it
+    matrix = trends.get_station_day_matrix(dbConn)
+    number = matrix.year_number(year)
+    results = {station_id: [] for station_id in station_ids}
+    if(number == None):
+        return results
+    columns = matrix.year_columns(number)
+    rolling = matrix.rolling_average(window)
+
+    for station_id in station_ids:
+        row = matrix.row(station_id)
+        if(row == None):
+            continue
+        for column in range(columns.start, columns.stop):
+            if(rolling[row, column] == rolling[row, column]): #skip NaN
+                results[station_id].append(ridership_point(matrix.date(column), float(rolling[row, column])))
+    return results
+
+def network_ridership(dbConn, day_types=("W", "A", "U"), date_range=None):
+    """
+    This function finds the ridership and position of every station, for the network map.
+    The totals come from one grouped query (see ranking.py) and are joined to the
+    station positions kept for the session.
+
+    Args:
+        dbConn: connection to the CTA database
+        day_types: a list of day types ('W' weekday, 'A' Saturday, 'U' Sunday/holiday)
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+
+    Returns:
+        A list of station_ridership records, highest ridership first. Stations
+        without a name or without stops are left out
+    """
+    resolver = stations.get_station_resolver(dbConn)
+    positions = spatial.get_station_positions(dbConn)
+    network = []
+    for station_id, riders, percentage in ranking.rank_stations(dbConn, day_types, date_range):
+        station_name = resolver.name(station_id)
+        position = positions.get(station_id)
+        if(station_name != None and position != None):
+            network.append(station_ridership(station_id, station_name, position[0], position[1], riders))
+    return network
+
+def network_monthly(dbConn, day_types, date_range):
+    """
+    This function finds the ridership of every station for each month of a date range,
+    with one grouped query (see queries.network_months), for the animated network map.
+
+    Args:
+        dbConn: connection to the CTA database
+        day_types: a list of day types ('W' weekday, 'A' Saturday, 'U' Sunday/holiday)
+        date_range: a (first day, day after the last day) tuple
+
+    Returns:
+        A ridership_pivot of stations x months ("YYYY-MM"). The stations are
+        station_ridership records with the total over the range, highest first,
+        and riders has 0 for months a station has no ridership
+    """
+    resolver = stations.get_station_resolver(dbConn)
+    positions = spatial.get_station_positions(dbConn)
+    rows_by_station = queries.network_months(dbConn, day_types, date_range)
+
+    periods = sorted({month for rows in rows_by_station.values() for month, riders in rows})
+    columns = {period: number for number, period in enumerate(periods)}
+    network = []
+    for station_id, rows in rows_by_station.items():
+        station_name = resolver.name(station_id)
+        position = positions.get(station_id)
+        if(station_name == None or position == None):
+            continue
+        row = [0] * len(periods)
+        for month, riders in rows:
+            row[columns[month]] = riders
+        network.append((station_ridership(station_id, station_name, position[0], position[1], sum(row)), row))
+
+    network.sort(key=lambda pair: (-pair[0].riders, pair[0].station_id))
+    return ridership_pivot(periods, [pair[0] for pair in network], [pair[1] for pair in network])
@@ -0,0 +1,242 @@
+"""
+Per-command benchmarks over synthetic databases.
+
+Each scale is a number of stations and a number of years of daily
+ridership, e.g. 150x20. The database for a scale is generated once with
+synthetic.py and kept in --dir for later runs. Every command function in
+main.py is then run against it with its output discarded, and for each
+one the benchmark reports:
+
+    cold ms     the first call (session caches, rollups and columns not yet built)
+    median ms   the median of --repeat further calls
+    queries     the SQL statements one warm call runs
+    peak KiB    the peak Python heap used by one warm call (tracemalloc)
+
+    python benchmark.py --scale 50x5 --scale 150x20 --save-baseline bench.json
+    python benchmark.py --scale 50x5 --scale 150x20 --baseline bench.json
+
+With --baseline, a command whose median is more than --threshold times its
+baseline (and at least 1 ms slower), or that runs more queries than before,
+is reported as a regression and the exit status is 1.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import cache
+import columnar
+import main
+import queries
+import rollups
+import stations
+import synthetic
+
+
+DEFAULT_SCALES = ["50x5", "150x20"]
+LAST_YEAR = 2021
+NOISE_MS = 1.0 #differences smaller than this are never regressions
+
+
+def parse_scale(scale):
+    """
+    This function splits a scale into its number of stations and years.
+
+    Args:
+        scale: "STATIONSxYEARS", e.g. "150x20"
+
+    Returns:
+        A (number of stations, number of years) tuple
+    """
+    num_stations, _, num_years = scale.lower().partition("x")
+    return (int(num_stations), int(num_years))
+
+def scale_database(directory, scale):
+    """
+    This function finds the synthetic database for a scale, generating it if needed.
+
+    Args:
+        directory: the directory holding the generated databases
+        scale: "STATIONSxYEARS"
+
+    Returns:
+        The path of the database
+    """
+    num_stations, num_years = parse_scale(scale)
+    os.makedirs(directory, exist_ok=True)
+    db_file = os.path.join(directory, f"synthetic-{num_stations}x{num_years}.db")
+    if(not os.path.exists(db_file)):
+        print(f"Generating {db_file}...", file=sys.stderr)
+        synthetic.generate_database(db_file, num_stations, LAST_YEAR - num_years + 1, LAST_YEAR)
+    return db_file
+
+def command_cases(dbConn):
+    """
+    This function lists the commands to time, with arguments that suit the database.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A list of (name, function taking dbConn) tuples
+    """
+    names = [row[1] for row in stations.get_station_resolver(dbConn).stations]
+    first, second = names[0], names[len(names) // 2]
+    year = rollups.general_stats(dbConn)[4][:4] #the last year with data
+    locations = [(41.70 + number * 0.0035, -87.92 + number * 0.0035) for number in range(100)]
+
+    cases = [
+        ("stats", lambda dbConn: main.print_stats(dbConn)),
+        ("find", lambda dbConn: main.findStation(dbConn, "%-00%")),
+        ("weekstats", lambda dbConn: main.analyze_station_weekStats(dbConn, first)),
+        ("range", lambda dbConn: main.range_ridership(dbConn, [first, second], queries.date_bounds(f"{year}-02-03", f"{year}-11-17"), year)),
+        ("weekday", lambda dbConn: main.weekday_ridership(dbConn)),
+        ("rank", lambda dbConn: main.rank_ridership(dbConn, ["A", "U"], queries.year_bounds(year), 10)),
+        ("accessibility", lambda dbConn: main.all_line_accessibility(dbConn)),
+        ("stops", lambda dbConn: main.number_stops(dbConn)),
+        ("yearly", lambda dbConn: main.yearly_ridership(dbConn, first, False)),
+        ("monthly", lambda dbConn: main.monthly_ridership(dbConn, first, year, False)),
+        ("pivot", lambda dbConn: main.pivot_ridership(dbConn, ["%"], year)),
+        ("compare", lambda dbConn: main.compare_stats(dbConn, year, [first, second], False)),
+        ("nearby", lambda dbConn: main.stations_nearby(dbConn, 41.8781, -87.6298, False)),
+        ("nearest", lambda dbConn: main.nearest_stations(dbConn, locations, 3)),
+        ("heatmap", lambda dbConn: main.network_map(dbConn, ["W", "A", "U"], queries.year_bounds(year), year, True, plot=False)),
+        ("export", lambda dbConn: main.export_ridership(dbConn, [first], "daily", os.devnull)),
+    ]
+    if(columnar.available()):
+        cases.append(("trends", lambda dbConn: main.network_trends(dbConn, year)))
+    return cases
+
+def measure(dbConn, function, repeat):
+    """
+    This function times one command, discarding what it prints.
+
+    Args:
+        dbConn: connection to the CTA database
+        function: the command, a function taking dbConn
+        repeat: the number of warm calls to time
+
+    Returns:
+        A dictionary with cold_ms, median_ms, queries and peak_kib
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        start = time.perf_counter()
+        function(dbConn)
+        cold_ms = (time.perf_counter() - start) * 1000
+
+        times = []
+        for number in range(repeat):
+            output.seek(0)
+            output.truncate()
+            start = time.perf_counter()
+            function(dbConn)
+            times.append((time.perf_counter() - start) * 1000)
+
+        statements = []
+        dbConn.set_trace_callback(statements.append)
+        tracemalloc.start()
+        function(dbConn)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        dbConn.set_trace_callback(None)
+
+    return {"cold_ms": cold_ms, "median_ms": statistics.median(times),
+            "queries": len(statements), "peak_kib": peak / 1024}
+
+def compare_baseline(result, baseline, threshold):
+    """
+    This function compares a result against its baseline.
+
+    Args:
+        result: the measurements of a command
+        baseline: the baseline measurements of the command, or None
+        threshold: the slowdown ratio that counts as a regression
+
+    Returns:
+        A note for the report, "" if there is no baseline,
+        and True if the command regressed
+    """
+    if(baseline == None):
+        return ("", False)
+    ratio = result["median_ms"] / max(baseline["median_ms"], 0.001)
+    slower = result["median_ms"] - baseline["median_ms"] > NOISE_MS and ratio > threshold
+    more_queries = result["queries"] > baseline["queries"]
+    note = f"{ratio:.2f}x"
+    if(slower or more_queries):
+        note += " REGRESSION" + (" (queries)" if more_queries else "")
+    return (note, slower or more_queries)
+
+def run_benchmarks(scales, directory, repeat, baseline=None, threshold=1.25):
+    """
+    This function runs every command at every scale and prints the report.
+
+    Args:
+        scales: a list of "STATIONSxYEARS" scales
+        directory: the directory holding the generated databases
+        repeat: the number of warm calls to time per command
+        baseline: the measurements of an earlier run (scale/command -> measurements), or None
+        threshold: the slowdown ratio that counts as a regression
+
+    Returns:
+        A tuple with the measurements (scale/command -> measurements) and the number of regressions
+    """
+    results = {}
+    regressions = 0
+    print(f"{'scale':<10} {'command':<14} {'cold ms':>10} {'median ms':>10} {'queries':>8} {'peak KiB':>10}")
+
+    for scale in scales:
+        db_file = scale_database(directory, scale)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dbConn = main.open_database(db_file) #creates the indexes and rollups the first time
+        setup_ms = (time.perf_counter() - start) * 1000
+        print(f"{scale:<10} {'(setup)':<14} {setup_ms:>10.1f}")
+
+        for name, function in command_cases(dbConn):
+            key = f"{scale}/{name}"
+            results[key] = measure(dbConn, function, repeat)
+            note, regressed = compare_baseline(results[key], None if baseline == None else baseline.get(key), threshold)
+            regressions += regressed
+            result = results[key]
+            print(f"{scale:<10} {name:<14} {result['cold_ms']:>10.1f} {result['median_ms']:>10.2f} "
+                  f"{result['queries']:>8} {result['peak_kib']:>10.1f} {note}")
+        dbConn.close()
+
+    return (results, regressions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time each command on synthetic databases.")
+    parser.add_argument("--scale", action="append", help="STATIONSxYEARS, may be repeated (default 50x5 and 150x20)")
+    parser.add_argument("--dir", default="benchmarks", help="directory for the generated databases (default benchmarks)")
+    parser.add_argument("--repeat", type=int, default=5, help="warm calls per command (default 5)")
+    parser.add_argument("--engine", choices=["sqlite", "numpy"], default="sqlite")
+    parser.add_argument("--baseline", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--save-baseline", help="write this run's measurements to a JSON file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression (default 1.25)")
+    args = parser.parse_args()
+
+    if(args.engine == "numpy"):
+        columnar.enabled = columnar.available()
+    cache.enabled = False #time the queries, not result cache hits
+
+    baseline = None
+    if(args.baseline != None):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results, regressions = run_benchmarks(args.scale or DEFAULT_SCALES, args.dir, args.repeat, baseline, args.threshold)
+
+    if(args.save_baseline != None):
+        with open(args.save_baseline, "w") as file:
+            json.dump(results, file, indent=2)
+    if(regressions > 0):
+        print(f"**{regressions} regression(s)")
+        sys.exit(1)
@@ -0,0 +1,214 @@
+"""
+Result cache for the ridership queries.
+
+The functions in queries.py look their answers up here before querying.
+A result is keyed on the query name and its normalized parameters, and
+belongs to one content version of the database (see
+database.content_version), so any change to the data makes every cached
+result stale.
+
+Results are kept pickled in an in-memory LRU bounded by MAX_MEMORY_BYTES,
+so a hit costs an unpickle and the caller gets its own copy. With
+persistence on ("python main.py --cache persist"), results are also
+written to a second sidecar next to the database (e.g.
+CTA2_L_daily_ridership.cache.db), so they survive restarts. That file
+keeps at most MAX_PERSISTED_ROWS results and evicts the least recently
+used. Results from older versions of the data are deleted when it is
+opened.
+"""
+
+import collections
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import database
+
+
+MAX_MEMORY_BYTES = 32 * 1024 * 1024
+MAX_PERSISTED_ROWS = 20000
+
+CACHE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS Results(
+    Key TEXT PRIMARY KEY,
+    Version TEXT,
+    Value BLOB,
+    Last_Used REAL
+);
+CREATE INDEX IF NOT EXISTS idx_results_last_used ON Results (Last_Used);
+"""
+
+enabled = True #set by main.py (--cache off)
+persist = False #set by main.py (--cache persist)
+
+
+def cache_path(dbConn):
+    """
+    This function builds the file path of the persisted cache for the connection.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The path of the cache file (e.g. CTA2_L_daily_ridership.cache.db)
+        "" if the main database is not a file
+    """
+    path = database.database_path(dbConn)
+    if(path == ""):
+        return ""
+    root, ext = os.path.splitext(path)
+    return f"{root}.cache{ext or '.db'}"
+
+
+class result_cache:
+    """
+    An LRU of pickled results for one version of the data, optionally backed by a file.
+    """
+    def __init__(self, version, path=""):
+        self.version = version
+        self.entries = collections.OrderedDict() #key -> pickled result, least recently used first
+        self.size = 0 #bytes of pickled results held in memory
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock() #the HTTP service looks results up from several threads
+
+        self.store = None
+        if(path != ""):
+            try:
+                self.store = sqlite3.connect(path, check_same_thread=False)
+                self.store.execute("PRAGMA journal_mode = WAL;")
+                self.store.execute("PRAGMA synchronous = OFF;") #losing a cached result is harmless
+                self.store.executescript(CACHE_SCHEMA_SQL)
+                with self.store:
+                    self.store.execute("Delete From Results Where Version != ?;", [version])
+                self.stored = self.store.execute("Select count(*) From Results;").fetchone()[0]
+            except sqlite3.Error: #e.g. a read-only directory, keep the results in memory only
+                self.store = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        This function looks a result up, in memory first and then in the file.
+
+        Args:
+            key: the key of the result
+
+        Returns:
+            The pickled result, or None if it is not cached
+        """
+        with self.lock:
+            value = self.entries.get(key)
+            if(value != None):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+            if(self.store != None):
+                row = self.store.execute("Select Value From Results Where Key = ? and Version = ?;",
+                                         [key, self.version]).fetchone()
+                if(row != None):
+                    with self.store:
+                        self.store.execute("Update Results Set Last_Used = ? Where Key = ?;", [time.time(), key])
+                    self.remember(key, row[0])
+                    self.hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """
+        This function caches a result.
+
+        Args:
+            key: the key of the result
+            value: the pickled result
+        """
+        with self.lock:
+            self.remember(key, value)
+            if(self.store != None):
+                with self.store:
+                    self.store.execute("Insert Or Replace Into Results Values (?, ?, ?, ?);",
+                                       [key, self.version, value, time.time()])
+                    self.stored += 1
+                    if(self.stored > MAX_PERSISTED_ROWS):
+                        #evict the least recently used tenth in one go
+                        self.store.execute("""Delete From Results Where Key In
+                                              (Select Key From Results Order By Last_Used ASC Limit ?);""",
+                                           [MAX_PERSISTED_ROWS // 10])
+                        self.stored = self.store.execute("Select count(*) From Results;").fetchone()[0]
+
+    def remember(self, key, value):
+        """
+        This function keeps a result in memory, evicting the least recently used
+        results while the total size is over MAX_MEMORY_BYTES. Call with the lock held.
+
+        Args:
+            key: the key of the result
+            value: the pickled result
+        """
+        if(key in self.entries):
+            self.size -= len(self.entries.pop(key))
+        if(len(value) > MAX_MEMORY_BYTES):
+            return
+        self.entries[key] = value
+        self.size += len(value)
+        while(self.size > MAX_MEMORY_BYTES):
+            old_key, old_value = self.entries.popitem(last=False)
+            self.size -= len(old_value)
+
+
+def open_result_cache(dbConn):
+    """
+    This function creates the result cache for the current version of the data.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The result_cache
+    """
+    return result_cache(database.content_version(dbConn), cache_path(dbConn) if persist else "")
+
+def get_result_cache(dbConn):
+    """
+    This function returns the result cache for the session. A new, empty cache
+    replaces it when the data changes.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The result_cache
+    """
+    return database.session_cached(dbConn, "result_cache", open_result_cache)
+
+def cached(dbConn, name, parameters, compute):
+    """
+    This function returns a cached result, or computes and caches it.
+
+    Args:
+        dbConn: connection to the CTA database
+        name: the name of the query (e.g. "yearly")
+        parameters: the normalized parameters of the query, a tuple of numbers and strings
+        compute: a function of no arguments that runs the query
+
+    Returns:
+        The result (a copy, safe to modify)
+    """
+    if(not enabled):
+        return compute()
+
+    results = get_result_cache(dbConn)
+    key = repr((name, parameters))
+    value = results.get(key)
+    if(value != None):
+        return pickle.loads(value)
+
+    result = compute()
+    results.put(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    return result
@@ -0,0 +1,397 @@
+"""
+Columnar NumPy copy of the Ridership table.
+
+Ridership is loaded once into four compact columns, sorted by station and day:
+
+    station   int32   Station_ID
+    day       int32   days since 1970-01-01
+    day_type  uint8   index into DAY_TYPES ('W', 'A', 'U')
+    riders    int32   Num_Riders
+
+The columns are saved as .npy files in a directory next to the database
+(e.g. CTA2_L_daily_ridership.columns/) along with the content version of the
+database, and memory-mapped on later runs. If the database changes, they are
+rebuilt; each file is written under a temporary name and renamed into place,
+the version last, so a partly written file is never memory-mapped. Because
+the rows are sorted, each station is one contiguous slice and the groupbys
+the commands need are np.bincount / np.add.reduceat calls.
+
+NumPy is optional and imported by available() on first use, so runs on the
+SQLite engine never load it: if it is not installed, available() is False
+and the commands use SQLite as usual. The engine is switched on with
+"python main.py --engine numpy".
+"""
+
+import datetime
+import os
+import threading
+
+import database
+import sql
+
+
+DAY_TYPES = "WAU" #weekday, Saturday, Sunday/holiday
+COLUMNS = ("station", "day", "day_type", "riders")
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+FETCH_ROWS = 100000
+
+enabled = False #set by main.py when the NumPy engine is selected
+np = None #the numpy module, imported by available() so the SQLite engine never loads it
+numpy_missing = False #True once importing NumPy has failed
+
+
+def available():
+    """
+    This function checks if the NumPy engine can be used, importing NumPy the
+    first time, so commands on the SQLite engine don't pay for the import.
+
+    Returns:
+        True if NumPy is installed
+        False otherwise
+    """
+    global np, numpy_missing
+    if(np == None and not numpy_missing):
+        try:
+            import numpy
+            np = numpy
+        except ImportError: #the SQLite engine still works without NumPy
+            numpy_missing = True
+    return np != None
+
+def day_number(date_text):
+    """
+    This function converts a YYYY-MM-DD date into a day number.
+
+    Args:
+        date_text: the date (anything after the first 10 characters is ignored)
+
+    Returns:
+        The number of days since 1970-01-01
+    """
+    return datetime.date.fromisoformat(date_text[:10]).toordinal() - EPOCH_ORDINAL
+
+def day_range(range_start, range_end):
+    """
+    This function converts a half-open date range into a half-open range of day numbers.
+
+    Args:
+        range_start: the first day (YYYY-MM-DD), "" for an empty range
+        range_end: the day after the last day (YYYY-MM-DD), "" for an empty range
+
+    Returns:
+        A (first day number, last day number + 1) tuple
+    """
+    if(range_start == "" or range_end == ""):
+        return (0, 0)
+    return (day_number(range_start), day_number(range_end))
+
+def columns_path(dbConn):
+    """
+    This function builds the path of the directory holding the column files.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The path of the directory, "" if the database is not a file
+    """
+    path = database.database_path(dbConn)
+    if(path == ""):
+        return ""
+    return os.path.splitext(path)[0] + ".columns"
+
+def group_sum(keys, values):
+    """
+    This function sums the values for each run of equal keys.
+
+    Args:
+        keys: a sorted array of keys
+        values: an array of values, the same length as keys
+
+    Returns:
+        A tuple with the array of distinct keys and the array of their sums
+    """
+    if(len(keys) == 0):
+        return (keys[:0], np.zeros(0, dtype=np.int64))
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return (keys[starts], np.add.reduceat(values.astype(np.int64), starts))
+
+
+class ridership_columns:
+    """
+    The Ridership table as sorted NumPy columns.
+    """
+    def __init__(self, station, day, day_type, riders):
+        self.station = station
+        self.day = day
+        self.day_type = day_type
+        self.riders = riders
+
+        #each station is one slice of the sorted columns
+        self.station_ids, self.starts = np.unique(self.station, return_index=True)
+        self.ends = np.r_[self.starts[1:], len(self.station)].astype(np.int64)
+
+        self.prefix = None #running totals, computed by range_totals() on first use
+
+    def __len__(self):
+        return len(self.station)
+
+    def station_slice(self, station_id):
+        """
+        This function finds the rows of one station.
+
+        Args:
+            station_id: the Station_ID
+
+        Returns:
+            A slice of the columns, empty if the station has no ridership
+        """
+        number = np.searchsorted(self.station_ids, station_id)
+        if(number == len(self.station_ids) or self.station_ids[number] != station_id):
+            return slice(0, 0)
+        return slice(int(self.starts[number]), int(self.ends[number]))
+
+    def range_slice(self, station_id, first_day, end_day):
+        """
+        This function finds the rows of one station within a range of days.
+
+        Args:
+            station_id: the Station_ID
+            first_day: the first day number
+            end_day: the day number after the last day
+
+        Returns:
+            A slice of the columns
+        """
+        rows = self.station_slice(station_id)
+        days = self.day[rows]
+        start = rows.start + int(np.searchsorted(days, first_day, side="left"))
+        end = rows.start + int(np.searchsorted(days, end_day, side="left"))
+        return slice(start, max(start, end))
+
+    def day_type_totals(self, station_id):
+        """
+        This function sums the ridership of a station by type of day (command 2).
+
+        Args:
+            station_id: the Station_ID
+
+        Returns:
+            A dictionary mapping 'W', 'A' and 'U' to the number of riders,
+            empty if the station has no ridership
+        """
+        rows = self.station_slice(station_id)
+        if(rows.stop == rows.start):
+            return {}
+        totals = np.bincount(self.day_type[rows], weights=self.riders[rows], minlength=len(DAY_TYPES))
+        return {DAY_TYPES[number]: int(totals[number]) for number in range(len(DAY_TYPES))}
+
+    def station_totals(self, day_type=None):
+        """
+        This function sums the ridership of every station, optionally for one type of day (command 3).
+
+        Args:
+            day_type: 'W', 'A' or 'U', or None for every day
+
+        Returns:
+            A list of (Station_ID, number of riders) tuples, leaving out the stations
+            with no days of that type (as the SQL queries do)
+        """
+        if(len(self.station) == 0):
+            return []
+        if(day_type == None):
+            return list(zip(self.station_ids.tolist(), np.add.reduceat(self.riders.astype(np.int64), self.starts).tolist()))
+        matches = self.day_type == DAY_TYPES.index(day_type)
+        totals = np.add.reduceat(np.where(matches, self.riders, 0).astype(np.int64), self.starts)
+        has_days = np.add.reduceat(matches.astype(np.int64), self.starts) > 0
+        return list(zip(self.station_ids[has_days].tolist(), totals[has_days].tolist()))
+
+    def range_totals(self, station_id, first_day, end_day):
+        """
+        This function sums the ridership of a station by type of day within a range of days,
+        as the difference of two running totals (prefix sums over the sorted columns).
+
+        Args:
+            station_id: the Station_ID
+            first_day: the first day number
+            end_day: the day number after the last day
+
+        Returns:
+            A dictionary mapping 'W', 'A' and 'U' to a (number of riders, number of days) tuple
+        """
+        if(self.prefix is None): #arrays, so not == None
+            riders = np.zeros((len(self.station) + 1, len(DAY_TYPES)), dtype=np.int64)
+            days = np.zeros((len(self.station) + 1, len(DAY_TYPES)), dtype=np.int64)
+            for number in range(len(DAY_TYPES)):
+                of_type = self.day_type == number
+                np.cumsum(np.where(of_type, self.riders, 0), out=riders[1:, number])
+                np.cumsum(of_type, out=days[1:, number])
+            self.prefix = (riders, days)
+
+        riders, days = self.prefix
+        rows = self.range_slice(station_id, first_day, end_day)
+        return {DAY_TYPES[number]: (int(riders[rows.stop, number] - riders[rows.start, number]),
+                                    int(days[rows.stop, number] - days[rows.start, number]))
+                for number in range(len(DAY_TYPES))}
+
+    def yearly(self, station_id):
+        """
+        This function sums the ridership of a station by year (command 6).
+
+        Args:
+            station_id: the Station_ID
+
+        Returns:
+            A list of (year, number of riders) tuples sorted by year
+        """
+        rows = self.station_slice(station_id)
+        years = self.day[rows].astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970
+        years, totals = group_sum(years, self.riders[rows])
+        return [(f"{year:04d}", total) for year, total in zip(years.tolist(), totals.tolist())]
+
+    def monthly(self, station_id, first_day, end_day):
+        """
+        This function sums the ridership of a station by month within a range of days (command 7).
+
+        Args:
+            station_id: the Station_ID
+            first_day: the first day number
+            end_day: the day number after the last day
+
+        Returns:
+            A list of ("MM/YYYY", number of riders) tuples sorted by month
+        """
+        rows = self.range_slice(station_id, first_day, end_day)
+        months = self.day[rows].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        months, totals = group_sum(months, self.riders[rows])
+        return [(f"{month % 12 + 1:02d}/{month // 12 + 1970:04d}", total)
+                for month, total in zip(months.tolist(), totals.tolist())]
+
+    def daily(self, station_id, first_day, end_day):
+        """
+        This function finds the daily ridership of a station within a range of days (command 8).
+
+        Args:
+            station_id: the Station_ID
+            first_day: the first day number
+            end_day: the day number after the last day
+
+        Returns:
+            A list of ("YYYY-MM-DD", number of riders) tuples sorted by day
+        """
+        rows = self.range_slice(station_id, first_day, end_day)
+        days, totals = group_sum(self.day[rows], self.riders[rows])
+        dates = days.astype("datetime64[D]").astype(str)
+        return list(zip(dates.tolist(), totals.tolist()))
+
+
+def build_columns(dbConn):
+    """
+    This function reads Ridership into NumPy columns, sorted by station and day.
+    The rows are fetched in chunks so the table is never held as Python tuples.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A tuple with the station, day, day_type and riders arrays
+    """
+    count = sql.execute(dbConn, "ridership_count").fetchone()[0]
+
+    station = np.empty(count, dtype=np.int32)
+    day = np.empty(count, dtype=np.int32)
+    day_type = np.empty(count, dtype=np.uint8)
+    riders = np.empty(count, dtype=np.int32)
+
+    dbCursor = sql.execute(dbConn, "ridership_columns", [DAY_TYPES])
+
+    filled = 0
+    while True:
+        rows = dbCursor.fetchmany(FETCH_ROWS)
+        if(len(rows) == 0):
+            break
+        chunk = np.array(rows, dtype=np.int64)
+        end = filled + len(rows)
+        station[filled:end] = chunk[:, 0]
+        day[filled:end] = chunk[:, 1]
+        day_type[filled:end] = chunk[:, 2]
+        riders[filled:end] = chunk[:, 3]
+        filled = end
+
+    return (station[:filled], day[:filled], day_type[:filled], riders[:filled])
+
+def replace_file(path, write):
+    """
+    This function writes a file under a temporary name in the same directory and
+    then renames it over path, so a file that is being written is never seen (or
+    memory-mapped) under its real name, even if two processes rebuild at once or
+    the rebuild is killed partway.
+
+    Args:
+        path: the path of the file
+        write: a function called with the open (binary) temporary file
+
+    Returns:
+        Nothing
+    """
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp" #one name per writer
+    try:
+        with open(temp_path, "wb") as file:
+            write(file)
+        os.replace(temp_path, path)
+    except BaseException: #leave no temporary file behind
+        if(os.path.exists(temp_path)):
+            os.remove(temp_path)
+        raise
+
+def load_columns(dbConn):
+    """
+    This function memory-maps the saved column files, rebuilding and saving them
+    first if they are missing or were built from different data.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The ridership_columns
+    """
+    available() #imports NumPy
+    version = database.content_version(dbConn)
+    directory = columns_path(dbConn)
+    if(directory == ""): #in-memory database, nothing to save
+        return ridership_columns(*build_columns(dbConn))
+
+    version_file = os.path.join(directory, "version.txt")
+    saved_version = None
+    if(os.path.exists(version_file)):
+        with open(version_file) as file:
+            saved_version = file.read().strip()
+
+    if(saved_version != version):
+        arrays = build_columns(dbConn)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            for name, array in zip(COLUMNS, arrays):
+                replace_file(os.path.join(directory, name + ".npy"), lambda file: np.save(file, array))
+            #the version goes in last, once every column file is complete
+            replace_file(version_file, lambda file: file.write(version.encode()))
+        except OSError: #e.g. a read-only directory, use the arrays in memory
+            return ridership_columns(*arrays)
+
+    arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode="r") for name in COLUMNS]
+    return ridership_columns(*arrays)
+
+def get_columns(dbConn):
+    """
+    This function returns the columnar store for the session if the NumPy engine
+    is enabled, loading it on first use.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The ridership_columns, or None if the commands should use SQLite
+    """
+    if(not enabled or not available()):
+        return None
+    return database.session_cached(dbConn, "ridership_columns", load_columns)
@@ -0,0 +1,28 @@
+"""
+Fixtures shared by the tests.
+"""
+
+import shutil
+
+import pytest
+
+import synthetic
+
+
+@pytest.fixture(scope="session")
+def synthetic_template(tmp_path_factory):
+    """
+    A small synthetic database (12 stations, one year), generated once per test run.
+    """
+    db_file = str(tmp_path_factory.mktemp("template") / "template.db")
+    synthetic.generate_database(db_file, num_stations=12, first_year=2020, last_year=2020)
+    return db_file
+
+@pytest.fixture
+def db_file(synthetic_template, tmp_path):
+    """
+    A copy of the synthetic database that the test can change, with nothing built next to it yet.
+    """
+    db_file = str(tmp_path / "test.db")
+    shutil.copyfile(synthetic_template, db_file)
+    return db_file
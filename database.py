@@ -0,0 +1,302 @@
+"""
+Helpers for working with the CTA database file itself.
+
+These functions find out where the database lives on disk, compute a cheap
+"content version" that changes whenever the data changes, attach the
+sidecar database that holds the derived tables (rollups, cached statistics),
+and keep in-memory structures built from the database for the whole session.
+
+They also open tuned read-only connections and pool them, with a thread pool
+to run independent queries at the same time (sqlite3 releases the GIL while
+a query runs, so the queries really do run in parallel).
+"""
+
+import concurrent.futures
+import os
+import pathlib
+import queue
+import sqlite3
+
+import sql
+
+
+SIDECAR_SCHEMA = "rollup"
+FETCH_ROWS = 10000 #rows fetched at a time when streaming results
+
+session_cache = {} #(database, name) -> (content version, cached object)
+connection_factory = sqlite3.Connection #profiler.profiled_connection in --profile mode
+
+#PRAGMAs for read-only connections: memory-map the file, a 64 MiB page cache,
+#and temporary b-trees (GROUP BY, ORDER BY) in memory
+READONLY_PRAGMAS = [
+    "PRAGMA mmap_size = 268435456;",
+    "PRAGMA cache_size = -65536;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA query_only = ON;",
+]
+
+
+def database_path(dbConn):
+    """
+    This function finds the file path of the main database for the connection.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The absolute path of the database file
+        "" if the database is in memory or temporary
+    """
+    for row in dbConn.execute("PRAGMA database_list;"):
+        if(row[1] == "main"):
+            return row[2] or ""
+    return ""
+
+def sidecar_path(dbConn):
+    """
+    This function builds the file path of the sidecar database for the connection.
+    The sidecar sits next to the main database (e.g. CTA2_L_daily_ridership.rollups.db).
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The path of the sidecar database file
+        "" if the main database is not a file
+    """
+    path = database_path(dbConn)
+    if(path == ""):
+        return ""
+    root, ext = os.path.splitext(path)
+    return f"{root}.rollups{ext or '.db'}"
+
+def sidecar_attached(dbConn):
+    """
+    This function checks if the sidecar database is attached to the connection.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        True if the sidecar schema is attached
+        False otherwise
+    """
+    for row in dbConn.execute("PRAGMA database_list;"):
+        if(row[1] == SIDECAR_SCHEMA):
+            return True
+    return False
+
+def attach_sidecar(dbConn, create=False):
+    """
+    This function attaches the sidecar database to the connection as the "rollup" schema.
+    On a read-only connection (see connect_readonly) the sidecar is attached read-only
+    and never created.
+
+    Args:
+        dbConn: connection to the CTA database
+        create: create the sidecar file if it does not exist yet
+
+    Returns:
+        True if the sidecar is attached
+        False if there is no sidecar (or it could not be opened)
+    """
+    if(sidecar_attached(dbConn)):
+        return True
+
+    path = sidecar_path(dbConn)
+    if(path == ""):
+        return False
+
+    readonly = dbConn.execute("PRAGMA query_only;").fetchone()[0] == 1
+    if((readonly or not create) and not os.path.exists(path)):
+        return False
+    if(readonly):
+        path = pathlib.Path(path).resolve().as_uri() + "?mode=ro"
+
+    try:
+        sql.execute(dbConn, "attach_sidecar", [path])
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+def content_version(dbConn):
+    """
+    This function computes a version string for the data in the database.
+    It combines the size and modification time of the database file (and its
+    write-ahead log, if any) with the highest rowid in Ridership, so it changes
+    whenever rows are added or the file is rewritten. It only costs a couple of
+    stat calls and one index lookup.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The content version as a string
+    """
+    parts = []
+    path = database_path(dbConn)
+    for file in (path, path + "-wal"):
+        if(path != "" and os.path.exists(file)):
+            stat = os.stat(file)
+            parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+
+    try:
+        row = sql.execute(dbConn, "last_rowid").fetchone()
+        parts.append(str(row[0]))
+    except sqlite3.OperationalError: #e.g. a WITHOUT ROWID table
+        pass
+
+    return "/".join(parts)
+
+def session_cached(dbConn, name, build):
+    """
+    This function returns an in-memory structure built from the database, building
+    it on first use and reusing it for the rest of the session. It is rebuilt if
+    the content version of the database changes.
+
+    Args:
+        dbConn: connection to the CTA database
+        name: the name of the structure (e.g. "stop_index")
+        build: a function taking dbConn that builds the structure
+
+    Returns:
+        The cached structure
+    """
+    path = database_path(dbConn)
+    key = (path if path != "" else id(dbConn), name)
+    version = content_version(dbConn)
+
+    cached = session_cache.get(key)
+    if(cached != None and cached[0] == version):
+        return cached[1]
+
+    value = build(dbConn)
+    session_cache[key] = (version, value)
+    return value
+
+def stream_rows(dbCursor, size=FETCH_ROWS):
+    """
+    This function yields the rows of an executed query a chunk at a time with
+    fetchmany, so the full result is never held in memory.
+
+    Args:
+        dbCursor: a cursor that has executed a query
+        size: the number of rows to fetch at a time
+
+    Returns:
+        A generator of rows
+    """
+    while True:
+        rows = dbCursor.fetchmany(size)
+        if(len(rows) == 0):
+            return
+        yield from rows
+
+def connect_readonly(db_file, immutable=False):
+    """
+    This function opens a read-only connection to the CTA database with the
+    READONLY_PRAGMAS applied and the sidecar attached (if there is one).
+    The connection may be used from any thread, one thread at a time.
+
+    Args:
+        db_file: the path of the CTA database
+        immutable: promise SQLite the file will not change while it is open,
+                   which skips all locking (only safe if nothing writes to it)
+
+    Returns:
+        The connection
+
+    Raises:
+        sqlite3.OperationalError if the database file does not exist
+    """
+    uri = pathlib.Path(db_file).resolve().as_uri() + "?mode=ro" #pathlib is cheaper to import than urllib.request
+    if(immutable):
+        uri += "&immutable=1"
+    dbConn = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=connection_factory,
+                             cached_statements=sql.CACHED_STATEMENTS)
+    for pragma in READONLY_PRAGMAS:
+        dbConn.execute(pragma)
+    attach_sidecar(dbConn)
+    return dbConn
+
+
+class connection_pool:
+    """
+    A fixed set of read-only connections to one database, and a thread pool
+    that runs queries on them.
+    """
+    def __init__(self, db_file, size=os.cpu_count() or 4, immutable=False):
+        self.size = size
+        self.idle = queue.Queue()
+        self.connections = []
+        for number in range(size):
+            dbConn = connect_readonly(db_file, immutable)
+            self.connections.append(dbConn)
+            self.idle.put(dbConn)
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=size)
+
+    def acquire(self):
+        """
+        This function takes a connection from the pool, waiting for one to be free.
+
+        Returns:
+            A connection, which must be given back with release()
+        """
+        return self.idle.get()
+
+    def release(self, dbConn):
+        """
+        This function gives a connection back to the pool.
+
+        Args:
+            dbConn: a connection from acquire()
+        """
+        self.idle.put(dbConn)
+
+    def run(self, task):
+        """
+        This function runs a task on a pooled connection in the calling thread.
+
+        Args:
+            task: a function taking a connection
+
+        Returns:
+            What the task returns
+        """
+        dbConn = self.acquire()
+        try:
+            return task(dbConn)
+        finally:
+            self.release(dbConn)
+
+    def submit(self, task):
+        """
+        This function runs a task on a pooled connection in the thread pool.
+
+        Args:
+            task: a function taking a connection
+
+        Returns:
+            A concurrent.futures.Future for what the task returns
+        """
+        return self.executor.submit(self.run, task)
+
+    def run_parallel(self, tasks):
+        """
+        This function runs independent tasks at the same time, each on its own connection.
+
+        Args:
+            tasks: a list of functions taking a connection
+
+        Returns:
+            A list of what each task returned, in the same order
+        """
+        return list(self.executor.map(self.run, tasks))
+
+    def close(self):
+        """
+        This function stops the thread pool and closes the connections.
+        """
+        self.executor.shutdown()
+        for dbConn in self.connections:
+            dbConn.close()
@@ -0,0 +1,129 @@
+"""
+Streaming export of ridership time series.
+
+export_series() writes the ridership of some or all stations, at daily,
+monthly, yearly or day-type granularity and optionally within a date range,
+to CSV or JSON Lines. The rows are streamed from SQLite with fetchmany and
+written as they arrive, so memory use does not depend on how much history
+is exported. Monthly, yearly and day-type series over the full history come
+from the rollups when they are current.
+"""
+
+import csv
+import json
+import sys
+
+import database
+import rollups
+import sql
+import stations
+
+
+GRANULARITIES = ("daily", "monthly", "yearly", "daytype")
+FORMATS = ("csv", "jsonl")
+
+HEADERS = {
+    "daily": ["Station_ID", "Station_Name", "Date", "Type_of_Day", "Num_Riders"],
+    "monthly": ["Station_ID", "Station_Name", "Month", "Num_Riders"],
+    "yearly": ["Station_ID", "Station_Name", "Year", "Num_Riders"],
+    "daytype": ["Station_ID", "Station_Name", "Type_of_Day", "Num_Riders"],
+}
+
+
+def series_query(dbConn, granularity, station_ids=None, date_range=None):
+    """
+    This function picks the statement (see sql.py) for a ridership series.
+
+    Args:
+        dbConn: connection to the CTA database
+        granularity: "daily", "monthly", "yearly" or "daytype"
+        station_ids: a list of Station_IDs, or None for every station
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+
+    Returns:
+        A tuple with the statement name and its parameters. The statement returns
+        Station_ID, the period (and Type_of_Day for daily series) and the number of riders
+    """
+    parameters = []
+
+    #the rollups cover the full history, so they can't answer a date range
+    rollup = granularity != "daily" and date_range == None and rollups.rollups_current(dbConn)
+    if(date_range != None):
+        parameters.extend(date_range)
+    if(station_ids != None):
+        parameters.extend(station_ids)
+
+    name = sql.series_name(granularity, rollup, date_range != None, station_ids != None)
+    return (name, parameters)
+
+def series_rows(dbConn, granularity, station_ids=None, date_range=None):
+    """
+    This function streams a ridership series, adding the station name to each row.
+
+    Args:
+        dbConn: connection to the CTA database
+        granularity: "daily", "monthly", "yearly" or "daytype"
+        station_ids: a list of Station_IDs, or None for every station
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+
+    Returns:
+        A generator of rows matching HEADERS[granularity]
+    """
+    resolver = stations.get_station_resolver(dbConn)
+    name, parameters = series_query(dbConn, granularity, station_ids, date_range)
+
+    dbCursor = sql.execute(dbConn, name, parameters, None if station_ids == None else len(station_ids))
+    for row in database.stream_rows(dbCursor):
+        yield (row[0], resolver.name(row[0]), *row[1:])
+
+def write_rows(output, header, rows, file_format="csv"):
+    """
+    This function writes rows to a CSV or JSON Lines file as they arrive.
+
+    Args:
+        output: the path of the output file, or - for stdout
+        header: the column names
+        rows: an iterable of rows matching the header
+        file_format: "csv" or "jsonl"
+
+    Returns:
+        The number of rows written
+    """
+    if(output == "-"):
+        file = sys.stdout
+    else:
+        file = open(output, "w", newline="")
+
+    count = 0
+    try:
+        if(file_format == "csv"):
+            writer = csv.writer(file)
+            writer.writerow(header)
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                file.write(json.dumps(dict(zip(header, row))) + "\n")
+                count += 1
+    finally:
+        if(file is not sys.stdout):
+            file.close()
+    return count
+
+def export_series(dbConn, output, granularity="daily", station_ids=None, date_range=None, file_format="csv"):
+    """
+    This function writes a ridership series to a CSV or JSON Lines file.
+
+    Args:
+        dbConn: connection to the CTA database
+        output: the path of the output file, or - for stdout
+        granularity: "daily", "monthly", "yearly" or "daytype"
+        station_ids: a list of Station_IDs, or None for every station
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+        file_format: "csv" or "jsonl"
+
+    Returns:
+        The number of rows written
+    """
+    return write_rows(output, HEADERS[granularity], series_rows(dbConn, granularity, station_ids, date_range), file_format)
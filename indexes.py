@@ -0,0 +1,159 @@
+"""
+Index provisioning and query plan diagnostics for the CTA database.
+
+ensure_indexes() inspects the schema and creates the covering indexes that the
+commands in main.py need, skipping any index whose columns are already covered
+by an existing index (including primary keys). print_query_plans() runs
+EXPLAIN QUERY PLAN over the queries the commands issue and reports any that
+still do a full table scan.
+
+To create the indexes and print the diagnostics by hand:
+
+    python main.py maintain
+    python main.py explain
+"""
+
+import sqlite3
+
+import sql
+
+
+#
+# (index name, table, columns) for every index the commands rely on.
+# The Ridership indexes carry Num_Riders so the sums never touch the table.
+#
+INDEXES = [
+    ("idx_ridership_station_date", "Ridership", ("Station_ID", "Ride_Date", "Type_of_Day", "Num_Riders")),
+    ("idx_ridership_daytype_station", "Ridership", ("Type_of_Day", "Station_ID", "Num_Riders")),
+    ("idx_ridership_date", "Ridership", ("Ride_Date",)),
+    ("idx_stops_station", "Stops", ("Station_ID",)),
+]
+
+#
+# (command, statement name in sql.py, sample parameters, IN list length) for
+# the queries the commands run against the raw tables.
+#
+COMMAND_QUERIES = [
+    ("2 week stats", "day_types", [0], None),
+    ("3 weekday ridership / rank", "ranking_range", ["W", "2020-01-01", "2020-02-01", -1], 1),
+    ("6 yearly ridership", "yearly", [0], None),
+    ("range totals", "range_totals", [0, "2020-01-01", "2020-02-01"], None),
+    ("7 monthly ridership", "monthly", [0, "2020-01-01", "2021-01-01"], None),
+    ("8 compare stations", "daily", [0, 1, "2020-01-01", "2021-01-01"], 2),
+    ("6 yearly pivot", "yearly_pivot", [0, 1], 2),
+    ("7 monthly pivot", "monthly_pivot", [0, 1, "2020-01-01", "2021-01-01"], 2),
+]
+
+
+def existing_indexes(dbConn, table):
+    """
+    This function finds the columns of every index on the given table.
+
+    Args:
+        dbConn: connection to the CTA database
+        table: the name of the table
+
+    Returns:
+        A list of column tuples, one per index
+    """
+    columns = []
+    for index in sql.execute(dbConn, "index_list", [table]).fetchall():
+        info = sql.execute(dbConn, "index_columns", [index[0]]).fetchall()
+        columns.append(tuple(row[0] for row in info))
+    return columns
+
+def missing_indexes(dbConn):
+    """
+    This function checks which of the indexes the commands need are missing.
+    An index counts as present if some existing index starts with the same columns.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A list of (index name, table, columns) for the missing indexes
+    """
+    missing = []
+    for name, table, columns in INDEXES:
+        found = False
+        for existing in existing_indexes(dbConn, table):
+            if(existing[:len(columns)] == columns):
+                found = True
+                break
+        if(not found):
+            missing.append((name, table, columns))
+    return missing
+
+def ensure_indexes(dbConn):
+    """
+    This function creates any of the indexes the commands need that are missing.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A list of the names of the indexes that were created
+
+    Raises:
+        sqlite3.OperationalError if the database is read-only
+    """
+    created = []
+    missing = missing_indexes(dbConn)
+    if(len(missing) == 0):
+        return created
+
+    with dbConn:
+        for name, table, columns in missing:
+            dbConn.execute(f"Create Index If Not Exists {name} On {table} ({', '.join(columns)});")
+            created.append(name)
+    dbConn.execute("PRAGMA optimize;") #refresh the planner statistics for the new indexes
+    return created
+
+def full_scans(dbConn, sql_query, parameters):
+    """
+    This function finds the tables a query reads with a full table scan.
+
+    Args:
+        dbConn: connection to the CTA database
+        sql_query: the query to check
+        parameters: sample parameters for the query
+
+    Returns:
+        A list of the EXPLAIN QUERY PLAN lines that are full table scans
+    """
+    scans = []
+    for row in dbConn.execute("Explain Query Plan " + sql_query, parameters).fetchall():
+        detail = row[-1]
+        #"SCAN Ridership" is a full scan, "SCAN Ridership USING COVERING INDEX ..." is not,
+        #and "SCAN (subquery-1)" reads an already grouped result rather than a table
+        if(detail.startswith("SCAN ") and not detail.startswith("SCAN (") and "USING" not in detail):
+            scans.append(detail)
+    return scans
+
+def print_query_plans(dbConn, queries=COMMAND_QUERIES):
+    """
+    This function prints a report of the queries that still do full table scans.
+
+    Args:
+        dbConn: connection to the CTA database
+        queries: a list of (command, statement name, sample parameters, IN list length)
+
+    Returns:
+        The number of queries that do a full table scan
+    """
+    print("Query Plan Diagnostics")
+    count = 0
+    for command, name, parameters, placeholders in queries:
+        try:
+            scans = full_scans(dbConn, sql.text(name, placeholders), parameters)
+        except sqlite3.OperationalError as error: #e.g. a table missing from this database
+            print(f"  {command} : error ({error})")
+            continue
+        if(len(scans) == 0):
+            print(f"  {command} : ok")
+        else:
+            count += 1
+            print(f"  {command} : full scan ({'; '.join(scans)})")
+    print() # new line
+    return count
+
@@ -0,0 +1,270 @@
+"""
+Bulk loading of new daily ridership.
+
+"python main.py ingest FILE..." appends daily ridership from CSV files to
+the Ridership table. Two layouts are read, told apart by the header row:
+
+    station_id, stationname, date, daytype, rides      (the CTA open data export)
+    Station_ID, Station_Name, Date, Type_of_Day, Num_Riders   (export.py daily)
+
+Dates may be YYYY-MM-DD or MM/DD/YYYY. They are stored in the same format
+as the rows already in Ridership.
+
+The rows are loaded into a temporary staging table with batched
+executemany calls. The staging table is keyed on (Station_ID, Ride_Date),
+so a day repeated in the input keeps its last row. Days already in
+Ridership are skipped, or replaced with --replace. Stations that are new to
+the database are added to Stations. All of this happens in one transaction
+with the database in WAL mode and synchronous = NORMAL. The original
+journal mode is put back afterwards.
+
+If the rollups were current before the load, they are brought up to date
+from the staged rows alone. Station_Month gets the changes added in place,
+and the coarser rollups are re-derived only for the stations that changed.
+The running totals of the prefix-sum index are re-derived only from each
+changed station's first changed day on, so appending new days touches just
+the new rows.
+The general statistics are then recomputed from the rollups. Ridership is
+never rescanned.
+"""
+
+import csv
+import datetime
+
+import database
+import rollups
+import sql
+
+
+BATCH_ROWS = 50000 #rows per executemany
+DEFAULT_DATE_SUFFIX = "T00:00:00.000" #time part of Ride_Date when Ridership is empty
+
+#header name (lower case) -> staging column
+COLUMN_NAMES = {
+    "station_id": "Station_ID",
+    "stationname": "Station_Name",
+    "station_name": "Station_Name",
+    "date": "Ride_Date",
+    "ride_date": "Ride_Date",
+    "daytype": "Type_of_Day",
+    "type_of_day": "Type_of_Day",
+    "rides": "Num_Riders",
+    "num_riders": "Num_Riders",
+}
+
+STAGING_SQL = """
+CREATE TEMP TABLE IF NOT EXISTS Staging(
+    Station_ID INTEGER,
+    Ride_Date TEXT,
+    Type_of_Day TEXT,
+    Num_Riders INTEGER,
+    Station_Name TEXT,
+    PRIMARY KEY (Station_ID, Ride_Date)
+);
+CREATE TEMP TABLE IF NOT EXISTS Replaced(
+    Station_ID INTEGER,
+    Ride_Date TEXT,
+    Type_of_Day TEXT,
+    Num_Riders INTEGER
+);
+DELETE FROM temp.Staging;
+DELETE FROM temp.Replaced;
+"""
+
+
+def parse_date(text, suffix):
+    """
+    This function converts a date from the input into the Ride_Date format of the database.
+
+    Args:
+        text: YYYY-MM-DD (anything after is ignored) or MM/DD/YYYY
+        suffix: the time part stored after the date (e.g. T00:00:00.000)
+
+    Returns:
+        The Ride_Date
+
+    Raises:
+        ValueError if the date is not valid
+    """
+    text = text.strip()
+    if("/" in text):
+        day = datetime.datetime.strptime(text.split()[0], "%m/%d/%Y").date()
+    else:
+        day = datetime.date.fromisoformat(text[:10])
+    return day.isoformat() + suffix
+
+def read_rows(csv_file, suffix):
+    """
+    This function reads the ridership rows of a CSV file.
+
+    Args:
+        csv_file: the path of the file
+        suffix: the time part stored after the date
+
+    Returns:
+        A generator of (Station_ID, Ride_Date, Type_of_Day, Num_Riders, Station_Name) tuples,
+        or None for a row that could not be read
+    """
+    with open(csv_file, newline="") as file:
+        reader = csv.reader(file)
+        header = [COLUMN_NAMES.get(name.strip().lower()) for name in next(reader, [])]
+        missing = {"Station_ID", "Ride_Date", "Type_of_Day", "Num_Riders"} - set(header)
+        if(len(missing) > 0):
+            raise ValueError(f"{csv_file} has no {', '.join(sorted(missing))} column")
+        positions = {name: number for number, name in enumerate(header) if name != None}
+
+        for fields in reader:
+            try:
+                day_type = fields[positions["Type_of_Day"]].strip().upper()
+                if(day_type not in ("W", "A", "U")):
+                    raise ValueError(day_type)
+                station_name = ""
+                if("Station_Name" in positions):
+                    station_name = fields[positions["Station_Name"]].strip()
+                yield (int(fields[positions["Station_ID"]]),
+                       parse_date(fields[positions["Ride_Date"]], suffix),
+                       day_type,
+                       int(fields[positions["Num_Riders"]].replace(",", "")),
+                       station_name)
+            except (IndexError, ValueError):
+                yield None
+
+def date_suffix(dbConn):
+    """
+    This function finds the time part the database stores after each Ride_Date.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The suffix (e.g. T00:00:00.000)
+    """
+    row = sql.execute(dbConn, "sample_date").fetchone()
+    if(row == None):
+        return DEFAULT_DATE_SUFFIX
+    return row[0][10:]
+
+def stage_rows(dbConn, rows):
+    """
+    This function loads rows into the staging table in batches.
+
+    Args:
+        dbConn: connection to the CTA database
+        rows: an iterable of rows from read_rows()
+
+    Returns:
+        A tuple with the number of rows read and the number that could not be read
+    """
+    read = 0
+    invalid = 0
+    batch = []
+    for row in rows:
+        read += 1
+        if(row == None):
+            invalid += 1
+            continue
+        batch.append(row)
+        if(len(batch) == BATCH_ROWS):
+            sql.executemany(dbConn, "stage_row", batch)
+            batch = []
+    if(len(batch) > 0):
+        sql.executemany(dbConn, "stage_row", batch)
+    return (read, invalid)
+
+def update_rollups(dbConn):
+    """
+    This function brings the rollups up to date with the staged rows (and the
+    replaced rows), re-deriving the coarser rollups only for the stations that changed.
+    The caller is responsible for committing.
+
+    Args:
+        dbConn: connection to the CTA database
+    """
+    sql.execute(dbConn, "subtract_replaced_months")
+    sql.execute(dbConn, "add_staged_months")
+    sql.execute(dbConn, "drop_empty_months")
+
+    sql.execute(dbConn, "clear_changed_years")
+    sql.execute(dbConn, "derive_changed_years")
+    sql.execute(dbConn, "clear_changed_daytypes")
+    sql.execute(dbConn, "derive_changed_daytypes")
+    sql.execute(dbConn, "clear_totals")
+    sql.execute(dbConn, "build_totals")
+
+def update_cumulative(dbConn):
+    """
+    This function brings the prefix-sum index up to date with the staged rows (and the
+    replaced rows): the running totals of each changed station are re-derived from its
+    first changed day on, starting from its last running total before that day.
+    The caller is responsible for committing.
+
+    Args:
+        dbConn: connection to the CTA database
+    """
+    sql.execute(dbConn, "clear_changed_cumulative")
+    sql.execute(dbConn, "derive_changed_cumulative")
+
+def ingest_files(dbConn, csv_files, replace=False):
+    """
+    This function loads daily ridership from CSV files into the database.
+
+    Args:
+        dbConn: connection to the CTA database (not read-only)
+        csv_files: a list of paths of CSV files
+        replace: replace the ridership of days already in the database instead of skipping them
+
+    Returns:
+        A dictionary with the number of rows read, invalid, inserted, skipped
+        (already in the database) and replaced, and the number of new stations
+
+    Raises:
+        ValueError if a file does not have the needed columns
+        sqlite3.OperationalError if the database cannot be written
+    """
+    incremental = rollups.rollups_current(dbConn) #only update the rollups in place if they matched the data
+    cumulative = incremental and rollups.cumulative_current(dbConn)
+    suffix = date_suffix(dbConn)
+    counts = {"read": 0, "invalid": 0, "inserted": 0, "skipped": 0, "replaced": 0, "stations": 0}
+
+    journal_mode = dbConn.execute("PRAGMA main.journal_mode;").fetchone()[0]
+    dbConn.execute("PRAGMA main.journal_mode = WAL;")
+    dbConn.execute("PRAGMA main.synchronous = NORMAL;")
+    dbConn.executescript(STAGING_SQL)
+
+    try:
+        with dbConn:
+            for csv_file in csv_files:
+                read, invalid = stage_rows(dbConn, read_rows(csv_file, suffix))
+                counts["read"] += read
+                counts["invalid"] += invalid
+
+            counts["stations"] = sql.execute(dbConn, "add_new_stations").rowcount
+
+            if(replace):
+                sql.execute(dbConn, "save_replaced_days")
+                counts["replaced"] = sql.execute(dbConn, "delete_replaced_days").rowcount
+            else:
+                counts["skipped"] = sql.execute(dbConn, "skip_existing_days").rowcount
+
+            counts["inserted"] = sql.execute(dbConn, "insert_staged_days").rowcount
+
+            if(incremental):
+                update_rollups(dbConn)
+            if(cumulative):
+                update_cumulative(dbConn)
+    finally:
+        #fold the log back into the file, so the content version stays put once the load is done
+        dbConn.execute("PRAGMA main.wal_checkpoint(TRUNCATE);")
+        dbConn.execute(f"PRAGMA main.journal_mode = {journal_mode};")
+        dbConn.executescript("DELETE FROM temp.Staging; DELETE FROM temp.Replaced;")
+
+    if(incremental):
+        with dbConn:
+            version = database.content_version(dbConn)
+            rollups.set_meta(dbConn, "rollup_version", version)
+            if(cumulative):
+                rollups.set_meta(dbConn, "cumulative_version", version)
+    if(not cumulative):
+        rollups.maintain_rollups(dbConn) #rebuilds whatever is out of date
+    rollups.general_stats(dbConn) #recomputed from the rollups and cached for the new data
+    return counts
@@ -6,17 +6,67 @@ Project 1
 This project allows the user to use various commands
 to analyze the CTA L ridership data from the CTA2_L_daily_ridership.db file.
 The user can also plot the data for certain commands.
+
+Run without arguments for the interactive menu, or with a subcommand
+(e.g. "python main.py yearly Clark/Lake") to run a single command.
+"python main.py batch FILE" runs one subcommand per line of FILE
+against a single open connection, and "python main.py serve" answers
+the commands as JSON over HTTP.
 """
 
+import argparse
+import os
+import shlex
 import sqlite3
-import matplotlib.pyplot as plt
+import sys
+
+import api
+import cache
+import columnar
+import database
+import export
+import indexes
+import ingest
+import profiler
+import queries
+import ranking
+import render
+import reports
+import rollups
+import sql
+
+DB_FILE = 'CTA2_L_daily_ridership.db'
+
+#the name of each interactive command (and subcommand alias), for the profile
+COMMAND_NAMES = {"1": "find", "2": "weekstats", "3": "weekday", "4": "accessibility", "5": "stops",
+                 "6": "yearly", "7": "monthly", "8": "compare", "9": "nearby"}
+
+
+def show_plot(title):
+    """
+    This function shows the finished chart, or writes it to a file with --save-plots.
+
+    Args:
+        title: the title of the chart, used to name the file
+    """
+    path = render.finish(title)
+    if(path != None):
+        print(f"Saved plot to {path}")
+
+def ask_plot(plot):
+    """
+    This function decides if a command should plot its results.
 
+    Args:
+        plot: True or False if the caller already decided, None to ask the user
 
-class station_location:
-    def __init__(self, station_name, latitude, longitude):
-        self.station_name = station_name
-        self.latitude = latitude
-        self.longitude = longitude
+    Returns:
+        True if the results should be plotted
+        False otherwise
+    """
+    if(plot == None):
+        return input("Plot? (y/n) ") == 'y'
+    return plot
 
 def check_station(dbConn, stationName):
     """
@@ -27,63 +77,37 @@ def check_station(dbConn, stationName):
         stationName: the name of the station to check
 
     Returns:
-        A tuple with the station ID and station name if the station exists
-        "none" if the station does not exist
-        "multiple" if multiple stations exist
+        The api.station record if exactly one station matches
+        None if no station or multiple stations match
     """
-    dbCursor = dbConn.cursor()
-    if(stationName.find('_') or stationName.find('%')):
-        sql_query = "Select Station_ID, Station_Name From Stations Where Station_Name Like ?;"
-    else:
-        sql_query = "Select Station_ID, Station_Name From Stations Where Station_Name = ?;"
-
-    dbCursor.execute(sql_query, [stationName])
-    station_names = dbCursor.fetchall()
-
-    if(len(station_names) == 0):
-        print("**No station found...")
-        print() # new line
-        return ("none", "none")
-    elif(len(station_names) > 1):
-        print("**Multiple stations found...")
+    try:
+        return api.find_station(dbConn, stationName)
+    except api.station_lookup_error as error:
+        if(len(error.matches) == 0):
+            print("**No station found...")
+        else:
+            print("**Multiple stations found...")
         print() # new line
-        return ("multiple", "multiple")
-    else:
-        return (station_names[0][0], station_names[0][1])
+        return None
 
 ##################################################################  
 #
 # print_stats
 #
-# Given a connection to the CTA database, executes various
-# SQL queries to retrieve and output basic stats.
+# Given a connection to the CTA database (and optionally a pool
+# of connections to compute them in parallel), outputs basic stats.
+# The stats are cached in the sidecar database and only
+# recomputed when the data changes (see rollups.py).
 #
-def print_stats(dbConn):
-    dbCursor = dbConn.cursor()
-    
-    print("General Statistics:")
-
-    dbCursor.execute("Select count(*) From Stations;")
-    row = dbCursor.fetchone()
-    print("  # of stations:", f"{row[0]:,}")
-
-    dbCursor.execute("Select count(Stop_ID) From Stops;")
-    row = dbCursor.fetchone()
-    print("  # of stops:", f"{row[0]:,}")
+def print_stats(dbConn, pool=None):
+    stats = api.stats(dbConn, pool)
 
-    dbCursor.execute("Select count(*) From Ridership;")
-    row = dbCursor.fetchone()
-    print("  # of ride entries:", f"{row[0]:,}")
-
-    dbCursor.execute("Select strftime('%Y-%m-%d', Ride_Date) AS Date From Ridership Order By Date ASC Limit 1;")
-    date1 = dbCursor.fetchone()
-    dbCursor.execute("Select strftime('%Y-%m-%d', Ride_Date) AS Date From Ridership Order By Date DESC Limit 1;")
-    date2 = dbCursor.fetchone()
-    print("  date range:", date1[0], "-", date2[0])
-
-    dbCursor.execute("Select SUM(Num_Riders) From Ridership;")
-    row = dbCursor.fetchone()
-    print("  Total ridership:", f"{row[0]:,}")
+    print("General Statistics:")
+    print("  # of stations:", f"{stats.num_stations:,}")
+    print("  # of stops:", f"{stats.num_stops:,}")
+    print("  # of ride entries:", f"{stats.num_rides:,}")
+    print("  date range:", stats.first_date, "-", stats.last_date)
+    print("  Total ridership:", f"{stats.total:,}")
     print() # new line
 
 def findStation(dbConn, stationName):
@@ -94,20 +118,13 @@ def findStation(dbConn, stationName):
         dbConn: connection to the CTA database
         stationName: the name of the station to find
     """
-    dbCursor = dbConn.cursor()
-    if(stationName.find('_') or stationName.find('%')):
-        sql_query = f"Select Station_ID, Station_Name From Stations Where Station_Name Like '{stationName}' Order By Station_Name ASC;"
-    else:
-        sql_query = f"Select Station_ID, Station_Name From Stations Where Station_Name = '{stationName}' Order By Station_Name ASC;"
-
-    dbCursor.execute(sql_query)
-    rows = dbCursor.fetchall()
-    if(len(rows) == 0):
+    matches = api.find_stations(dbConn, stationName)
+    if(len(matches) == 0):
         print("**No stations found...")
         print() # new line
     else:
-        for row in rows:
-            print(f"{row[0]} : {row[1]}") #prints station id and station name
+        for match in matches:
+            print(f"{match.station_id} : {match.station_name}") #prints station id and station name
         print() # new line
 
 def analyze_station_weekStats(dbConn, stationName):
@@ -118,73 +135,59 @@ def analyze_station_weekStats(dbConn, stationName):
         dbConn: connection to the CTA database
         stationName: the name of the station to analyze
     """
-    dbCursor = dbConn.cursor()
-
-    #Check if the station exists
-    sql_query = f"""Select Sum(Num_Riders) From Ridership 
-                    Where Station_ID = (
-                        Select Station_ID
-                          From Stations
-                         Where Station_Name = '{stationName}'
-                    );"""
-    dbCursor.execute(sql_query)
-    total = dbCursor.fetchone()
-    if(total[0] == None):
+    #Find the ridership for each type of day (None if the station doesn't exist or has no ridership)
+    ridership = api.week_stats(dbConn, stationName)
+    if(ridership == None):
         print("**No data found...", end="\n\n")
         return
-    
+    total = ridership.total
+
     print(f"Percentage of ridership for the {stationName} station:")
-    dbCursor.execute(sql_query)
-
-    #Find weekday ridership
-    sql_query = f"""Select Sum(Num_Riders) From Ridership 
-                    Where Station_ID = (
-                        Select Station_ID
-                          From Stations
-                         Where Station_Name = '{stationName}'
-                    ) AND Type_of_Day = 'W';"""
-    
-    dbCursor.execute(sql_query)
-    weekday = dbCursor.fetchone()
-    percentage = (weekday[0]/total[0])*100
-    print(f"  Weekday ridership: {weekday[0]:,} ({percentage:.2f}%)")
-    
-    #Find Saturday ridership
-    sql_query = f"""Select Sum(Num_Riders) From Ridership 
-                    Where Station_ID = (
-                        Select Station_ID
-                          From Stations
-                         Where Station_Name = '{stationName}'
-                    ) AND Type_of_Day = 'A';"""
-    dbCursor.execute(sql_query)
-    saturday = dbCursor.fetchone()
-    percentage = (saturday[0]/total[0])*100
-    print(f"  Saturday ridership: {saturday[0]:,} ({percentage:.2f}%)")
-
-    #Find Sunday and holiday ridership
-    sql_query = f"""Select Sum(Num_Riders) From Ridership 
-                    Where Station_ID = (
-                        Select Station_ID
-                          From Stations
-                         Where Station_Name = '{stationName}'
-                    ) AND Type_of_Day = 'U';"""
-    dbCursor.execute(sql_query)
-    sunday_and_holiday = dbCursor.fetchone()
-    percentage = (sunday_and_holiday[0]/total[0])*100
-    print(f"  Sunday/holiday ridership: {sunday_and_holiday[0]:,} ({percentage:.2f}%)")
-
-    #Find total ridership
-    sql_query = f"""Select Sum(Num_Riders) From Ridership 
-                    Where Station_ID = (
-                        Select Station_ID
-                          From Stations
-                         Where Station_Name = '{stationName}'
-                    );"""
-    dbCursor.execute(sql_query)
-    total = dbCursor.fetchone()
-    print(f"  Total ridership: {total[0]:,}")
+
+    #Weekday ridership
+    percentage = (ridership.weekday/total)*100
+    print(f"  Weekday ridership: {ridership.weekday:,} ({percentage:.2f}%)")
+
+    #Saturday ridership
+    percentage = (ridership.saturday/total)*100
+    print(f"  Saturday ridership: {ridership.saturday:,} ({percentage:.2f}%)")
+
+    #Sunday and holiday ridership
+    percentage = (ridership.sunday_holiday/total)*100
+    print(f"  Sunday/holiday ridership: {ridership.sunday_holiday:,} ({percentage:.2f}%)")
+
+    print(f"  Total ridership: {total:,}")
     print() # new line
 
+def range_ridership(dbConn, user_stations, date_range, period, day_types=("W", "A", "U")):
+    """
+    This function prints the ridership of one or more stations within any date range,
+    for the given types of day. Each total takes two lookups per type of day in the
+    prefix-sum index (see rollups.py), however long the range is.
+
+    Args:
+        dbConn: connection to the CTA database
+        user_stations: a list of station names (each must match one station)
+        date_range: a (first day, day after the last day) tuple
+        period: the range as entered, for the heading (e.g. "2019-03-01 to 2019-03-20")
+        day_types: the types of day to include ('W', 'A', 'U')
+    """
+    names = {"W": "Weekday", "A": "Saturday", "U": "Sunday/holiday"}
+    for stationName in user_stations:
+        station = check_station(dbConn, stationName)
+        if(station == None):
+            continue
+        ridership = api.range_totals(dbConn, station, date_range)
+        riders = {"W": ridership.weekday, "A": ridership.saturday, "U": ridership.sunday_holiday}
+        days = {"W": ridership.weekday_days, "A": ridership.saturday_days, "U": ridership.sunday_holiday_days}
+
+        print(f"Ridership at {station.station_name} for {period}:")
+        for day_type in day_types:
+            print(f"  {names[day_type]} ridership: {riders[day_type]:,}")
+        print(f"  Total ridership: {sum(riders[day_type] for day_type in day_types):,} "
+              f"({sum(days[day_type] for day_type in day_types):,} days with data)")
+        print() # new line
+
 def weekday_ridership(dbConn):
     """
     This function finds the total ridership for weekdays for all stations
@@ -192,30 +195,28 @@ def weekday_ridership(dbConn):
     Args:
         dbConn: connection to the CTA database
     """
-    dbCursor = dbConn.cursor()
-
-    #Find total ridership for weekdays
-    sql_query = f"""SELECT SUM(Num_Riders)
-        FROM Ridership
-        WHERE Type_of_Day = 'W';"""
-    dbCursor.execute(sql_query)
-    total = dbCursor.fetchone()
-
-    #Find ridership for each station
-    sql_query = f"""SELECT Stations.Station_Name AS Name,
-        SUM(Ridership.Num_Riders) AS Total
-        FROM Stations
-        JOIN Ridership ON Stations.Station_ID=Ridership.Station_ID
-        WHERE Ridership.Type_of_Day = 'W'
-        GROUP BY Name
-        ORDER BY Total DESC;"""
-    dbCursor = dbConn.cursor()
-    dbCursor.execute(sql_query)
-    rows = dbCursor.fetchall()
     print("Ridership on Weekdays for Each Station")
-    for row in rows:
-        percentage = (row[1]/total[0])*100
-        print(f"{row[0]} : {row[1]:,} ({percentage:.2f}%)") #prints station name and total ridership and percentage
+    for share in api.weekday_ridership(dbConn):
+        print(f"{share.station_name} : {share.riders:,} ({share.percentage:.2f}%)") #prints station name and total ridership and percentage
+    print() # new line
+
+def rank_ridership(dbConn, day_types, date_range=None, top=None):
+    """
+    This function ranks the stations by total ridership for the given types of day and date range.
+
+    Args:
+        dbConn: connection to the CTA database
+        day_types: a list of day types ('W' weekday, 'A' Saturday, 'U' Sunday/holiday)
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+        top: the number of stations to print, or None for every station
+    """
+    print(f"Ridership Ranking ({', '.join(day_types)})")
+    rank = 0
+    for share in api.rank_stations(dbConn, day_types, date_range, top):
+        rank += 1
+        print(f"{rank}. {share.station_name} : {share.riders:,} ({share.percentage:.2f}%)")
+    if(rank == 0):
+        print("**No data found...")
     print() # new line
 
 def direction_conversion(direction):
@@ -274,50 +275,64 @@ def capitalize_color(line_color):
     else:
         return line_color.capitalize()
 
-def line_accessibility(dbConn):
+def print_line_stops(stops, direction):
+    """
+    This function prints the stops of a line in one direction and if they are handicap accessible.
+
+    Args:
+        stops: a list of api.line_stop records
+        direction: the direction
+    """
+    for stop in stops:
+        #Prints the stop name and if it is handicap accessible
+        if(stop.ada == 1):
+            print(f"{stop.stop_name} : direction = {direction} (handicap accessible)")
+        else:
+            print(f"{stop.stop_name} : direction = {direction} (not handicap accessible)")
+
+def line_accessibility(dbConn, user_color=None, user_direction=None):
     """
     This function finds the stops for a given line color and direction and checks if they are handicap accessible.
 
     Args:
         dbConn: connection to the CTA database
+        user_color: the line color, or None to ask the user
+        user_direction: the direction, or None to ask the user
     """
-
-    dbCursor = dbConn.cursor()
-    user_color = input("Enter a line color (e.g. Red or Yellow): ").lower()
-    user_color = capitalize_color(user_color)
+    if(user_color == None):
+        user_color = input("Enter a line color (e.g. Red or Yellow): ")
+    user_color = capitalize_color(user_color.lower())
     
     #Check if the line color exists
-    dbCursor.execute(f"Select Color From Lines Where Color='{user_color}';")
-    if(dbCursor.fetchone() == None):
+    if(not api.has_line(dbConn, user_color)):
         print("**No such line...", end="\n\n")
         return
     
-    user_direction = input("Enter a direction (N/S/W/E): ").lower().capitalize()
+    if(user_direction == None):
+        user_direction = input("Enter a direction (N/S/W/E): ")
+    user_direction = user_direction.lower().capitalize()
     user_direction = direction_conversion(user_direction) #convert direction to appropriate format
 
     #Find the stops for the given line color and direction
-    sql_query = f"""Select Stops.Stop_Name
-        From Lines
-        Join StopDetails ON Lines.Line_ID = StopDetails.Line_ID
-        Join Stops ON StopDetails.Stop_ID = Stops.Stop_ID
-        Where Lines.Color = '{user_color}' And Direction = '{user_direction}'
-        Order By Stops.Stop_Name ASC;"""
-    dbCursor.execute(sql_query)
-    rows = dbCursor.fetchall()
-
-    if(len(rows) == 0): #check if the line runs in the direction chosen
+    stops = api.line_stops(dbConn, user_color, user_direction)
+    if(len(stops) == 0): #check if the line runs in the direction chosen
         print("**That line does not run in the direction chosen...", end="\n\n")
         return
     
-    for row in rows:
-        dbCursor.execute("Select ADA From Stops Where Stop_Name = ?", (row[0],)) #get the handicap accessibility for the stop
-        accessibility = dbCursor.fetchone()
-        #Prints the stop name and if it is handicap accessible
-        if(accessibility[0] == 1):
-            print(f"{row[0]} : direction = {user_direction} (handicap accessible)")
-        else:
-            print(f"{row[0]} : direction = {user_direction} (not handicap accessible)")
+    print_line_stops(stops, user_direction)
     print() # new line
+
+def all_line_accessibility(dbConn):
+    """
+    This function prints the handicap accessibility of the stops of every line in every direction.
+
+    Args:
+        dbConn: connection to the CTA database
+    """
+    for color, direction in api.line_directions(dbConn):
+        print(f"{color} Line going {direction}")
+        print_line_stops(api.line_stops(dbConn, color, direction), direction)
+        print() # new line
     
 def number_stops(dbConn):
     """
@@ -326,28 +341,10 @@ def number_stops(dbConn):
     Args:
         dbConn: connection to the CTA database
     """
-    dbCursor = dbConn.cursor()
-
     print("Number of Stops For Each Color By Direction")
 
-    sql_query = """Select COUNT(Stop_ID) From Stops;""" #find the total number of stops
-    dbCursor.execute(sql_query)
-    total = dbCursor.fetchone()
-    
-    #Find the number of stops for each color by direction
-    sql_query = """Select Lines.Color As Color, 
-            Stops.Direction,
-            COUNT(Stops.Stop_ID) 
-        From Lines
-        Join StopDetails ON StopDetails.Line_ID = Lines.Line_ID
-        Join Stops ON StopDetails.Stop_ID = Stops.Stop_ID
-        Group By Color, Stops.Direction
-        Order By Color ASC;"""
-    dbCursor.execute(sql_query)
-    rows = dbCursor.fetchall()
-    for row in rows:
-        percentage = (row[2]/total[0])*100
-        print(f"{row[0]} going {row[1]} : {row[2]} ({percentage:.2f}%)") #prints the color, direction, number of stops, and percentage
+    for line in api.stop_counts(dbConn):
+        print(f"{line.color} going {line.direction} : {line.count} ({line.percentage:.2f}%)") #prints the color, direction, number of stops, and percentage
     print() # new line
 
 def plot_yearly_ridership(stationName, x_coords, y_coords):
@@ -359,60 +356,41 @@ def plot_yearly_ridership(stationName, x_coords, y_coords):
         x_coords: the years
         y_coords: the number of riders
     """
+    plt = render.new_figure()
     plt.xlabel("Year")
     plt.ylabel("Number of Riders")
     plt.title(f"Yearly Ridership at {stationName} Station")
     plt.plot(x_coords, y_coords)
-    plt.ioff()
-    plt.show()
+    show_plot(f"Yearly Ridership at {stationName}")
 
-def yearly_ridership(dbConn, stationName):
+def yearly_ridership(dbConn, stationName, plot=None):
     """
     This function finds the yearly ridership for the given station.
 
     Args:
         dbConn: connection to the CTA database
         stationName: the name of the station
+        plot: True or False to plot or not, None to ask the user
     """
-    dbCursor = dbConn.cursor()
-
     #check if the station exists
     valid_station = check_station(dbConn, stationName)
-    if(valid_station[0] == "none"):
-        return
-    elif(valid_station[0] == "multiple"):
+    if(valid_station == None):
         return
 
-    #check if the given station name contains wildcards
-    if(stationName.find('_') or stationName.find('%')):
-        sql_query = f"""Select strftime('%Y', Ride_Date) as Year, SUM(Num_Riders) as Total
-                        From Ridership
-                        Where Station_ID=(Select Station_ID From Stations Where Station_Name Like '{stationName}')
-                        Group By Year
-                        Order By Year ASC;"""
-    else:
-        sql_query = f"""Select strftime('%Y', Ride_Date) as Year, SUM(Num_Riders) as Total
-                        From Ridership
-                        Where Station_ID=(Select Station_ID From Stations Where Station_Name = '{stationName}')
-                        Group By Year
-                        Order By Year ASC;"""
-
-    dbCursor.execute(sql_query)
-    rows = dbCursor.fetchall()
+    points = api.yearly_ridership(dbConn, valid_station.station_id)
 
     x_coords = []
     y_coords = []
 
-    print(f"Yearly Ridership at {valid_station[1]}")
-    for row in rows:
-        x_coords.append(row[0]) #add the year to the x_coords list
-        y_coords.append(row[1]) #add the number of riders to the y_coords list
-        print(f"{row[0]} : {row[1]:,}")
+    print(f"Yearly Ridership at {valid_station.station_name}")
+    for point in points:
+        x_coords.append(point.period) #add the year to the x_coords list
+        y_coords.append(point.riders) #add the number of riders to the y_coords list
+        print(f"{point.period} : {point.riders:,}")
 
     print() # new line
-    user_input = input("Plot? (y/n) ")
-    if(user_input == 'y'):
-        plot_yearly_ridership(valid_station, x_coords, y_coords) #plot the yearly ridership
+    if(ask_plot(plot)):
+        plot_yearly_ridership(valid_station.station_name, x_coords, y_coords) #plot the yearly ridership
 
     print() # new line
 
@@ -426,175 +404,187 @@ def plot_monthly_ridership(stationName, year, x_coords, y_coords):
         x_coords: the months
         y_coords: the number of riders
     """
+    plt = render.new_figure()
     plt.xlabel("Month")
     plt.ylabel("Number of Riders")
     plt.title(f"Monthly Ridership at {stationName} ({year})")
     plt.plot(x_coords, y_coords)
-    plt.ioff()
-    plt.show()
+    show_plot(f"Monthly Ridership at {stationName} {year}")
 
-def monthly_ridership(dbConn, stationName):
+def monthly_ridership(dbConn, stationName, user_year=None, plot=None):
     """
     This function finds the monthly ridership for the given station.
 
     Args:
         dbConn: connection to the CTA database
         stationName: the name of the station
+        user_year: the year, or None to ask the user
+        plot: True or False to plot or not, None to ask the user
     """
-    dbCursor = dbConn.cursor()
-
     valid_station = check_station(dbConn, stationName) #check if the station exists
-    if(valid_station[0] == "none"):
-        return
-    elif(valid_station[0] == "multiple"):
+    if(valid_station == None):
         return
-    valid_station_name = valid_station[1] #get the station name
+    valid_station_name = valid_station.station_name #get the station name
     
-    user_year = user_year = input("Enter a year: ")
+    if(user_year == None):
+        user_year = input("Enter a year: ")
 
-    sql_query = f"""Select strftime('%m/%Y', Ride_Date) as Date, SUM(Num_Riders) as Total
-                    From Ridership
-                    Where Station_ID=(Select Station_ID From Stations Where Station_Name = ?) and strftime('%Y', Ride_Date) = '{user_year}'
-                    Group By Date
-                    Order By Date ASC;"""
-
-    dbCursor.execute(sql_query, [valid_station_name])
-    rows = dbCursor.fetchall()
+    points = api.monthly_ridership(dbConn, valid_station.station_id, user_year)
 
     x_coords = []
     y_coords = []
 
-    print(f"Monthly Ridership at {valid_station[1]} for {user_year}")
-    for row in rows:
-        x_coords.append(row[0][:2]) #add the month to the x_coords list
-        y_coords.append(row[1]) #add the number of riders to the y_coords list
-        print(f"{row[0]} : {row[1]:,}")
+    print(f"Monthly Ridership at {valid_station_name} for {user_year}")
+    for point in points:
+        x_coords.append(point.period[:2]) #add the month to the x_coords list
+        y_coords.append(point.riders) #add the number of riders to the y_coords list
+        print(f"{point.period} : {point.riders:,}")
 
     print() # new line
-    user_input = input("Plot? (y/n) ")
-    if(user_input == 'y'):
+    if(ask_plot(plot)):
         plot_monthly_ridership(valid_station_name, user_year, x_coords, y_coords) #plot the monthly ridership
     print() # new line
 
-def plot_comparison(station1_name, station2_name, year, x_coords1, y_coords1, x_coords2, y_coords2):
+def plot_pivot(title, x_label, periods, station_names, rows):
     """
-    This function plots the comparison of the ridership for the two stations.
+    This function plots a pivot as one series per station on one chart.
 
     Args:
-        station1_name: the name of the first station
-        station2_name: the name of the second station
-        year: the year
-        x_coords1: the days for the first station
-        y_coords1: the number of riders for the first station
-        x_coords2: the days for the second station
-        y_coords2: the number of riders for the second station
+        title: the title of the chart
+        x_label: the label of the periods (e.g. Year)
+        periods: the periods
+        station_names: the names of the stations
+        rows: a list with the number of riders for each period (None if missing) for each station
     """
-    plt.xlabel("Day")
+    plt = render.new_figure()
+    plt.xlabel(x_label)
     plt.ylabel("Number of Riders")
-    plt.title(f"Ridership Each Day of {year}")
-    plt.plot(x_coords1, y_coords1, label=station1_name)
-    plt.plot(x_coords2, y_coords2, label=station2_name)
+    plt.title(title)
+    for station_name, row in zip(station_names, rows):
+        plt.plot(periods, [float("nan") if riders == None else riders for riders in row], label=station_name)
     plt.legend()
-    plt.ioff()
-    plt.show()
+    show_plot(title)
 
-def compare_stats(dbConn, user_year):
+def pivot_ridership(dbConn, user_stations, user_year=None, plot=False):
     """
-    This function compares the ridership for two stations for the given year.
+    This function prints the yearly ridership (or the monthly ridership in a year) of
+    several stations as a station x period table, fetched with one grouped query.
 
     Args:
         dbConn: connection to the CTA database
-        user_year: the year to compare the ridership
+        user_stations: a list of stations (wildcards _ and %), each may match several stations
+        user_year: the year for monthly ridership, or None for yearly ridership
+        plot: True to plot one series per station
     """
-    dbCursor = dbConn.cursor()
+    station_list = []
+    for user_station in user_stations:
+        matches = api.find_stations(dbConn, user_station)
+        if(len(matches) == 0):
+            print(f"**No station found for {user_station}...", end="\n\n")
+            return
+        station_list.extend(match for match in matches if match not in station_list)
+
+    if(user_year == None):
+        pivot = api.yearly_pivot(dbConn, station_list)
+        title = f"Yearly Ridership for {len(station_list)} Stations"
+    else:
+        pivot = api.monthly_pivot(dbConn, station_list, user_year)
+        title = f"Monthly Ridership for {len(station_list)} Stations in {user_year}"
 
-    print() # new line
-    user_station1 = input("Enter station 1 (wildcards _ and %): ").replace(" ", "") #get the first station and remove any spaces
-    valid_station1 = check_station(dbConn, user_station1) #check if the first station exists
-    if(valid_station1[0] == "none"):
-        return
-    elif(valid_station1[0] == "multiple"):
+    if(len(pivot.periods) == 0):
+        print("**No data found...", end="\n\n")
         return
-    station1_id = valid_station1[0] #get the first station id
-    station1_name = valid_station1[1] #get the first station name
 
+    name_width = max(len("Station"), *(len(station.station_name) for station in station_list))
+    cell_width = max(12, *(len(period) + 2 for period in pivot.periods))
+    print(title)
+    print(f"{'Station':<{name_width}}" + "".join(f"{period:>{cell_width}}" for period in pivot.periods))
+    for station, row in pivot.rows():
+        cells = "".join(f"{'-':>{cell_width}}" if riders == None else f"{riders:>{cell_width},}" for riders in row)
+        print(f"{station.station_name:<{name_width}}{cells}")
     print() # new line
 
-    user_station2 = input("Enter station 2 (wildcards _ and %): ").replace(" ", "") #get the second station and remove any spaces
-    valid_station2 = check_station(dbConn, user_station2) #check if the second station exists
-    if(valid_station2[0] == "none"): 
-        return
-    elif(valid_station2[0] == "multiple"):
-        return
-    station2_id = valid_station2[0] #get the second station id
-    station2_name = valid_station2[1] #get the second station name
-
-    #Find the first 5 days of the year
-    sql_query1 = """Select strftime('%Y-%m-%d', Ride_Date) as Date, Sum(Num_Riders)
-                    From Ridership
-                    Where Station_ID = (Select Station_ID From Stations Where Station_Name = ?) and strftime('%Y', Ride_Date) = ?
-                    Group By Date
-                    Order By Date ASC
-                    Limit 5;"""
-    
-    #Find the last 5 days of the year
-    sql_query2 = """Select strftime('%Y-%m-%d', Ride_Date) as Date, Sum(Num_Riders)
-                    From Ridership
-                    Where Station_ID = (Select Station_ID From Stations Where Station_Name = ?) and strftime('%Y', Ride_Date) = ?
-                    Group By Date
-                    Order By Date DESC
-                    Limit 5;"""
-    dbCursor.execute(sql_query1, [station1_name, user_year]) #get the first 5 days of the year
-    rows1 = dbCursor.fetchall()
-    print(f"Station 1: {station1_id} {station1_name}") 
-    #Print the first 5 days of the year
-    for row in rows1:
-        print(f"{row[0]} {row[1]}") 
-
-    dbCursor.execute(sql_query2, [station1_name, user_year]) #get the last 5 days of the year
-    rows1 = dbCursor.fetchall()
-    for row in reversed(rows1): #Print the last 5 days of the year
-        print(f"{row[0]} {row[1]}")
-
-    dbCursor.execute(sql_query1, [station2_name, user_year]) #get the first 5 days of the year
-    rows2 = dbCursor.fetchall()
-    print(f"Station 2: {station2_id} {station2_name}")
-    for row in rows2: #Print the first 5 days of the year
-        print(f"{row[0]} {row[1]}")
-
-    dbCursor.execute(sql_query2, [station2_name, user_year]) #get the last 5 days of the year
-    rows2 = dbCursor.fetchall() 
-    for row in reversed(rows2): #Print the last 5 days of the year
-        print(f"{row[0]} {row[1]}")
-    
+    if(plot):
+        if(user_year == None):
+            plot_pivot(title, "Year", pivot.periods, [station.station_name for station in station_list], pivot.riders)
+        else:
+            months = [period[:2] for period in pivot.periods]
+            plot_pivot(title, "Month", months, [station.station_name for station in station_list], pivot.riders)
+
+def plot_comparison(station_names, period, x_coords, y_coords):
+    """
+    This function plots the comparison of the ridership for the stations.
+
+    Args:
+        station_names: the names of the stations
+        period: the year or date range being compared
+        x_coords: a list with the days for each station
+        y_coords: a list with the number of riders for each station
+    """
+    plt = render.new_figure()
+    plt.xlabel("Day")
+    plt.ylabel("Number of Riders")
+    plt.title(f"Ridership Each Day of {period}")
+    for station_name, station_x, station_y in zip(station_names, x_coords, y_coords):
+        plt.plot(*render.downsample(station_x, station_y), label=station_name)
+    plt.legend()
+    show_plot(f"Ridership Each Day of {period} {' '.join(station_names)}")
+
+def compare_stats(dbConn, user_year, user_stations=None, plot=None, date_range=None):
+    """
+    This function compares the daily ridership of two or more stations for the given year
+    (or date range). The daily ridership of all the stations is fetched with one grouped
+    query, and both the first/last five days and the plot come from that result.
+
+    Args:
+        dbConn: connection to the CTA database
+        user_year: the year to compare the ridership
+        user_stations: a list of stations (wildcards _ and %), or None to ask the user for two
+        plot: True or False to plot or not, None to ask the user
+        date_range: a (first day, day after the last day) tuple to use instead of the year
+    """
+    if(user_stations == None):
+        user_stations = [None, None]
+
+    #check that each station exists
+    station_ids = []
+    station_names = []
+    for number, user_station in enumerate(user_stations, start=1):
+        print() # new line
+        if(user_station == None):
+            user_station = input(f"Enter station {number} (wildcards _ and %): ")
+        user_station = user_station.replace(" ", "") #remove any spaces from the station
+        valid_station = check_station(dbConn, user_station)
+        if(valid_station == None):
+            return
+        station_ids.append(valid_station.station_id) #get the station id
+        station_names.append(valid_station.station_name) #get the station name
+
+    if(date_range == None):
+        period = user_year
+        date_range = queries.year_bounds(user_year) #the year as a date range
+    else:
+        period = f"{date_range[0]} to {queries.last_day(date_range)}" #the inclusive last day, as entered
+
+    #Find the ridership for each day of the range for all of the stations
+    daily = api.daily_ridership(dbConn, station_ids, date_range)
+
+    for number, (station_id, station_name) in enumerate(zip(station_ids, station_names), start=1):
+        points = daily[station_id]
+        print(f"Station {number}: {station_id} {station_name}")
+        for point in points[:5]: #Print the first 5 days
+            print(f"{point.period} {point.riders}")
+        for point in points[max(5, len(points) - 5):]: #Print the last 5 days (that weren't printed already)
+            print(f"{point.period} {point.riders}")
+
     print() # new line
-    user_input = input("Plot? (y/n) ")
-    if(user_input == 'y'):
-        #Find the ridership for each day of the year for the two stations
-        sql_query = """Select strftime('%Y-%m-%d', Ride_Date) as Date, Sum(Num_Riders)
-                        From Ridership
-                        Where Station_ID = (Select Station_ID From Stations Where Station_Name = ?) and strftime('%Y', Ride_Date) = ?
-                        Group By Date
-                        Order By Date ASC;"""
-        rows1 = dbCursor.execute(sql_query, [station1_name, user_year]).fetchall()
-        x_coords1 = []
-        y_coords1 = []
-        days = 0
-        for row in rows1:
-            x_coords1.append(days)
-            y_coords1.append(row[1]) #add the number of riders to the y_coords1 list
-            days += 1
-        
-        rows2 = dbCursor.execute(sql_query, [station2_name, user_year]).fetchall()
-        x_coords2 = []
-        y_coords2 = []
-        days = 0
-        for row in rows2:
-            x_coords2.append(days)
-            y_coords2.append(row[1]) #add the number of riders to the y_coords2 list
-            days += 1
-        
-        plot_comparison(station1_name, station2_name, user_year, x_coords1, y_coords1, x_coords2, y_coords2) #plot the comparison
+    if(ask_plot(plot)):
+        x_coords = []
+        y_coords = []
+        for station_id in station_ids:
+            x_coords.append(list(range(len(daily[station_id])))) #the day number
+            y_coords.append([point.riders for point in daily[station_id]]) #the number of riders
+        plot_comparison(station_names, period, x_coords, y_coords) #plot the comparison
     print() # new line
 
 def plot_stations_nearby(station_objects):
@@ -602,130 +592,783 @@ def plot_stations_nearby(station_objects):
     This function plots the stations nearby the given latitude and longitude on an image.
 
     Args:
-        station_objects: the station object containing the station name, latitude, and longitude
+        station_objects: a list of api.station_location records
     """
-    image = plt.imread("chicago.png")
-    xydims = [-87.9277, -87.5569, 41.7012, 42.0868]
-    plt.imshow(image, extent=xydims)
-    for object in station_objects:
-        plt.plot(object.longitude, object.latitude, 'bo') #plot the stations
-        plt.annotate(object.station_name, (object.longitude, object.latitude)) #annotate the picture with the station name
-    plt.xlim([-87.9277, -87.5569])
-    plt.ylim([41.7012, 42.0868])
-    plt.show()
+    render.plot_map([station.station_name for station in station_objects],
+                    [station.latitude for station in station_objects],
+                    [station.longitude for station in station_objects])
+    show_plot("Stations Nearby")
         
-def stations_nearby(dbConn):
+def stations_nearby(dbConn, user_latitute=None, user_longitude=None, plot=None, miles=1.0):
     """
-    This function finds the stations nearby the given latitude and longitude within a mile.
+    This function finds the stations nearby the given latitude and longitude within a mile
+    (or the given radius), using the spatial index of the stops.
 
     Args:
         dbConn: connection to the CTA database
+        user_latitute: the latitude, or None to ask the user
+        user_longitude: the longitude, or None to ask the user
+        plot: True or False to plot or not, None to ask the user
+        miles: the radius to search in miles
     """
-    dbCursor = dbConn.cursor()
-
-    user_latitute = input("Enter a latitude: ")
+    if(user_latitute == None):
+        user_latitute = input("Enter a latitude: ")
     user_latitute = float(user_latitute) #convert the latitude to a decimal
     if(user_latitute < 40 or user_latitute > 43): #check if the latitude is within bounds of Chicago
         print("**Latitude entered is out of bounds...")
         print() #new line
         return
     
-    user_longitude = input("Enter a longitude: ")
+    if(user_longitude == None):
+        user_longitude = input("Enter a longitude: ")
     user_longitude = float(user_longitude) #convert the longitude to a decimal
     if(user_longitude < -88 or user_longitude > -87): #check if the longitude is within bounds of Chicago
         print("**Longitude entered is out of bounds...")
         print()
         return
-    
-    lat_degree = 1/69 #1 mile in latitude
-    lon_degree = 1/51 #1 mile in longitude
-
-    #Bounds for latitude and longitude
-    lat_min = round(user_latitute - lat_degree, 3)
-    lat_max = round(user_latitute + lat_degree, 3)
-
-    lon_min = round(user_longitude - lon_degree, 3)
-    lon_max = round(user_longitude + lon_degree, 3)
-
-    #Find the stations within a mile
-    sql_query= """Select Stations.Station_Name as Name, Stops.Latitude as Latitude, Stops.Longitude as Longitude
-                    From Stations
-                    Join Stops on Stations.Station_ID=Stops.Station_ID
-                    Where (Stops.Latitude > ? AND Stops.Latitude < ?) AND
-                        (Stops.Longitude > ? AND Stops.Longitude < ?)
-                    Group By Name, Latitude, Longitude
-                    Order By Name ASC, Latitude DESC, Longitude DESC;"""
-    dbCursor.execute(sql_query, [lat_min, lat_max, lon_min, lon_max])
-    rows = dbCursor.fetchall()
-    if(len(rows) == 0): #check if there are any stations within a mile
+
+    #Find the stations within the radius
+    station_objects = api.stations_nearby(dbConn, user_latitute, user_longitude, miles)
+    if(len(station_objects) == 0): #check if there are any stations within the radius
         print("**No stations found...")
         print() # new line
         return
     
     print() # new line
-    print("List of Stations Within a Mile")
+    if(miles == 1):
+        print("List of Stations Within a Mile")
+    else:
+        print(f"List of Stations Within {miles:g} Miles")
 
-    station_objects = []
-    for row in rows:
-        station_objects.append(station_location(row[0], row[1], row[2]))
-        print(f"{row[0]} : ({row[1]}, {row[2]})")
+    for station in station_objects:
+        print(f"{station.station_name} : ({station.latitude}, {station.longitude})")
     print() # new line
 
-    user_input = input("Plot? (y/n) ")
-    if(user_input == 'y'):
+    if(ask_plot(plot)):
         plot_stations_nearby(station_objects) #plot the stations nearby
     print() # new line
 
-    
+def nearest_stations(dbConn, locations, k=1):
+    """
+    This function finds the k closest stations to each of the given locations
+    and prints one line per match: latitude, longitude, station name and distance in miles.
 
-##################################################################  
-#
-# main
-#Clark/Lake
-print('** Welcome to CTA L analysis app **', end="\n\n")
+    Args:
+        dbConn: connection to the CTA database
+        locations: a list of (latitude, longitude) pairs
+        k: the number of stations to find for each location
+    """
+    for (latitude, longitude), matches in zip(locations, api.nearest_stations(dbConn, locations, k)):
+        if(len(matches) == 0):
+            print(f"{latitude}, {longitude} : **No stations found...")
+        for match in matches:
+            print(f"{latitude}, {longitude} : {match.station_name} ({match.latitude}, {match.longitude}) {match.distance:.2f} mi")
+    print() # new line
 
-dbConn = sqlite3.connect('CTA2_L_daily_ridership.db') #connect to the CTA database
+def plot_network_trends(year, window, station_names, x_coords, y_coords):
+    """
+    This function plots the rolling average ridership of several stations on one chart.
 
-print_stats(dbConn) #print the general statistics
+    Args:
+        year: the year
+        window: the rolling average window in days
+        station_names: the names of the stations
+        x_coords: a list with the days for each station
+        y_coords: a list with the rolling averages for each station
+    """
+    plt = render.new_figure()
+    plt.xlabel("Day")
+    plt.ylabel("Riders per Day")
+    plt.title(f"{window}-Day Rolling Average Ridership in {year}")
+    for station_name, station_x, station_y in zip(station_names, x_coords, y_coords):
+        plt.plot(*render.downsample(station_x, station_y), label=station_name)
+    plt.legend()
+    show_plot(f"{window}-Day Rolling Average Ridership in {year}")
 
-while True:
-    user_input = input("Please enter a command (1-9, x to exit): ").replace(" ", "")
-    if(user_input == 'x'):
-        break
-    elif(user_input == '1'):
-        print() # new line
-        user_station = input("Enter partial station name (wildcards _ and %): ").replace(" ", "")
-        findStation(dbConn, user_station)
-    elif(user_input == '2'):
-        print() # new line
-        user_station = input("Enter the name of the station you would like to analyze: ")
-        analyze_station_weekStats(dbConn, user_station)
-    elif(user_input == '3'):
+def network_trends(dbConn, user_year=None, window=28, threshold=3.0, top=None,
+                   output=None, outliers_output=None, file_format="csv", plot=False):
+    """
+    This function prints the trends of every station for a year: rolling average,
+    year over year change, day-type mix and outlier days, all computed at once over
+    a station x day matrix (see trends.py). Requires NumPy.
+
+    Args:
+        dbConn: connection to the CTA database
+        user_year: the year, or None for the last year of the history
+        window: the rolling average window in days
+        threshold: how many standard deviations from normal make a day an outlier
+        top: the number of stations to print (busiest first), or None for every station
+        output: the path of a file to export the station trends to, or None
+        outliers_output: the path of a file to export the outlier days to, or None
+        file_format: "csv" or "jsonl"
+        plot: True to plot the rolling averages of the printed stations (at most 10)
+    """
+    if(not columnar.available()):
+        print("**NumPy is not installed, trends need it...", end="\n\n")
+        return
+
+    years = api.trend_years(dbConn)
+    if(user_year == None and len(years) > 0):
+        user_year = years[-1]
+    station_trends = api.network_trends(dbConn, user_year, window, threshold)
+    if(len(station_trends) == 0):
+        print("**No data found...", end="\n\n")
+        return
+    user_year = int(user_year)
+    outliers = api.outlier_days(dbConn, user_year, threshold)
+
+    #busiest stations first
+    station_trends.sort(key=lambda trend: -(trend.rolling_average or 0))
+    shown = station_trends[:top] if top != None else station_trends
+
+    def percent(value, sign=""):
+        return "n/a" if value == None else f"{value:{sign}.2f}%"
+
+    print(f"Network Trends for {user_year} ({window}-day rolling average, change from {user_year - 1})")
+    for trend in shown:
+        rolling = "n/a" if trend.rolling_average == None else f"{trend.rolling_average:,.0f}"
+        shift = "n/a" if trend.mix_shift == None else f"{trend.mix_shift:.2f} pts"
+        print(f"{trend.station_name} : {rolling} riders/day, {percent(trend.yoy_change, '+')} year over year, "
+              f"weekday share {percent(trend.weekday_share)} (mix shift {shift}), {trend.outlier_days} outlier days")
+    print() # new line
+
+    print(f"Outlier Days ({len(outliers):,} beyond {threshold:g} standard deviations)")
+    for outlier in outliers[:10]: #the 10 most unusual
+        print(f"{outlier.date} {outlier.station_name} ({outlier.day_type}) : {outlier.riders:,} ({outlier.z_score:+.1f} sd)")
+    print() # new line
+
+    if(output != None):
+        count = export.write_rows(output, api.station_trend.__slots__, (trend.as_tuple() for trend in station_trends), file_format)
+        if(output != "-"):
+            print(f"Exported {count:,} rows to {output}", end="\n\n")
+    if(outliers_output != None):
+        count = export.write_rows(outliers_output, api.outlier_day.__slots__, (outlier.as_tuple() for outlier in outliers), file_format)
+        if(outliers_output != "-"):
+            print(f"Exported {count:,} rows to {outliers_output}", end="\n\n")
+
+    if(plot):
+        plotted = shown[:10]
+        series = api.rolling_averages(dbConn, [trend.station_id for trend in plotted], user_year, window)
+        x_coords = []
+        y_coords = []
+        for trend in plotted:
+            x_coords.append(list(range(len(series[trend.station_id])))) #the day number
+            y_coords.append([point.riders for point in series[trend.station_id]]) #the rolling average
+        plot_network_trends(user_year, window, [trend.station_name for trend in plotted], x_coords, y_coords)
+
+def plot_network_map(period, network, labels=10):
+    """
+    This function plots every station on the Chicago map, the size and colour of
+    each marker showing its ridership.
+
+    Args:
+        period: the period, for the title (e.g. "2019")
+        network: a list of api.station_ridership records
+        labels: the number of busiest stations to label
+    """
+    title = f"Network Ridership ({period})"
+    render.plot_heatmap(title, [station.station_name for station in network],
+                        [station.latitude for station in network],
+                        [station.longitude for station in network],
+                        [station.riders for station in network], labels)
+    show_plot(title)
+
+def animate_network_map(period, pivot, labels=10):
+    """
+    This function animates the network map month by month.
+
+    Args:
+        period: the period, for the title (e.g. "2019")
+        pivot: an api.ridership_pivot of stations x months
+        labels: the number of busiest stations to label
+    """
+    title = f"Network Ridership by Month ({period})"
+    frames = [list(column) for column in zip(*pivot.riders)] #one list of riders per month
+    animation = render.animate_heatmap(title, [station.station_name for station in pivot.stations],
+                                       [station.latitude for station in pivot.stations],
+                                       [station.longitude for station in pivot.stations],
+                                       [f"Network Ridership in {month}" for month in pivot.periods], frames, labels)
+    path = render.finish_animation(animation, title)
+    if(path != None):
+        print(f"Saved animation to {path}")
+
+def network_map(dbConn, day_types, date_range=None, period="all years", animate=False, labels=10, plot=None):
+    """
+    This function maps the ridership of every station for some types of day and a date
+    range, optionally month by month. The ridership is one grouped query, joined to the
+    station positions kept for the session.
+
+    Args:
+        dbConn: connection to the CTA database
+        day_types: a list of day types ('W' weekday, 'A' Saturday, 'U' Sunday/holiday)
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+        period: the period, for the titles (e.g. "2019")
+        animate: True for one frame per month
+        labels: the number of busiest stations to label on the map
+        plot: True or False to map or not, None to ask the user
+    """
+    if(animate):
+        if(date_range == None):
+            date_range = queries.date_bounds("0001-01-01", "9998-12-31")
+        pivot = api.network_monthly(dbConn, day_types, date_range)
+        network = pivot.stations
+    else:
+        network = api.network_ridership(dbConn, day_types, date_range)
+    if(len(network) == 0):
+        print("**No data found...", end="\n\n")
+        return
+
+    print(f"Network Ridership ({', '.join(day_types)}) for {period}")
+    print(f"{len(network):,} stations, {sum(station.riders for station in network):,} riders")
+    if(animate):
+        print(f"{len(pivot.periods)} months, {pivot.periods[0]} to {pivot.periods[-1]}")
+    for rank, station in enumerate(network[:5], start=1): #the busiest stations
+        print(f"{rank}. {station.station_name} : {station.riders:,}")
+    print() # new line
+
+    if(ask_plot(plot)):
+        if(animate):
+            animate_network_map(period, pivot, labels)
+        else:
+            plot_network_map(period, network, labels)
+
+def read_locations(location_file):
+    """
+    This function reads "latitude,longitude" pairs from a file, one per line.
+    Blank lines and lines that are not two numbers (e.g. a header) are skipped.
+
+    Args:
+        location_file: the path of the file, or - to read from stdin
+
+    Returns:
+        A list of (latitude, longitude) pairs
+    """
+    if(location_file == "-"):
+        lines = sys.stdin
+    else:
+        lines = open(location_file)
+
+    locations = []
+    for line in lines:
+        fields = line.replace(",", " ").split()
+        try:
+            locations.append((float(fields[0]), float(fields[1])))
+        except (IndexError, ValueError):
+            continue
+
+    if(lines is not sys.stdin):
+        lines.close()
+    return locations
+
+def export_ridership(dbConn, user_stations, granularity, output, file_format="csv", date_range=None):
+    """
+    This function exports the ridership series of the given stations (or all stations) to a file.
+
+    Args:
+        dbConn: connection to the CTA database
+        user_stations: a list of station names (wildcards _ and %), empty for every station
+        granularity: "daily", "monthly", "yearly" or "daytype"
+        output: the path of the output file, or - for stdout
+        file_format: "csv" or "jsonl"
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+    """
+    station_ids = None
+    if(len(user_stations) > 0):
+        station_ids = []
+        for user_station in user_stations:
+            matches = api.find_stations(dbConn, user_station)
+            if(len(matches) == 0):
+                print(f"**No station found for {user_station}...", end="\n\n")
+                return
+            station_ids.extend(match.station_id for match in matches if match.station_id not in station_ids)
+
+    count = export.export_series(dbConn, output, granularity, station_ids, date_range, file_format)
+    if(output != "-"):
+        print(f"Exported {count:,} rows to {output}", end="\n\n")
+
+def report_bundles(dbConn, db_file, user_stations, output, user_year=None, processes=1, immutable=False, force=False):
+    """
+    This function writes a report bundle (tables and charts) for each of the given stations
+    (or every station) across a pool of processes, printing the progress.
+
+    Args:
+        dbConn: connection to the CTA database
+        db_file: the path of the CTA database, opened again by each worker
+        user_stations: a list of station names (wildcards _ and %), empty for every station
+        output: the directory to write the bundles to
+        user_year: the year of the monthly ridership, or None for the last year
+        processes: the number of worker processes
+        immutable: promise SQLite the file will not change while the workers run
+        force: write bundles that are already complete again
+    """
+    if(len(user_stations) == 0):
+        user_stations = ["%"]
+    station_list = []
+    for user_station in user_stations:
+        matches = api.find_stations(dbConn, user_station)
+        if(len(matches) == 0):
+            print(f"**No station found for {user_station}...", end="\n\n")
+            return
+        station_list.extend(match for match in matches if match not in station_list)
+
+    if(user_year == None):
+        last_date = api.stats(dbConn).last_date
+        if(last_date == None): #no ridership at all
+            print("**No data found...", end="\n\n")
+            return
+        user_year = last_date[:4]
+
+    def progress(done, total, counts):
+        print(f"  {done:,}/{total:,} stations ({counts['written']:,} written, {counts['skipped']:,} already done)", flush=True)
+
+    print(f"Writing reports for {len(station_list):,} stations to {output}")
+    counts = reports.generate_reports(db_file, station_list, output, user_year, processes, immutable, force, progress)
+    for station_id, error in counts["failed"]:
+        print(f"**Unable to write the report for {station_id}: {error}")
+    print() # new line
+
+def ingest_ridership(dbConn, csv_files, replace=False):
+    """
+    This function loads daily ridership from CSV files and prints what was loaded.
+
+    Args:
+        dbConn: connection to the CTA database
+        csv_files: a list of paths of CSV files
+        replace: replace days already in the database instead of skipping them
+    """
+    try:
+        counts = ingest.ingest_files(dbConn, csv_files, replace)
+    except (OSError, ValueError) as error:
+        print(f"**Unable to read the ridership: {error}", end="\n\n")
+        return
+    except sqlite3.OperationalError as error:
+        print(f"**Unable to write the ridership: {error}", end="\n\n")
+        return
+
+    print(f"Read {counts['read']:,} rows ({counts['invalid']:,} invalid)")
+    print(f"  Inserted: {counts['inserted']:,}")
+    if(replace):
+        print(f"  Replaced: {counts['replaced']:,}")
+    else:
+        print(f"  Skipped (already loaded): {counts['skipped']:,}")
+    print(f"  New stations: {counts['stations']:,}")
+    print() # new line
+
+def open_database(db_file, readonly=False, immutable=False):
+    """
+    This function connects to the CTA database and brings the indexes and rollups up to date.
+    A read-only connection skips that maintenance and uses the rollups only if they are current.
+
+    Args:
+        db_file: the path of the CTA database
+        readonly: open a tuned read-only connection (see database.connect_readonly)
+        immutable: with readonly, promise the file will not change while it is open
+
+    Returns:
+        The connection to the CTA database
+    """
+    if(readonly):
+        return database.connect_readonly(db_file, immutable)
+
+    dbConn = sqlite3.connect(db_file, factory=database.connection_factory,
+                             cached_statements=sql.CACHED_STATEMENTS) #connect to the CTA database
+    try:
+        indexes.ensure_indexes(dbConn) #create any missing indexes the commands need
+    except sqlite3.OperationalError:
+        print("**Unable to create indexes, queries may be slow...", end="\n\n")
+    rollups.maintain_rollups(dbConn) #build or refresh the ridership rollups if the data changed
+    return dbConn
+
+def interactive(dbConn, pool=None):
+    """
+    This function runs the interactive menu until the user enters x.
+
+    Args:
+        dbConn: connection to the CTA database
+        pool: a database.connection_pool for queries that can run in parallel, or None
+    """
+    print('** Welcome to CTA L analysis app **', end="\n\n")
+
+    profiler.set_command("stats")
+    print_stats(dbConn, pool) #print the general statistics
+
+    while True:
+        user_input = input("Please enter a command (1-9, x to exit): ").replace(" ", "")
+        if(user_input == 'x'):
+            break
+
+        profiler.set_command(COMMAND_NAMES.get(user_input, user_input))
+        if(user_input == '1'):
+            print() # new line
+            user_station = input("Enter partial station name (wildcards _ and %): ").replace(" ", "")
+            findStation(dbConn, user_station)
+        elif(user_input == '2'):
+            print() # new line
+            user_station = input("Enter the name of the station you would like to analyze: ")
+            analyze_station_weekStats(dbConn, user_station)
+        elif(user_input == '3'):
+            weekday_ridership(dbConn)
+        elif(user_input == '4'):
+            print() # new line
+            line_accessibility(dbConn)
+        elif(user_input == '5'):
+            number_stops(dbConn)
+        elif(user_input == '6'):
+            print() # new line
+            user_input = input("Enter a station name (wildcards _ and %): ")
+            yearly_ridership(dbConn, user_input)
+        elif(user_input == '7'):
+            print() # new line
+            user_input = input("Enter a station name (wildcards _ and %): ")
+            monthly_ridership(dbConn, user_input)
+        elif(user_input == '8'):
+            print() # new line
+            user_year = input("Year to compare against? ")
+            compare_stats(dbConn, user_year)
+        elif(user_input == '9'):
+            print() # new line
+            stations_nearby(dbConn)
+        else:
+            print("**Error, unknown command, try again...", end="\n\n")
+
+def build_parser():
+    """
+    This function builds the command line parser. Each subcommand mirrors one
+    of the interactive commands, and takes its inputs as arguments instead of prompts.
+
+    Returns:
+        The argparse parser
+    """
+    parser = argparse.ArgumentParser(description="Analyze the CTA L daily ridership data.")
+    parser.add_argument("--db", default=DB_FILE, help=f"path of the CTA database (default {DB_FILE})")
+    parser.add_argument("--readonly", action="store_true", help="open the database read-only (no index or rollup maintenance)")
+    parser.add_argument("--immutable", action="store_true", help="with --readonly, assume nothing writes to the database while it is open")
+    parser.add_argument("--workers", type=int, default=1, help="read-only connections for running independent queries in parallel (default 1)")
+    parser.add_argument("--cache", choices=["off", "memory", "persist"], default="memory",
+                        help="cache query results in memory, or also in a file next to the database (default memory)")
+    parser.add_argument("--profile", action="store_true", help="time every SQL statement and print a report per command at the end")
+    parser.add_argument("--profile-output", help="with --profile, also write the report to this JSON file")
+    parser.add_argument("--save-plots", metavar="DIR", help="write plots to image files in this directory instead of showing them")
+    parser.add_argument("--image-format", choices=render.FORMATS, default="png", help="with --save-plots, the image format (default png)")
+    parser.add_argument("--engine", choices=["sqlite", "numpy"], default="sqlite",
+                        help="answer commands 2, 3, 6, 7 and 8 with SQLite or a NumPy copy of Ridership (default sqlite)")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+
+    subparsers.add_parser("stats", help="print the general statistics")
+
+    subparser = subparsers.add_parser("find", aliases=["1"], help="find stations by name (wildcards _ and %%)")
+    subparser.add_argument("station")
+
+    subparser = subparsers.add_parser("weekstats", aliases=["2"], help="ridership by type of day for a station")
+    subparser.add_argument("station")
+
+    subparsers.add_parser("weekday", aliases=["3"], help="weekday ridership for each station")
+
+    subparser = subparsers.add_parser("range", help="stations' ridership within any date range, by type of day")
+    subparser.add_argument("stations", nargs="+", metavar="station")
+    subparser.add_argument("--year")
+    subparser.add_argument("--start", help="first day (YYYY-MM-DD), instead of --year")
+    subparser.add_argument("--end", help="last day (YYYY-MM-DD), instead of --year")
+    subparser.add_argument("--day-types", default="WAU", help="any of W (weekday), A (Saturday), U (Sunday/holiday) (default WAU)")
+
+    subparser = subparsers.add_parser("rank", help="rank stations by ridership for day types and a date range")
+    subparser.add_argument("--day-types", default="W", help="any of W (weekday), A (Saturday), U (Sunday/holiday), e.g. AU (default W)")
+    subparser.add_argument("--start", help="first day (YYYY-MM-DD)")
+    subparser.add_argument("--end", help="last day (YYYY-MM-DD)")
+    subparser.add_argument("--top", type=int, help="number of stations (default all)")
+
+    subparser = subparsers.add_parser("accessibility", aliases=["4"], help="handicap accessibility of a line's stops")
+    subparser.add_argument("color", nargs="?")
+    subparser.add_argument("direction", nargs="?")
+    subparser.add_argument("--all", action="store_true", help="every line in every direction")
+
+    subparsers.add_parser("stops", aliases=["5"], help="number of stops for each color by direction")
+
+    subparser = subparsers.add_parser("yearly", aliases=["6"], help="yearly ridership for a station (or a pivot of several)")
+    subparser.add_argument("stations", nargs="+", metavar="station")
+    subparser.add_argument("--pivot", action="store_true", help="one row per matching station (implied by several stations)")
+    subparser.add_argument("--plot", action="store_true")
+
+    subparser = subparsers.add_parser("monthly", aliases=["7"], help="monthly ridership for a station (or a pivot of several) in a year")
+    subparser.add_argument("stations", nargs="+", metavar="station")
+    subparser.add_argument("year")
+    subparser.add_argument("--pivot", action="store_true", help="one row per matching station (implied by several stations)")
+    subparser.add_argument("--plot", action="store_true")
+
+    subparser = subparsers.add_parser("compare", aliases=["8"], help="compare stations' daily ridership in a year or date range")
+    subparser.add_argument("stations", nargs="+", metavar="station")
+    subparser.add_argument("--year")
+    subparser.add_argument("--start", help="first day (YYYY-MM-DD), instead of --year")
+    subparser.add_argument("--end", help="last day (YYYY-MM-DD), instead of --year")
+    subparser.add_argument("--plot", action="store_true")
+
+    subparser = subparsers.add_parser("nearby", aliases=["9"], help="stations within a mile of a location")
+    subparser.add_argument("latitude", type=float)
+    subparser.add_argument("longitude", type=float)
+    subparser.add_argument("--radius", type=float, default=1.0, help="radius in miles (default 1)")
+    subparser.add_argument("--plot", action="store_true")
+
+    subparser = subparsers.add_parser("nearest", help="the closest stations to one or many locations")
+    subparser.add_argument("latitude", type=float, nargs="?")
+    subparser.add_argument("longitude", type=float, nargs="?")
+    subparser.add_argument("-k", type=int, default=1, help="number of stations per location (default 1)")
+    subparser.add_argument("--file", help="file of latitude,longitude lines (- for stdin)")
+
+    subparser = subparsers.add_parser("trends", help="rolling averages, year over year change, day-type mix and outlier days of every station")
+    subparser.add_argument("--year", help="year to analyze (default the last year)")
+    subparser.add_argument("--window", type=int, default=28, help="rolling average window in days (default 28)")
+    subparser.add_argument("--threshold", type=float, default=3.0, help="standard deviations that make a day an outlier (default 3)")
+    subparser.add_argument("--top", type=int, help="number of stations to print, busiest first (default all)")
+    subparser.add_argument("--output", help="export the station trends to this file (- for stdout)")
+    subparser.add_argument("--outliers", help="export the outlier days to this file (- for stdout)")
+    subparser.add_argument("--format", choices=export.FORMATS, default="csv")
+    subparser.add_argument("--plot", action="store_true")
+
+    subparser = subparsers.add_parser("heatmap", help="every station on the Chicago map, sized and coloured by ridership")
+    subparser.add_argument("--day-types", default="WAU", help="any of W (weekday), A (Saturday), U (Sunday/holiday) (default WAU)")
+    subparser.add_argument("--year")
+    subparser.add_argument("--start", help="first day (YYYY-MM-DD), instead of --year")
+    subparser.add_argument("--end", help="last day (YYYY-MM-DD), instead of --year")
+    subparser.add_argument("--animate", action="store_true", help="one frame per month, with --plot (a GIF with --save-plots)")
+    subparser.add_argument("--labels", type=int, default=10, help="number of busiest stations to label (default 10)")
+    subparser.add_argument("--plot", action="store_true")
+
+    subparser = subparsers.add_parser("export", help="stream ridership series to CSV or JSON Lines")
+    subparser.add_argument("stations", nargs="*", metavar="station", help="stations to export (default every station)")
+    subparser.add_argument("--granularity", choices=export.GRANULARITIES, default="daily")
+    subparser.add_argument("--start", help="first day (YYYY-MM-DD)")
+    subparser.add_argument("--end", help="last day (YYYY-MM-DD)")
+    subparser.add_argument("--format", choices=export.FORMATS, default="csv")
+    subparser.add_argument("--output", default="-", help="output file (default - for stdout)")
+
+    subparser = subparsers.add_parser("reports", help="write a report bundle (tables and charts) for each station (see reports.py)")
+    subparser.add_argument("stations", nargs="*", metavar="station", help="stations to report on (default every station)")
+    subparser.add_argument("--output", default="reports", help="directory for the bundles (default reports)")
+    subparser.add_argument("--year", help="year of the monthly ridership (default the last year)")
+    subparser.add_argument("--processes", type=int, default=os.cpu_count() or 4, help="worker processes (default one per core)")
+    subparser.add_argument("--force", action="store_true", help="write bundles that are already complete again")
+
+    subparser = subparsers.add_parser("serve", help="answer the commands as JSON over HTTP (see service.py)")
+    subparser.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    subparser.add_argument("--port", type=int, default=8341, help="port to listen on (default 8341)")
+
+    subparser = subparsers.add_parser("ingest", help="append daily ridership from CSV files (see ingest.py)")
+    subparser.add_argument("files", nargs="+", metavar="file")
+    subparser.add_argument("--replace", action="store_true", help="replace days already in the database instead of skipping them")
+
+    subparsers.add_parser("maintain", help="create the indexes and rebuild the rollups and statistics")
+    subparsers.add_parser("explain", help="report command queries that still do full table scans")
+
+    subparser = subparsers.add_parser("batch", help="run one subcommand per line of a file (- for stdin)")
+    subparser.add_argument("file")
+
+    return parser
+
+def run_command(dbConn, args, pool=None):
+    """
+    This function runs one parsed subcommand against an open connection.
+
+    Args:
+        dbConn: connection to the CTA database
+        args: the parsed command line arguments
+        pool: a database.connection_pool for queries that can run in parallel, or None
+    """
+    command = args.command
+    if(command != "batch"):
+        profiler.set_command(COMMAND_NAMES.get(command, command))
+    if(command == "stats"):
+        print_stats(dbConn, pool)
+    elif(command in ("find", "1")):
+        findStation(dbConn, args.station.replace(" ", ""))
+    elif(command in ("weekstats", "2")):
+        analyze_station_weekStats(dbConn, args.station)
+    elif(command in ("weekday", "3")):
         weekday_ridership(dbConn)
-    elif(user_input == '4'):
-        print() # new line
-        line_accessibility(dbConn)
-    elif(user_input == '5'):
+    elif(command == "range"):
+        day_types = [day_type for day_type in ranking.DAY_TYPES if day_type in args.day_types.upper()]
+        if(args.start != None or args.end != None):
+            date_range = queries.date_bounds(args.start or "0001-01-01", args.end or "9998-12-31")
+            period = f"{args.start or 'the start'} to {args.end or 'the end'}"
+        elif(args.year != None):
+            date_range = queries.year_bounds(args.year)
+            period = args.year.strip()
+        else:
+            date_range = None
+        if(date_range == None):
+            print("**Enter a --year or a --start and/or --end date...", end="\n\n")
+        elif(date_range[0] == "" or date_range[0] >= date_range[1]):
+            print("**Enter a valid date range...", end="\n\n")
+        elif(len(day_types) == 0):
+            print("**Enter day types from W, A and U...", end="\n\n")
+        else:
+            range_ridership(dbConn, args.stations, date_range, period, day_types)
+    elif(command == "rank"):
+        day_types = [day_type for day_type in ranking.DAY_TYPES if day_type in args.day_types.upper()]
+        date_range = None
+        if(args.start != None or args.end != None):
+            date_range = queries.date_bounds(args.start or "0001-01-01", args.end or "9998-12-31")
+        if(len(day_types) == 0):
+            print("**Enter day types from W, A and U...", end="\n\n")
+        else:
+            rank_ridership(dbConn, day_types, date_range, args.top)
+    elif(command in ("accessibility", "4")):
+        if(args.all):
+            all_line_accessibility(dbConn)
+        elif(args.color != None and args.direction != None):
+            line_accessibility(dbConn, args.color, args.direction)
+        else:
+            print("**Enter a line color and direction or --all...", end="\n\n")
+    elif(command in ("stops", "5")):
         number_stops(dbConn)
-    elif(user_input == '6'):
-        print() # new line
-        user_input = input("Enter a station name (wildcards _ and %): ")
-        yearly_ridership(dbConn, user_input)
-    elif(user_input == '7'):
-        print() # new line
-        user_input = input("Enter a station name (wildcards _ and %): ")
-        monthly_ridership(dbConn, user_input)
-    elif(user_input == '8'):
-        print() # new line
-        user_year = input("Year to compare against? ")
-        compare_stats(dbConn, user_year)
-    elif(user_input == '9'):
+    elif(command in ("yearly", "6")):
+        if(args.pivot or len(args.stations) > 1):
+            pivot_ridership(dbConn, args.stations, None, args.plot)
+        else:
+            yearly_ridership(dbConn, args.stations[0], args.plot)
+    elif(command in ("monthly", "7")):
+        if(args.pivot or len(args.stations) > 1):
+            pivot_ridership(dbConn, args.stations, args.year, args.plot)
+        else:
+            monthly_ridership(dbConn, args.stations[0], args.year, args.plot)
+    elif(command in ("compare", "8")):
+        if(args.start != None and args.end != None):
+            compare_stats(dbConn, args.year, args.stations, args.plot, queries.date_bounds(args.start, args.end))
+        elif(args.year != None):
+            compare_stats(dbConn, args.year, args.stations, args.plot)
+        else:
+            print("**Enter a --year or a --start and --end date...", end="\n\n")
+    elif(command in ("nearby", "9")):
+        stations_nearby(dbConn, args.latitude, args.longitude, args.plot, args.radius)
+    elif(command == "nearest"):
+        if(args.file != None):
+            nearest_stations(dbConn, read_locations(args.file), args.k)
+        elif(args.latitude != None and args.longitude != None):
+            nearest_stations(dbConn, [(args.latitude, args.longitude)], args.k)
+        else:
+            print("**Enter a latitude and longitude or a file of locations...", end="\n\n")
+    elif(command == "trends"):
+        network_trends(dbConn, args.year, args.window, args.threshold, args.top,
+                       args.output, args.outliers, args.format, args.plot)
+    elif(command == "heatmap"):
+        day_types = [day_type for day_type in ranking.DAY_TYPES if day_type in args.day_types.upper()]
+        date_range = None
+        period = "all years"
+        if(args.start != None or args.end != None):
+            date_range = queries.date_bounds(args.start or "0001-01-01", args.end or "9998-12-31")
+            period = f"{args.start or 'the start'} to {args.end or 'the end'}"
+        elif(args.year != None):
+            date_range = queries.year_bounds(args.year)
+            period = args.year.strip()
+        if(len(day_types) == 0):
+            print("**Enter day types from W, A and U...", end="\n\n")
+        else:
+            network_map(dbConn, day_types, date_range, period, args.animate, args.labels, args.plot)
+    elif(command == "export"):
+        date_range = None
+        if(args.start != None or args.end != None):
+            date_range = queries.date_bounds(args.start or "0001-01-01", args.end or "9998-12-31")
+        export_ridership(dbConn, args.stations, args.granularity, args.output, args.format, date_range)
+    elif(command == "reports"):
+        report_bundles(dbConn, args.db, args.stations, args.output, args.year, args.processes, args.immutable, args.force)
+    elif(command == "serve"):
+        import service #asyncio is slow to import, so only the server loads it
+        service.serve(pool, args.host, args.port)
+    elif(command == "ingest"):
+        ingest_ridership(dbConn, args.files, args.replace)
+    elif(command == "maintain"):
+        try:
+            for name in indexes.ensure_indexes(dbConn):
+                print(f"Created index {name}")
+        except sqlite3.OperationalError:
+            print("**Unable to create indexes...")
+        if(rollups.build_rollups(dbConn)):
+            print("Rollups rebuilt")
+        else:
+            print("**Unable to build the rollups...")
+        rollups.general_stats(dbConn) #refresh the cached statistics
         print() # new line
-        stations_nearby(dbConn)
+    elif(command == "explain"):
+        indexes.print_query_plans(dbConn)
+    elif(command == "batch"):
+        run_batch(dbConn, args.file, pool)
+
+def run_batch(dbConn, batch_file, pool=None):
+    """
+    This function runs one subcommand per line of a file against a single connection.
+    Blank lines and lines starting with # are skipped.
+
+    Args:
+        dbConn: connection to the CTA database
+        batch_file: the path of the file, or - to read from stdin
+        pool: a database.connection_pool for queries that can run in parallel, or None
+    """
+    parser = build_parser()
+    if(batch_file == "-"):
+        lines = sys.stdin
     else:
-        print("**Error, unknown command, try again...", end="\n\n")
+        lines = open(batch_file)
+
+    for line in lines:
+        line = line.strip()
+        if(line == "" or line.startswith("#")):
+            continue
+        try:
+            args = parser.parse_args(shlex.split(line))
+        except SystemExit: #argparse already printed the error
+            continue
+        if(args.command == None or args.command in ("batch", "serve")):
+            print(f"**Error, not a command: {line}", end="\n\n")
+            continue
+        run_command(dbConn, args, pool)
+
+    if(lines is not sys.stdin):
+        lines.close()
 
-dbConn.close()
+##################################################################  
+#
+# main
+#
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if(args.engine == "numpy"):
+        if(columnar.available()):
+            columnar.enabled = True
+        else:
+            print("**NumPy is not installed, using SQLite...", end="\n\n")
+
+    render.output_dir = args.save_plots
+    render.output_format = args.image_format
+
+    cache.enabled = args.cache != "off"
+    cache.persist = args.cache == "persist"
+
+    if(args.profile):
+        profiler.enabled = True
+        database.connection_factory = profiler.profiled_connection
+
+    dbConn = open_database(args.db, args.readonly, args.immutable)
+
+    pool = None
+    if(args.command == "serve"): #the service always answers requests on a pool
+        pool = database.connection_pool(args.db, args.workers if args.workers > 1 else (os.cpu_count() or 4), args.immutable)
+    elif(args.workers > 1):
+        pool = database.connection_pool(args.db, args.workers, args.immutable)
+
+    if(args.command == None):
+        interactive(dbConn, pool)
+    else:
+        run_command(dbConn, args, pool)
+
+    if(pool != None):
+        pool.close()
+    if(args.profile):
+        profiler.report(dbConn, args.profile_output)
+    dbConn.close()
+
+
+if __name__ == "__main__":
+    main()
 #
 # done
-#
\ No newline at end of file
+#
@@ -0,0 +1,301 @@
+"""
+Query profiling for the commands.
+
+With "python main.py --profile ..." every connection is opened as a
+profiled_connection. Its cursors time each statement (execute plus every
+fetch) and count the rows fetched. set_trace_callback records the SQL
+exactly as SQLite ran it, including statements not run through a cursor.
+A progress handler counts the virtual machine instructions each command
+costs. main.py names the command that is running (set_command()), so all
+of this is grouped per command.
+
+When the program ends, report() prints each command's totals and then the
+statements, slowest first. Each statement shows whether its plan reads a
+table without an index (EXPLAIN QUERY PLAN, see indexes.full_scans). The
+report also lists how many times each named statement of sql.py ran, and
+the statements one command ran more than once with the same parameters.
+--profile-output FILE also writes the data as JSON.
+"""
+
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import indexes
+import sql
+
+
+PROGRESS_STEPS = 1000 #virtual machine instructions between progress handler calls
+SQL_WIDTH = 90 #characters of SQL shown in the report
+
+enabled = False #set by main.py in --profile mode
+lock = threading.Lock() #pooled connections record from several threads
+current_command = "(startup)"
+invocation = 0 #counts set_command() calls, so each run of a command is told apart
+
+commands = {} #command -> {"runs", "statements", "ms", "rows", "steps"}
+statements = {} #(command, SQL) -> {"calls", "ms", "rows", "parameters"}
+traced = {} #(invocation, command, expanded SQL) -> number of times run
+
+
+def compact(sql_query):
+    """
+    This function collapses the whitespace of a statement.
+
+    Args:
+        sql_query: the SQL
+
+    Returns:
+        The SQL on one line
+    """
+    return re.sub(r"\s+", " ", sql_query).strip()
+
+def command_totals(command):
+    """
+    This function finds (creating if needed) the totals of a command. Call with the lock held.
+
+    Args:
+        command: the command name
+
+    Returns:
+        The dictionary of totals
+    """
+    return commands.setdefault(command, {"runs": 0, "statements": 0, "ms": 0.0, "rows": 0, "steps": 0})
+
+def set_command(command):
+    """
+    This function starts a run of a command; statements from now on count towards it.
+
+    Args:
+        command: the command name (e.g. "yearly")
+    """
+    global current_command, invocation
+    if(not enabled):
+        return
+    with lock:
+        current_command = command
+        invocation += 1
+        command_totals(command)["runs"] += 1
+
+def record(sql_query, parameters, elapsed, rows, new_statement):
+    """
+    This function adds the time and rows of a statement to the profile.
+
+    Args:
+        sql_query: the SQL as passed to execute()
+        parameters: the parameters of the statement
+        elapsed: seconds spent in execute() or a fetch
+        rows: the number of rows fetched
+        new_statement: True for execute(), False for a later fetch of the same statement
+    """
+    if(not enabled):
+        return
+    with lock:
+        key = (current_command, compact(sql_query))
+        statement = statements.setdefault(key, {"calls": 0, "ms": 0.0, "rows": 0, "parameters": parameters})
+        totals = command_totals(current_command)
+        if(new_statement):
+            statement["calls"] += 1
+            totals["statements"] += 1
+        statement["ms"] += elapsed * 1000
+        statement["rows"] += rows
+        totals["ms"] += elapsed * 1000
+        totals["rows"] += rows
+
+def trace(sql_query):
+    """
+    This function is the trace callback: it counts each statement SQLite starts,
+    with its parameters filled in, to find repeated statements.
+
+    Args:
+        sql_query: the expanded SQL
+    """
+    with lock:
+        key = (invocation, current_command, compact(sql_query))
+        traced[key] = traced.get(key, 0) + 1
+
+def progress():
+    """
+    This function is the progress handler: it counts virtual machine instructions.
+
+    Returns:
+        0, so the statement keeps running
+    """
+    with lock:
+        command_totals(current_command)["steps"] += PROGRESS_STEPS
+    return 0
+
+
+class profiled_cursor(sqlite3.Cursor):
+    """
+    A cursor that times its statements and counts the rows they return.
+    """
+    def execute(self, sql_query, parameters=()):
+        self.profile_sql = sql_query
+        self.profile_parameters = parameters
+        start = time.perf_counter()
+        try:
+            return super().execute(sql_query, parameters)
+        finally:
+            record(sql_query, self.profile_parameters, time.perf_counter() - start, 0, True)
+
+    def executemany(self, sql_query, seq_of_parameters):
+        self.profile_sql = sql_query
+        self.profile_parameters = []
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql_query, seq_of_parameters)
+        finally:
+            record(sql_query, [], time.perf_counter() - start, 0, True)
+
+    def fetched(self, start, rows):
+        if(getattr(self, "profile_sql", None) != None):
+            record(self.profile_sql, self.profile_parameters, time.perf_counter() - start, rows, False)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(start, 0 if row == None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size == None else size)
+        self.fetched(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.fetched(start, 0)
+            raise
+        self.fetched(start, 1)
+        return row
+
+class profiled_connection(sqlite3.Connection):
+    """
+    A connection whose cursors are profiled_cursors, with the trace callback
+    and progress handler installed.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(trace)
+        self.set_progress_handler(progress, PROGRESS_STEPS)
+
+    def cursor(self, factory=profiled_cursor):
+        return super().cursor(factory)
+
+    def execute(self, sql_query, parameters=()):
+        return self.cursor().execute(sql_query, parameters)
+
+    def executemany(self, sql_query, seq_of_parameters):
+        return self.cursor().executemany(sql_query, seq_of_parameters)
+
+
+def uses_index(dbConn, sql_query, parameters):
+    """
+    This function checks whether a statement reads every table through an index.
+
+    Args:
+        dbConn: connection to the CTA database
+        sql_query: the statement
+        parameters: parameters it ran with
+
+    Returns:
+        "yes", "no (SCAN ...)" or "-" for statements that are not queries
+    """
+    if(not re.match(r"\s*(select|with)\b", sql_query, re.IGNORECASE)):
+        return "-"
+    try:
+        scans = indexes.full_scans(dbConn, sql_query, parameters)
+    except sqlite3.Error:
+        return "-"
+    if(len(scans) == 0):
+        return "yes"
+    return f"no ({'; '.join(scans)})"
+
+def duplicates():
+    """
+    This function finds the statements run more than once, with the same parameters,
+    by one run of a command.
+
+    Returns:
+        A list of (command, number of times run, expanded SQL) tuples, most repeated first
+    """
+    repeated = [(command, count, sql_query) for (number, command, sql_query), count in traced.items()
+                if(count > 1 and not sql_query.lower().startswith("pragma"))]
+    repeated.sort(key=lambda row: (-row[1], row[0], row[2]))
+    return repeated
+
+def report(dbConn, output=None, file=sys.stderr):
+    """
+    This function prints the profile, and optionally writes it to a JSON file.
+
+    Args:
+        dbConn: connection to the CTA database, used to check the query plans
+        output: the path of the JSON file, or None
+        file: where to print the report
+    """
+    global enabled
+    enabled = False #don't profile the EXPLAINs
+    dbConn.set_trace_callback(None)
+    dbConn.set_progress_handler(None, 0)
+
+    with lock:
+        command_rows = sorted(commands.items(), key=lambda row: -row[1]["ms"])
+        statement_rows = sorted(statements.items(), key=lambda row: -row[1]["ms"])
+        repeated = duplicates()
+    executions = sql.execution_counts()
+
+    print("Profile by command", file=file)
+    print(f"  {'command':<14} {'runs':>5} {'statements':>10} {'ms':>10} {'rows':>10} {'vm steps':>12}", file=file)
+    for command, totals in command_rows:
+        print(f"  {command:<14} {totals['runs']:>5} {totals['statements']:>10} {totals['ms']:>10.2f} "
+              f"{totals['rows']:>10,} {totals['steps']:>12,}", file=file)
+    print(file=file) # new line
+
+    print("Statements, slowest first", file=file)
+    plans = []
+    for (command, sql_query), statement in statement_rows:
+        index = uses_index(dbConn, sql_query, statement["parameters"])
+        plans.append(index)
+        text = sql_query if len(sql_query) <= SQL_WIDTH else sql_query[:SQL_WIDTH - 3] + "..."
+        print(f"  {command:<14} {statement['calls']:>5} calls {statement['ms']:>10.2f} ms {statement['rows']:>10,} rows"
+              f"  index: {index}", file=file)
+        print(f"      {text}", file=file)
+    print(file=file) # new line
+
+    print("Runs by statement name (sql.py)", file=file)
+    for name, runs in executions:
+        print(f"  {name:<32} {runs:>8,}", file=file)
+    print(file=file) # new line
+
+    if(len(repeated) > 0):
+        print("Repeated statements (same parameters, same run of a command)", file=file)
+        for command, count, sql_query in repeated:
+            text = sql_query if len(sql_query) <= SQL_WIDTH else sql_query[:SQL_WIDTH - 3] + "..."
+            print(f"  {command:<14} {count:>5}x {text}", file=file)
+        print(file=file) # new line
+
+    if(output != None):
+        data = {
+            "commands": {command: totals for command, totals in command_rows},
+            "statements": [dict(command=command, sql=sql_query, index=index,
+                                **{name: value for name, value in statement.items() if name != "parameters"})
+                           for ((command, sql_query), statement), index in zip(statement_rows, plans)],
+            "repeated": [{"command": command, "count": count, "sql": sql_query} for command, count, sql_query in repeated],
+            "executions": dict(executions),
+        }
+        with open(output, "w") as json_file:
+            json.dump(data, json_file, indent=2)
@@ -0,0 +1,345 @@
+"""
+Ridership queries shared by the commands in main.py and the HTTP service.
+
+Each function answers one question about one or more stations and returns
+the rows, without printing anything. Answers are looked up in the result
+cache first (see cache.py). Otherwise they come from the NumPy columns when
+that engine is enabled, from the rollups when they are current, and from
+the Ridership table otherwise. The SQL statements are in sql.py.
+"""
+
+import datetime
+
+import cache
+import columnar
+import ranking
+import rollups
+import sql
+
+
+def year_bounds(year):
+    """
+    This function converts a year into a half-open date range, so queries can filter
+    with Ride_Date >= start And Ride_Date < end (which can use an index on Ride_Date)
+    instead of calling strftime on every row.
+
+    Args:
+        year: the year as entered by the user (e.g. "2020")
+
+    Returns:
+        A tuple with the first day of the year and the first day of the next year
+        ("", "") if the year is not a number, which matches no rows
+    """
+    year = year.strip()
+    if(not year.isdigit()):
+        return ("", "")
+    return (f"{int(year):04d}-01-01", f"{int(year) + 1:04d}-01-01")
+
+def date_bounds(first_day, last_day):
+    """
+    This function converts an inclusive range of days into a half-open date range,
+    like year_bounds does for a year.
+
+    Args:
+        first_day: the first day (YYYY-MM-DD)
+        last_day: the last day (YYYY-MM-DD)
+
+    Returns:
+        A tuple with the first day and the day after the last day
+        ("", "") if either day is not a valid date, which matches no rows
+    """
+    try:
+        first_day = datetime.date.fromisoformat(first_day.strip())
+        last_day = datetime.date.fromisoformat(last_day.strip())
+    except ValueError:
+        return ("", "")
+    return (first_day.isoformat(), (last_day + datetime.timedelta(days=1)).isoformat())
+
+def last_day(date_range):
+    """
+    This function finds the last day of a half-open date range, for headings.
+
+    Args:
+        date_range: a (first day, day after the last day) tuple
+
+    Returns:
+        The last day (YYYY-MM-DD)
+    """
+    return (datetime.date.fromisoformat(date_range[1]) - datetime.timedelta(days=1)).isoformat()
+
+def day_type_totals(dbConn, station_id):
+    """
+    This function finds the ridership of a station for each type of day (command 2).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_id: the Station_ID
+
+    Returns:
+        A dictionary mapping 'W', 'A' and 'U' to the number of riders,
+        empty if the station has no ridership
+    """
+    return cache.cached(dbConn, "day_type_totals", (station_id,), lambda: query_day_type_totals(dbConn, station_id))
+
+def query_day_type_totals(dbConn, station_id):
+    """
+    This function runs the query behind day_type_totals() without the result cache.
+    """
+    columns = columnar.get_columns(dbConn)
+    if(columns != None):
+        return columns.day_type_totals(station_id)
+
+    name = "day_types_rollup" if rollups.rollups_current(dbConn) else "day_types"
+    return dict(sql.execute(dbConn, name, [station_id]).fetchall())
+
+def station_position(dbConn, station_id):
+    """
+    This function finds where a station is, as the middle of its stops. Stops is
+    small, so this is not cached.
+
+    Args:
+        dbConn: connection to the CTA database
+        station_id: the Station_ID
+
+    Returns:
+        A (latitude, longitude) tuple, or None if the station has no stops
+    """
+    row = sql.execute(dbConn, "station_position", [station_id]).fetchone()
+    if(row == None or row[0] == None):
+        return None
+    return row
+
+def range_totals(dbConn, station_id, date_range):
+    """
+    This function finds the ridership of a station within any date range, for each type
+    of day. The NumPy columns and the prefix-sum index (see rollups.py) both answer it
+    with two lookups per type of day however long the range is, so this is not cached.
+
+    Args:
+        dbConn: connection to the CTA database
+        station_id: the Station_ID
+        date_range: a (first day, day after the last day) tuple
+
+    Returns:
+        A dictionary mapping 'W', 'A' and 'U' to a (number of riders, number of days) tuple,
+        with (0, 0) for a type of day without ridership in the range
+    """
+    range_start, range_end = date_range
+    totals = {}
+    if(range_start >= range_end): #an empty (or invalid) range
+        for day_type in columnar.DAY_TYPES:
+            totals[day_type] = (0, 0)
+        return totals
+
+    columns = columnar.get_columns(dbConn)
+    if(columns != None):
+        return columns.range_totals(station_id, *columnar.day_range(range_start, range_end))
+
+    if(rollups.cumulative_current(dbConn)):
+        for day_type in columnar.DAY_TYPES:
+            end = sql.execute(dbConn, "cumulative_before", [station_id, day_type, range_end]).fetchone() or (0, 0)
+            start = sql.execute(dbConn, "cumulative_before", [station_id, day_type, range_start]).fetchone() or (0, 0)
+            totals[day_type] = (end[0] - start[0], end[1] - start[1])
+        return totals
+
+    for day_type in columnar.DAY_TYPES:
+        totals[day_type] = (0, 0)
+    for day_type, riders, days in sql.execute(dbConn, "range_totals", [station_id, range_start, range_end]).fetchall():
+        totals[day_type] = (riders, days)
+    return totals
+
+def yearly(dbConn, station_id):
+    """
+    This function finds the ridership of a station for each year (command 6).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_id: the Station_ID
+
+    Returns:
+        A list of ("YYYY", number of riders) tuples sorted by year
+    """
+    return cache.cached(dbConn, "yearly", (station_id,), lambda: query_yearly(dbConn, station_id))
+
+def query_yearly(dbConn, station_id):
+    """
+    This function runs the query behind yearly() without the result cache.
+    """
+    columns = columnar.get_columns(dbConn)
+    if(columns != None):
+        return columns.yearly(station_id)
+
+    #use the yearly rollup if it is up to date
+    name = "yearly_rollup" if rollups.rollups_current(dbConn) else "yearly"
+    return sql.execute(dbConn, name, [station_id]).fetchall()
+
+def monthly(dbConn, station_id, year):
+    """
+    This function finds the ridership of a station for each month of a year (command 7).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_id: the Station_ID
+        year: the year (e.g. "2020")
+
+    Returns:
+        A list of ("MM/YYYY", number of riders) tuples sorted by month
+    """
+    return cache.cached(dbConn, "monthly", (station_id, year.strip()), lambda: query_monthly(dbConn, station_id, year.strip()))
+
+def query_monthly(dbConn, station_id, year):
+    """
+    This function runs the query behind monthly() without the result cache.
+    """
+    columns = columnar.get_columns(dbConn)
+    if(columns != None):
+        return columns.monthly(station_id, *columnar.day_range(*year_bounds(year)))
+
+    #use the monthly rollup if it is up to date
+    if(rollups.rollups_current(dbConn)):
+        dbCursor = sql.execute(dbConn, "monthly_rollup", [station_id, year])
+    else:
+        dbCursor = sql.execute(dbConn, "monthly", [station_id, *year_bounds(year)])
+    return dbCursor.fetchall()
+
+def daily(dbConn, station_ids, date_range):
+    """
+    This function finds the daily ridership of one or more stations within a date range
+    (command 8). All of the stations are fetched with one grouped query.
+
+    Args:
+        dbConn: connection to the CTA database
+        station_ids: a list of Station_IDs
+        date_range: a (first day, day after the last day) tuple
+
+    Returns:
+        A dictionary mapping each Station_ID to a list of ("YYYY-MM-DD", number of riders)
+        tuples sorted by day
+    """
+    return cache.cached(dbConn, "daily", (tuple(station_ids), tuple(date_range)), lambda: query_daily(dbConn, station_ids, date_range))
+
+def query_daily(dbConn, station_ids, date_range):
+    """
+    This function runs the query behind daily() without the result cache.
+    """
+    range_start, range_end = date_range
+
+    rows_by_station = {} #maps the station id to its list of (date, riders)
+    for station_id in station_ids:
+        rows_by_station[station_id] = []
+
+    columns = columnar.get_columns(dbConn)
+    if(columns != None):
+        first_day, end_day = columnar.day_range(range_start, range_end)
+        for station_id in rows_by_station:
+            rows_by_station[station_id] = columns.daily(station_id, first_day, end_day)
+        return rows_by_station
+
+    dbCursor = sql.execute(dbConn, "daily", [*rows_by_station, range_start, range_end], len(rows_by_station))
+    for row in dbCursor.fetchall():
+        rows_by_station[row[0]].append((row[1], row[2]))
+    return rows_by_station
+
+def yearly_pivot(dbConn, station_ids):
+    """
+    This function finds the ridership of several stations for each year, all with one
+    grouped query (the pivot mode of command 6).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_ids: a list of Station_IDs
+
+    Returns:
+        A dictionary mapping each Station_ID to a list of ("YYYY", number of riders)
+        tuples sorted by year
+    """
+    return cache.cached(dbConn, "yearly_pivot", tuple(station_ids), lambda: query_yearly_pivot(dbConn, station_ids))
+
+def query_yearly_pivot(dbConn, station_ids):
+    """
+    This function runs the query behind yearly_pivot() without the result cache.
+    """
+    rows_by_station = {station_id: [] for station_id in station_ids}
+
+    columns = columnar.get_columns(dbConn)
+    if(columns != None):
+        for station_id in rows_by_station:
+            rows_by_station[station_id] = columns.yearly(station_id)
+        return rows_by_station
+
+    name = "yearly_pivot_rollup" if rollups.rollups_current(dbConn) else "yearly_pivot"
+    dbCursor = sql.execute(dbConn, name, list(rows_by_station), len(rows_by_station))
+    for row in dbCursor.fetchall():
+        rows_by_station[row[0]].append((row[1], row[2]))
+    return rows_by_station
+
+def monthly_pivot(dbConn, station_ids, year):
+    """
+    This function finds the ridership of several stations for each month of a year, all
+    with one grouped query (the pivot mode of command 7).
+
+    Args:
+        dbConn: connection to the CTA database
+        station_ids: a list of Station_IDs
+        year: the year (e.g. "2020")
+
+    Returns:
+        A dictionary mapping each Station_ID to a list of ("MM/YYYY", number of riders)
+        tuples sorted by month
+    """
+    return cache.cached(dbConn, "monthly_pivot", (tuple(station_ids), year.strip()),
+                        lambda: query_monthly_pivot(dbConn, station_ids, year.strip()))
+
+def query_monthly_pivot(dbConn, station_ids, year):
+    """
+    This function runs the query behind monthly_pivot() without the result cache.
+    """
+    rows_by_station = {station_id: [] for station_id in station_ids}
+
+    columns = columnar.get_columns(dbConn)
+    if(columns != None):
+        first_day, end_day = columnar.day_range(*year_bounds(year))
+        for station_id in rows_by_station:
+            rows_by_station[station_id] = columns.monthly(station_id, first_day, end_day)
+        return rows_by_station
+
+    if(rollups.rollups_current(dbConn)):
+        dbCursor = sql.execute(dbConn, "monthly_pivot_rollup", [*rows_by_station, year], len(rows_by_station))
+    else:
+        dbCursor = sql.execute(dbConn, "monthly_pivot", [*rows_by_station, *year_bounds(year)], len(rows_by_station))
+    for row in dbCursor.fetchall():
+        rows_by_station[row[0]].append((row[1], row[2]))
+    return rows_by_station
+
+def network_months(dbConn, day_types, date_range):
+    """
+    This function finds the ridership of every station for each month of a date range,
+    all with one grouped query (the month by month network map).
+
+    Args:
+        dbConn: connection to the CTA database
+        day_types: a list of day types ('W', 'A', 'U')
+        date_range: a (first day, day after the last day) tuple
+
+    Returns:
+        A dictionary mapping each Station_ID to a list of ("YYYY-MM", number of riders)
+        tuples sorted by month
+    """
+    return cache.cached(dbConn, "network_months", (tuple(day_types), tuple(date_range)),
+                        lambda: query_network_months(dbConn, day_types, date_range))
+
+def query_network_months(dbConn, day_types, date_range):
+    """
+    This function runs the query behind network_months() without the result cache.
+    """
+    #the monthly rollup answers ranges of whole months
+    months = ranking.month_range(date_range)
+    if(rollups.rollups_current(dbConn) and months != None):
+        dbCursor = sql.execute(dbConn, "network_months_rollup", [*day_types, *months], len(day_types))
+    else:
+        dbCursor = sql.execute(dbConn, "network_months", [*day_types, *date_range], len(day_types))
+
+    rows_by_station = {}
+    for station_id, month, riders in dbCursor.fetchall():
+        rows_by_station.setdefault(station_id, []).append((month, riders))
+    return rows_by_station
@@ -0,0 +1,87 @@
+"""
+Station ranking by total ridership.
+
+rank_stations() ranks the stations by their total ridership for any set of
+day types and any date range, along with each station's share of the total,
+in a single query: the per-station totals are grouped once and the share
+comes from a SUM(...) OVER () window over those totals. The full history
+and whole-month ranges are answered from the rollups when they are current,
+anything else from Ridership. The rows are streamed rather than fetched all
+at once.
+"""
+
+import database
+import rollups
+import sql
+
+
+DAY_TYPES = ("W", "A", "U")
+
+
+def month_range(date_range):
+    """
+    This function checks if a date range covers whole months.
+
+    Args:
+        date_range: a (first day, day after the last day) tuple
+
+    Returns:
+        A ("YYYY-MM", "YYYY-MM") tuple with the first month and the month after the last,
+        or None if the range does not start and end on the first of a month
+    """
+    range_start, range_end = date_range
+    if(range_start[8:10] != "01" or range_end[8:10] != "01"):
+        return None
+    return (range_start[:7], range_end[:7])
+
+def ranking_query(dbConn, day_types, date_range=None, top=None):
+    """
+    This function picks the ranking statement (see sql.py) and its parameters.
+
+    Args:
+        dbConn: connection to the CTA database
+        day_types: a list of day types ('W', 'A', 'U')
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+        top: the number of stations to return, or None for every station
+
+    Returns:
+        A tuple with the statement name and its parameters. The statement returns
+        Station_ID, the number of riders and the percentage of the total
+    """
+    parameters = list(day_types)
+
+    months = None
+    if(date_range != None):
+        months = month_range(date_range)
+
+    if(rollups.rollups_current(dbConn) and date_range == None):
+        name = "ranking_rollup"
+    elif(rollups.rollups_current(dbConn) and months != None):
+        name = "ranking_months_rollup"
+        parameters.extend(months)
+    elif(date_range != None):
+        name = "ranking_range"
+        parameters.extend(date_range)
+    else:
+        name = "ranking"
+
+    parameters.append(-1 if top == None else top) #a negative limit means no limit
+    return (name, parameters)
+
+def rank_stations(dbConn, day_types=("W",), date_range=None, top=None):
+    """
+    This function ranks the stations by total ridership.
+
+    Args:
+        dbConn: connection to the CTA database
+        day_types: a list of day types ('W', 'A', 'U')
+        date_range: a (first day, day after the last day) tuple, or None for the full history
+        top: the number of stations to return, or None for every station
+
+    Returns:
+        A generator of (Station_ID, number of riders, percentage of the total) tuples,
+        highest ridership first
+    """
+    name, parameters = ranking_query(dbConn, day_types, date_range, top)
+    dbCursor = sql.execute(dbConn, name, parameters, len(day_types))
+    yield from database.stream_rows(dbCursor)
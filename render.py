@@ -0,0 +1,358 @@
+"""
+Chart rendering for the commands.
+
+Every chart goes through new_figure() and finish(). By default finish()
+shows the chart in a window, as before. With "python main.py --save-plots DIR"
+matplotlib runs headless (the Agg backend) and each chart is written to DIR
+as a PNG or SVG file (--image-format) named after its title, so batch runs
+can render thousands of charts without a display.
+
+The rendering work that does not depend on the data is done once:
+
+    one figure is reused for every chart (cleared instead of recreated)
+    the Chicago basemap is decoded from chicago.png once per session
+    the station markers of a map are one scatter call, not one plot per station
+
+The network heatmap is also a single scatter, with the size and colour of
+each marker set from arrays; its animation changes only those arrays from
+frame to frame.
+
+Long series (e.g. a multi-year daily comparison) are downsampled to the
+width of the figure in pixels before plotting. Each pixel column keeps the
+smallest and largest value of its points, so peaks and dips stay visible.
+"""
+
+import os
+import re
+
+
+BASEMAP_FILE = "chicago.png"
+BASEMAP_EXTENT = [-87.9277, -87.5569, 41.7012, 42.0868] #longitude and latitude of the image edges
+FIGURE_NUMBER = "render" #the figure every chart is drawn on
+FORMATS = ("png", "svg")
+ANIMATION_FORMAT = "gif" #animations are written with Pillow whatever --image-format says
+FRAME_MS = 500 #time each frame of an animation is shown
+HEATMAP_AREA = 300 #marker area (points squared) of the busiest station on a heatmap
+HEATMAP_COLORS = "plasma"
+
+output_dir = None #set by main.py (--save-plots), None to show the charts in a window
+output_format = "png" #set by main.py (--image-format)
+headless = False #set by reports.py, whose charts are always saved to files
+
+basemaps = {} #path -> decoded image
+written = {} #file name -> number of charts written with that name
+
+
+def get_pyplot():
+    """
+    This function imports matplotlib the first time a plot is requested,
+    so commands that never plot don't pay for the import. Charts written
+    to files use the Agg backend, which needs no display.
+
+    Returns:
+        The matplotlib.pyplot module
+    """
+    if(output_dir != None or headless):
+        import matplotlib
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
+
+def get_numpy():
+    """
+    This function imports NumPy the first time a long series is downsampled,
+    next to the matplotlib import, so commands that never plot don't pay for it.
+
+    Returns:
+        The numpy module, or None if it is not installed
+    """
+    try:
+        import numpy
+    except ImportError: #downsample() falls back to plain Python
+        return None
+    return numpy
+
+def new_figure():
+    """
+    This function clears the shared figure for a new chart.
+
+    Returns:
+        The matplotlib.pyplot module, drawing on the cleared figure
+    """
+    plt = get_pyplot()
+    plt.figure(FIGURE_NUMBER)
+    plt.clf()
+    return plt
+
+def get_basemap(path=BASEMAP_FILE):
+    """
+    This function decodes a map image the first time it is needed and reuses it afterwards.
+
+    Args:
+        path: the path of the image
+
+    Returns:
+        The image as an array
+    """
+    image = basemaps.get(path)
+    if(image is None):
+        image = get_pyplot().imread(path)
+        basemaps[path] = image
+    return image
+
+def figure_width():
+    """
+    This function finds the width of the figure in pixels.
+
+    Returns:
+        The width in pixels
+    """
+    figure = get_pyplot().figure(FIGURE_NUMBER)
+    return int(figure.get_figwidth() * figure.get_dpi())
+
+def downsample(x_coords, y_coords, width=None):
+    """
+    This function reduces a series to at most two points per pixel column, keeping the
+    smallest and largest value of each column in their original order. Short series are
+    returned as they are.
+
+    Args:
+        x_coords: the x values
+        y_coords: the y values (numbers)
+        width: the number of pixel columns, or None for the width of the figure
+
+    Returns:
+        A tuple with the x values and the y values to plot
+    """
+    if(width == None):
+        width = figure_width()
+    count = len(y_coords)
+    if(width <= 0 or count <= 2 * width):
+        return (x_coords, y_coords)
+
+    #the points of column n are [bounds[n], bounds[n + 1])
+    bounds = [count * number // width for number in range(width + 1)]
+
+    np = get_numpy()
+    if(np != None):
+        values = np.asarray(y_coords, dtype=float)
+        starts = np.array(bounds[:-1])
+        lowest = np.minimum.reduceat(values, starts)
+        highest = np.maximum.reduceat(values, starts)
+        #the first point of each column holding its lowest and highest value
+        column = np.repeat(np.arange(width), np.diff(bounds))
+        positions = np.arange(count)
+        low_at = np.full(width, count)
+        high_at = np.full(width, count)
+        np.minimum.at(low_at, column, np.where(values == lowest[column], positions, count))
+        np.minimum.at(high_at, column, np.where(values == highest[column], positions, count))
+        keep = np.unique(np.concatenate([low_at, high_at]))
+        keep = keep[keep < count].tolist() #a column of NaNs has no lowest or highest point
+    else:
+        keep = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            column = range(start, end)
+            low = min(column, key=lambda position: y_coords[position])
+            high = max(column, key=lambda position: y_coords[position])
+            keep.extend(sorted({low, high}))
+
+    return ([x_coords[position] for position in keep], [y_coords[position] for position in keep])
+
+def plot_map(station_names, latitudes, longitudes):
+    """
+    This function draws stations on the Chicago basemap: one scatter for the markers
+    and a label for each station.
+
+    Args:
+        station_names: the names of the stations
+        latitudes: the latitudes of the stations
+        longitudes: the longitudes of the stations
+
+    Returns:
+        The matplotlib.pyplot module, drawing on the map
+    """
+    plt = new_figure()
+    plt.imshow(get_basemap(), extent=BASEMAP_EXTENT)
+    plt.scatter(longitudes, latitudes, c="b") #plot the stations
+    for station_name, latitude, longitude in zip(station_names, latitudes, longitudes):
+        plt.text(longitude, latitude, station_name) #label the stations
+    plt.xlim(BASEMAP_EXTENT[:2])
+    plt.ylim(BASEMAP_EXTENT[2:])
+    return plt
+
+def heatmap_markers(values, largest):
+    """
+    This function scales values to marker areas, so the area of a marker is
+    proportional to its value.
+
+    Args:
+        values: the values (e.g. riders)
+        largest: the value that gets HEATMAP_AREA
+
+    Returns:
+        A list of marker areas
+    """
+    if(largest <= 0):
+        return [0 for value in values]
+    return [HEATMAP_AREA * value / largest for value in values]
+
+def plot_heatmap(title, station_names, latitudes, longitudes, values, labels=10, largest=None):
+    """
+    This function draws stations on the Chicago basemap with the size and colour of each
+    marker showing its value, as one scatter. Only the stations with the largest values
+    are labelled, so the map stays readable.
+
+    Args:
+        title: the title of the chart
+        station_names: the names of the stations
+        latitudes: the latitudes of the stations
+        longitudes: the longitudes of the stations
+        values: the value of each station (e.g. riders)
+        labels: the number of stations to label
+        largest: the value of the largest marker and the top of the colour scale,
+                 or None for the largest value
+
+    Returns:
+        A tuple with the matplotlib.pyplot module, drawing on the map, and the scatter
+    """
+    if(largest == None):
+        largest = max(values, default=0)
+    plt = new_figure()
+    plt.imshow(get_basemap(), extent=BASEMAP_EXTENT)
+    scatter = plt.scatter(longitudes, latitudes, s=heatmap_markers(values, largest), c=values,
+                          cmap=HEATMAP_COLORS, vmin=0, vmax=max(largest, 1), alpha=0.75, edgecolors="k", linewidths=0.3)
+    plt.colorbar(scatter, label="Riders")
+    ranked = sorted(range(len(values)), key=lambda number: -values[number])
+    for number in ranked[:labels]:
+        plt.text(longitudes[number], latitudes[number], station_names[number], fontsize=7) #label the busiest stations
+    plt.xlim(BASEMAP_EXTENT[:2])
+    plt.ylim(BASEMAP_EXTENT[2:])
+    plt.title(title)
+    return (plt, scatter)
+
+def animate_heatmap(title, station_names, latitudes, longitudes, frame_titles, frames, labels=10):
+    """
+    This function animates a heatmap: one frame per set of values, on the same markers
+    and the same scale, so the frames can be compared.
+
+    Args:
+        title: the title of the first frame
+        station_names: the names of the stations
+        latitudes: the latitudes of the stations
+        longitudes: the longitudes of the stations
+        frame_titles: the title of each frame
+        frames: the values of each frame, one list per frame in station order
+        labels: the number of stations to label (the largest in any frame)
+
+    Returns:
+        The matplotlib animation
+    """
+    import matplotlib.animation
+
+    largest = max((max(values, default=0) for values in frames), default=0)
+    peaks = [max(column, default=0) for column in zip(*frames)] #each station's busiest frame, for the labels
+    plt, scatter = plot_heatmap(title, station_names, latitudes, longitudes, peaks, labels, largest)
+    axes = plt.gca()
+
+    def draw(number):
+        scatter.set_sizes(heatmap_markers(frames[number], largest))
+        scatter.set_array(frames[number])
+        axes.set_title(frame_titles[number])
+        return (scatter,)
+
+    draw(0)
+    return matplotlib.animation.FuncAnimation(plt.gcf(), draw, frames=len(frames), interval=FRAME_MS)
+
+def plot_lines(title, x_label, y_label, series):
+    """
+    This function draws a line chart with one line per series, downsampling long series.
+
+    Args:
+        title: the title of the chart
+        x_label: the label of the x axis
+        y_label: the label of the y axis
+        series: a list of (label, x values, y values) tuples, label None for no legend entry
+
+    Returns:
+        The matplotlib.pyplot module, drawing on the chart
+    """
+    plt = new_figure()
+    plt.xlabel(x_label)
+    plt.ylabel(y_label)
+    plt.title(title)
+    for label, x_coords, y_coords in series:
+        plt.plot(*downsample(x_coords, y_coords), label=label)
+    if(any(label != None for label, x_coords, y_coords in series)):
+        plt.legend()
+    return plt
+
+def save(path):
+    """
+    This function writes the chart to a file, in the format its extension names.
+
+    Args:
+        path: the path of the file (.png or .svg)
+    """
+    get_pyplot().savefig(path)
+
+def file_name(title, extension=None):
+    """
+    This function builds a file name for a chart from its title, numbering repeats.
+
+    Args:
+        title: the title of the chart
+        extension: the file extension, or None for output_format
+
+    Returns:
+        The path of the file in output_dir
+    """
+    name = re.sub(r"[^A-Za-z0-9]+", "-", title).strip("-").lower() or "chart"
+    written[name] = written.get(name, 0) + 1
+    if(written[name] > 1):
+        name = f"{name}-{written[name]}"
+    return os.path.join(output_dir, f"{name}.{extension or output_format}")
+
+def finish(title):
+    """
+    This function shows the chart, or writes it to a file in output_dir.
+
+    Args:
+        title: the title of the chart, used to name the file
+
+    Returns:
+        The path of the file written, or None if the chart was shown
+    """
+    plt = get_pyplot()
+    if(output_dir == None):
+        plt.ioff()
+        plt.show()
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = file_name(title)
+    save(path)
+    return path
+
+def finish_animation(animation, title):
+    """
+    This function shows the animation, or writes it to a GIF file in output_dir.
+
+    Args:
+        animation: the matplotlib animation
+        title: the title of the animation, used to name the file
+
+    Returns:
+        The path of the file written, or None if the animation was shown
+    """
+    if(output_dir == None):
+        plt = get_pyplot()
+        plt.ioff()
+        plt.show()
+        return None
+
+    import matplotlib.animation
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = file_name(title, ANIMATION_FORMAT)
+    animation.save(path, writer=matplotlib.animation.PillowWriter(fps=1000 / FRAME_MS))
+    return path
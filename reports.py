@@ -0,0 +1,267 @@
+"""
+Report bundles, one per station.
+
+"python main.py reports [STATION...]" writes a directory for each station
+(every station by default) under --output, e.g. reports/40380-clark-lake/:
+
+    daytypes.csv    ridership by type of day
+    yearly.csv      ridership by year, and yearly.png
+    monthly.csv     ridership by month of the report year, and monthly.png
+    nearby.csv      stations within a mile, and nearby.png on the map
+    report.json     all of the above, written last
+
+The stations are split into chunks of CHUNK_STATIONS and handed to a pool
+of processes. Each worker opens its own read-only connection (see
+database.connect_readonly) and renders its charts headlessly, so both the
+queries and the chart rendering run on every core. A bundle counts as done
+once its report.json exists, so an interrupted run picks up where it
+stopped; --force writes every bundle again.
+"""
+
+import concurrent.futures
+import json
+import os
+import re
+
+import api
+import cache
+import columnar
+import database
+import export
+import render
+
+
+BUNDLE_FILE = "report.json" #written last, so a directory holding it is complete
+CHUNK_STATIONS = 8 #stations per task handed to a worker
+
+worker_connection = None #the read-only connection of this worker process
+
+
+def bundle_path(directory, station):
+    """
+    This function builds the path of a station's bundle.
+
+    Args:
+        directory: the directory holding the bundles
+        station: an api.station record
+
+    Returns:
+        The path of the bundle directory (e.g. reports/40380-clark-lake)
+    """
+    name = re.sub(r"[^A-Za-z0-9]+", "-", station.station_name).strip("-").lower()
+    return os.path.join(directory, f"{station.station_id}-{name}")
+
+def bundle_done(directory, station):
+    """
+    This function checks if a station's bundle was already written completely.
+
+    Args:
+        directory: the directory holding the bundles
+        station: an api.station record
+
+    Returns:
+        True if the bundle is complete
+        False otherwise
+    """
+    return os.path.exists(os.path.join(bundle_path(directory, station), BUNDLE_FILE))
+
+def write_bundle(dbConn, station, directory, year):
+    """
+    This function writes the tables and charts of one station.
+
+    Args:
+        dbConn: connection to the CTA database
+        station: an api.station record
+        directory: the directory holding the bundles
+        year: the year of the monthly ridership (e.g. "2021")
+
+    Returns:
+        The path of the bundle directory
+    """
+    path = bundle_path(directory, station)
+    os.makedirs(path, exist_ok=True)
+    chart_format = render.output_format
+
+    day_types = api.day_types(dbConn, station)
+    yearly = api.yearly_ridership(dbConn, station.station_id)
+    monthly = api.monthly_ridership(dbConn, station.station_id, year)
+    position = api.station_position(dbConn, station)
+    nearby = []
+    if(position != None):
+        nearby = api.stations_nearby(dbConn, position.latitude, position.longitude)
+
+    #tables
+    day_rows = []
+    if(day_types != None):
+        day_rows = [("W", day_types.weekday), ("A", day_types.saturday), ("U", day_types.sunday_holiday)]
+    export.write_rows(os.path.join(path, "daytypes.csv"), ["Type_of_Day", "Num_Riders"], day_rows)
+    export.write_rows(os.path.join(path, "yearly.csv"), ["Year", "Num_Riders"], (point.as_tuple() for point in yearly))
+    export.write_rows(os.path.join(path, "monthly.csv"), ["Month", "Num_Riders"], (point.as_tuple() for point in monthly))
+    export.write_rows(os.path.join(path, "nearby.csv"), ["Station_Name", "Latitude", "Longitude", "Distance"],
+                      (location.as_tuple() for location in nearby))
+
+    #charts
+    charts = []
+    if(len(yearly) > 0):
+        render.plot_lines(f"Yearly Ridership at {station.station_name} Station", "Year", "Number of Riders",
+                          [(None, [point.period for point in yearly], [point.riders for point in yearly])])
+        charts.append(f"yearly.{chart_format}")
+        render.save(os.path.join(path, charts[-1]))
+    if(len(monthly) > 0):
+        render.plot_lines(f"Monthly Ridership at {station.station_name} ({year})", "Month", "Number of Riders",
+                          [(None, [point.period[:2] for point in monthly], [point.riders for point in monthly])])
+        charts.append(f"monthly.{chart_format}")
+        render.save(os.path.join(path, charts[-1]))
+    if(len(nearby) > 0):
+        render.plot_map([location.station_name for location in nearby],
+                        [location.latitude for location in nearby],
+                        [location.longitude for location in nearby])
+        charts.append(f"nearby.{chart_format}")
+        render.save(os.path.join(path, charts[-1]))
+
+    report = {
+        "station_id": station.station_id,
+        "station_name": station.station_name,
+        "year": year,
+        "day_types": None if day_types == None else dict(day_types.as_dict(), total=day_types.total),
+        "yearly": [point.as_dict() for point in yearly],
+        "monthly": [point.as_dict() for point in monthly],
+        "position": None if position == None else position.as_dict(),
+        "nearby": [location.as_dict() for location in nearby],
+        "charts": charts,
+    }
+    #write to a temporary name and rename, so report.json only ever exists complete
+    temporary = os.path.join(path, BUNDLE_FILE + ".tmp")
+    with open(temporary, "w") as file:
+        json.dump(report, file, indent=2)
+    os.replace(temporary, os.path.join(path, BUNDLE_FILE))
+    return path
+
+def start_worker(db_file, immutable, cache_enabled, numpy_enabled, chart_format):
+    """
+    This function sets up a worker process: the settings of the main process and
+    a read-only connection of its own.
+
+    Args:
+        db_file: the path of the CTA database
+        immutable: promise SQLite the file will not change while it is open
+        cache_enabled: cache.enabled in the main process
+        numpy_enabled: columnar.enabled in the main process
+        chart_format: "png" or "svg"
+    """
+    global worker_connection
+    cache.enabled = cache_enabled
+    cache.persist = False #workers don't share the cache file
+    columnar.enabled = numpy_enabled
+    render.headless = True
+    render.output_format = chart_format
+    worker_connection = database.connect_readonly(db_file, immutable)
+
+def run_chunk(station_rows, directory, year, force):
+    """
+    This function writes the bundles of a chunk of stations on the worker's connection.
+
+    Args:
+        station_rows: a list of (Station_ID, Station_Name) tuples
+        directory: the directory holding the bundles
+        year: the year of the monthly ridership
+        force: write bundles that are already complete again
+
+    Returns:
+        A tuple with the number of bundles written, the number skipped (already complete)
+        and a list of (Station_ID, error message) tuples for the bundles that failed
+    """
+    written = 0
+    skipped = 0
+    failed = []
+    for station_id, station_name in station_rows:
+        station = api.station(station_id, station_name)
+        if(not force and bundle_done(directory, station)):
+            skipped += 1
+            continue
+        try:
+            write_bundle(worker_connection, station, directory, year)
+            written += 1
+        except Exception as error: #one bad bundle is counted as failed, not the end of the run
+            failed.append((station_id, str(error) or type(error).__name__))
+    return (written, skipped, failed)
+
+def prepare_workers(db_file, immutable, numpy_enabled):
+    """
+    This function builds, once in the main process, the files the workers would otherwise
+    all build at the same moment, so they only open files that are already complete.
+    The rollups and the prefix-sum index are brought up to date when the main connection
+    is opened (see main.open_database); this saves the NumPy columns.
+
+    Args:
+        db_file: the path of the CTA database
+        immutable: promise SQLite the file will not change while it is open
+        numpy_enabled: columnar.enabled in the main process
+
+    Returns:
+        Nothing
+    """
+    if(not numpy_enabled or not columnar.available()):
+        return
+    dbConn = database.connect_readonly(db_file, immutable)
+    try:
+        columnar.load_columns(dbConn) #rebuilds and saves them if they are missing or stale
+    finally:
+        dbConn.close()
+
+def generate_reports(db_file, station_list, directory, year, processes=os.cpu_count() or 4,
+                     immutable=False, force=False, progress=None):
+    """
+    This function writes the bundles of many stations across a pool of processes.
+
+    Args:
+        db_file: the path of the CTA database
+        station_list: a list of api.station records
+        directory: the directory holding the bundles
+        year: the year of the monthly ridership (e.g. "2021")
+        processes: the number of worker processes, 1 to write the bundles in this process
+        immutable: promise SQLite the file will not change while it is open
+        force: write bundles that are already complete again
+        progress: a function called after each chunk with the number of stations done,
+                  the total and the counts so far, or None
+
+    Returns:
+        A dictionary with the number of bundles written and skipped, and the
+        list of (Station_ID, error message) tuples for the bundles that failed
+    """
+    global worker_connection
+    os.makedirs(directory, exist_ok=True)
+    rows = [(station.station_id, station.station_name) for station in station_list]
+    chunks = [rows[start:start + CHUNK_STATIONS] for start in range(0, len(rows), CHUNK_STATIONS)]
+    settings = (db_file, immutable, cache.enabled, columnar.enabled, render.output_format)
+    counts = {"written": 0, "skipped": 0, "failed": []}
+    done = 0
+    prepare_workers(db_file, immutable, columnar.enabled)
+
+    def add(chunk, result):
+        nonlocal done
+        done += len(chunk)
+        counts["written"] += result[0]
+        counts["skipped"] += result[1]
+        counts["failed"].extend(result[2])
+        if(progress != None):
+            progress(done, len(rows), counts)
+
+    if(processes <= 1):
+        #one worker: this process, with its own read-only connection like the others
+        saved = (cache.persist, render.headless, worker_connection)
+        start_worker(*settings)
+        try:
+            for chunk in chunks:
+                add(chunk, run_chunk(chunk, directory, year, force))
+        finally:
+            worker_connection.close()
+            cache.persist, render.headless, worker_connection = saved
+        return counts
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes, initializer=start_worker,
+                                                initargs=settings) as executor:
+        futures = {executor.submit(run_chunk, chunk, directory, year, force): chunk for chunk in chunks}
+        for future in concurrent.futures.as_completed(futures):
+            add(futures[future], future.result())
+    return counts
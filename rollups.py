@@ -0,0 +1,304 @@
+"""
+Precomputed ridership rollups.
+
+The rollups are summary tables of the Ridership table that live in the sidecar
+database (see database.py), attached to the connection as the "rollup" schema:
+
+    Station_Month   (Station_ID, Year, Month, Type_of_Day) -> riders, days
+    Station_Year    (Station_ID, Year)                     -> riders
+    Station_DayType (Station_ID, Type_of_Day)              -> riders, days
+    Totals          (Type_of_Day)                          -> riders, days
+
+They are built with one scan over Ridership and stamped with the content
+version of the database, so the commands can tell if they are out of date
+and fall back to the raw tables.
+
+Station_Cumulative is a prefix-sum index: for each station, type of day and
+day with ridership, the riders and days from the start of the history up to
+and including that day. The total for any date range is then the running
+total before its end minus the running total before its start, two lookups
+on the primary key however long the range is (see queries.range_totals()). It is
+stamped separately (cumulative_version), so a sidecar from before it
+existed gets it added without rebuilding the other rollups.
+
+The general statistics printed at startup are cached the same way in the
+Stats table, keyed on the content version, so startup does not have to scan
+Ridership unless the data changed.
+
+To rebuild the rollups by hand:
+
+    python main.py maintain
+"""
+
+import sqlite3
+
+import database
+import sql
+
+
+ROLLUP_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS rollup.Meta(
+    Key TEXT PRIMARY KEY,
+    Value TEXT
+);
+CREATE TABLE IF NOT EXISTS rollup.Station_Month(
+    Station_ID INTEGER,
+    Year TEXT,
+    Month TEXT,
+    Type_of_Day TEXT,
+    Num_Riders INTEGER,
+    Num_Days INTEGER,
+    PRIMARY KEY (Station_ID, Year, Month, Type_of_Day)
+);
+CREATE TABLE IF NOT EXISTS rollup.Station_Year(
+    Station_ID INTEGER,
+    Year TEXT,
+    Num_Riders INTEGER,
+    PRIMARY KEY (Station_ID, Year)
+);
+CREATE TABLE IF NOT EXISTS rollup.Station_DayType(
+    Station_ID INTEGER,
+    Type_of_Day TEXT,
+    Num_Riders INTEGER,
+    Num_Days INTEGER,
+    PRIMARY KEY (Station_ID, Type_of_Day)
+);
+CREATE TABLE IF NOT EXISTS rollup.Totals(
+    Type_of_Day TEXT PRIMARY KEY,
+    Num_Riders INTEGER,
+    Num_Days INTEGER
+);
+CREATE TABLE IF NOT EXISTS rollup.Station_Cumulative(
+    Station_ID INTEGER,
+    Type_of_Day TEXT,
+    Ride_Date TEXT,
+    Cum_Riders INTEGER,
+    Cum_Days INTEGER,
+    PRIMARY KEY (Station_ID, Type_of_Day, Ride_Date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollup.Stats(
+    Version TEXT PRIMARY KEY,
+    Num_Stations INTEGER,
+    Num_Stops INTEGER,
+    Num_Ride_Entries INTEGER,
+    First_Date TEXT,
+    Last_Date TEXT,
+    Total_Riders INTEGER
+);
+"""
+
+
+def get_meta(dbConn, key):
+    """
+    This function reads a value from the rollup metadata table.
+
+    Args:
+        dbConn: connection to the CTA database
+        key: the metadata key
+
+    Returns:
+        The stored value, or None if the key (or the sidecar) does not exist
+    """
+    if(not database.sidecar_attached(dbConn)):
+        return None
+    try:
+        row = sql.execute(dbConn, "get_meta", [key]).fetchone()
+    except sqlite3.OperationalError: #sidecar attached but not built yet
+        return None
+    if(row == None):
+        return None
+    return row[0]
+
+def set_meta(dbConn, key, value):
+    """
+    This function writes a value to the rollup metadata table.
+    The caller is responsible for committing.
+
+    Args:
+        dbConn: connection to the CTA database
+        key: the metadata key
+        value: the value to store
+    """
+    sql.execute(dbConn, "set_meta", [key, value])
+
+def rollups_current(dbConn):
+    """
+    This function checks if the rollups exist and match the data in the database.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        True if the rollups can be used to answer queries
+        False if the commands should fall back to the raw Ridership table
+    """
+    version = get_meta(dbConn, "rollup_version")
+    if(version == None):
+        return False
+    return version == database.content_version(dbConn)
+
+def cumulative_current(dbConn):
+    """
+    This function checks if the prefix-sum index exists and matches the data in the database.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        True if range totals can be answered from Station_Cumulative
+        False if they have to be summed from Ridership
+    """
+    version = get_meta(dbConn, "cumulative_version")
+    if(version == None):
+        return False
+    return version == database.content_version(dbConn)
+
+def build_rollups(dbConn):
+    """
+    This function (re)builds all of the rollup tables.
+    Ridership is scanned once into Station_Month; the coarser rollups are then
+    derived from Station_Month, which is much smaller than Ridership.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        True if the rollups were built
+        False if the sidecar could not be created or written
+    """
+    if(not database.attach_sidecar(dbConn, create=True)):
+        return False
+
+    try:
+        dbConn.executescript(ROLLUP_SCHEMA_SQL)
+        with dbConn:
+            sql.execute(dbConn, "clear_station_month")
+            sql.execute(dbConn, "clear_station_year")
+            sql.execute(dbConn, "clear_station_daytype")
+            sql.execute(dbConn, "clear_totals")
+
+            sql.execute(dbConn, "build_station_month")
+            sql.execute(dbConn, "build_station_year")
+            sql.execute(dbConn, "build_station_daytype")
+            sql.execute(dbConn, "build_totals")
+
+            sql.execute(dbConn, "clear_station_cumulative")
+            sql.execute(dbConn, "build_station_cumulative")
+
+            version = database.content_version(dbConn)
+            set_meta(dbConn, "rollup_version", version)
+            set_meta(dbConn, "cumulative_version", version)
+    except sqlite3.OperationalError: #e.g. the sidecar is on a read-only file system
+        return False
+    return True
+
+def build_cumulative(dbConn):
+    """
+    This function (re)builds the prefix-sum index alone, for a sidecar whose other
+    rollups are current.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        True if the index was built
+        False if the sidecar could not be written
+    """
+    try:
+        dbConn.executescript(ROLLUP_SCHEMA_SQL)
+        with dbConn:
+            sql.execute(dbConn, "clear_station_cumulative")
+            sql.execute(dbConn, "build_station_cumulative")
+            set_meta(dbConn, "cumulative_version", database.content_version(dbConn))
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+def maintain_rollups(dbConn):
+    """
+    This function makes sure the rollups are up to date, rebuilding them if the
+    data in the database has changed since they were built.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        True if the rollups are up to date
+        False if the commands will have to use the raw Ridership table
+    """
+    database.attach_sidecar(dbConn)
+    if(rollups_current(dbConn)):
+        if(not cumulative_current(dbConn)):
+            build_cumulative(dbConn)
+        return True
+    return build_rollups(dbConn)
+
+def compute_stats(dbConn, pool=None):
+    """
+    This function computes the general statistics of the database.
+    The ride entry count and total come from the rollups when they are current,
+    and the first and last dates are MIN/MAX lookups on the Ride_Date index.
+    The queries are independent, so with a connection pool they run at the same time.
+
+    Args:
+        dbConn: connection to the CTA database
+        pool: a database.connection_pool, or None to run the queries one after another
+
+    Returns:
+        A tuple with the number of stations, number of stops, number of ride entries,
+        first date, last date and total ridership
+    """
+    rides_query = "ride_totals_rollup" if rollups_current(dbConn) else "ride_totals"
+    queries = ["count_stations", "count_stops", rides_query, "first_date", "last_date"]
+    if(pool == None):
+        rows = [sql.execute(dbConn, name).fetchone() for name in queries]
+    else:
+        rows = pool.run_parallel([lambda poolConn, name=name: sql.execute(poolConn, name).fetchone()
+                                  for name in queries])
+
+    num_stations = rows[0][0]
+    num_stops = rows[1][0]
+    num_rides = rows[2][0]
+    total = rows[2][1]
+    first_date = rows[3][0]
+    last_date = rows[4][0]
+
+    return (num_stations, num_stops, num_rides, first_date, last_date, total)
+
+def general_stats(dbConn, pool=None):
+    """
+    This function returns the general statistics of the database, using the copy
+    cached in the sidecar if the data has not changed since it was computed.
+
+    Args:
+        dbConn: connection to the CTA database
+        pool: a database.connection_pool to compute the statistics with, or None
+
+    Returns:
+        A tuple with the number of stations, number of stops, number of ride entries,
+        first date, last date and total ridership
+    """
+    version = database.content_version(dbConn)
+
+    if(database.sidecar_attached(dbConn)):
+        try:
+            row = sql.execute(dbConn, "get_stats", [version]).fetchone()
+        except sqlite3.OperationalError: #sidecar attached but not built yet
+            row = None
+        if(row != None):
+            return tuple(row)
+
+    stats = compute_stats(dbConn, pool)
+
+    #cache the statistics for next time, replacing the copy for the old data
+    if(database.attach_sidecar(dbConn, create=True)):
+        try:
+            dbConn.executescript(ROLLUP_SCHEMA_SQL)
+            with dbConn:
+                sql.execute(dbConn, "clear_stats")
+                sql.execute(dbConn, "set_stats", [version, *stats])
+        except sqlite3.OperationalError: #read-only sidecar, just don't cache
+            pass
+
+    return stats
+
@@ -0,0 +1,423 @@
+"""
+Local HTTP/JSON query service.
+
+"python main.py serve" answers the same questions as the interactive
+commands over HTTP, one GET endpoint per command, with JSON responses:
+
+    /stats                                     general statistics
+    /stations?name=Clark%                      find stations (wildcards _ and %)
+    /weekstats?station=Clark/Lake              ridership by type of day
+    /rank?day_types=AU&start=...&end=...&top=  stations ranked by ridership
+    /yearly?station=Clark/Lake                 ridership by year
+    /monthly?station=Clark/Lake&year=2020      ridership by month of a year
+    /compare?station=A&station=B&year=2020     daily ridership (or start=...&end=...)
+    /nearby?lat=41.88&lon=-87.63&radius=1      stations within a radius in miles
+
+The server runs on asyncio and never queries the database on the event loop:
+every request is handed to a database.connection_pool, which runs it on one
+of its read-only connections in a worker thread, so a slow query only holds
+up its own request. Connections are kept alive between requests (HTTP/1.1).
+Date ranges in responses are half-open: end is the day after the last day.
+"""
+
+import asyncio
+import json
+import math
+import urllib.parse
+
+import api
+import queries
+import ranking
+
+
+MAX_LINE_BYTES = 65536 #longest request or header line accepted
+MAX_RADIUS_MILES = 50 #largest /nearby radius, well past the whole network
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class service_error(Exception):
+    """
+    An error to report to the client, with its HTTP status.
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def get_param(params, name, default=None):
+    """
+    This function finds a query string parameter.
+
+    Args:
+        params: the parsed query string (name -> list of values)
+        name: the name of the parameter
+        default: the value if the parameter is missing, or None if it is required
+
+    Returns:
+        The last value given for the parameter
+
+    Raises:
+        service_error (400) if a required parameter is missing
+    """
+    values = params.get(name)
+    if(values == None or len(values) == 0):
+        if(default == None):
+            raise service_error(400, f"Missing parameter: {name}")
+        return default
+    return values[-1]
+
+def get_float(params, name, default=None):
+    """
+    This function finds a numeric query string parameter.
+
+    Args:
+        params: the parsed query string (name -> list of values)
+        name: the name of the parameter
+        default: the value if the parameter is missing, or None if it is required
+
+    Returns:
+        The value as a float
+
+    Raises:
+        service_error (400) if the parameter is missing or is not a finite number
+    """
+    value = get_param(params, name, default)
+    try:
+        number = float(value)
+    except ValueError:
+        raise service_error(400, f"Parameter {name} is not a number: {value}")
+    if(not math.isfinite(number)): #nan fails every range check without being caught by it
+        raise service_error(400, f"Parameter {name} is not a finite number: {value}")
+    return number
+
+def get_date_range(params):
+    """
+    This function finds the date range of a request: a year, or a start and end day.
+
+    Args:
+        params: the parsed query string (name -> list of values)
+
+    Returns:
+        A (first day, day after the last day) tuple, or None if the request has neither
+
+    Raises:
+        service_error (400) if the dates are not valid
+    """
+    if("start" in params or "end" in params):
+        date_range = queries.date_bounds(get_param(params, "start", "0001-01-01"), get_param(params, "end", "9998-12-31"))
+    elif("year" in params):
+        date_range = queries.year_bounds(get_param(params, "year"))
+    else:
+        return None
+    if(date_range == ("", "")):
+        raise service_error(400, "Enter a year or start and end days (YYYY-MM-DD)")
+    return date_range
+
+def find_station(dbConn, pattern):
+    """
+    This function finds the one station matching a name (wildcards _ and %).
+
+    Args:
+        dbConn: connection to the CTA database
+        pattern: the station name
+
+    Returns:
+        An api.station record
+
+    Raises:
+        service_error (404) if no station matches, (400) if several do
+    """
+    try:
+        return api.find_station(dbConn, pattern)
+    except api.station_lookup_error as error:
+        raise service_error(404 if len(error.matches) == 0 else 400, str(error))
+
+
+def get_stats(dbConn, params):
+    """
+    This function answers /stats
+
+    Args:
+        dbConn: connection to the CTA database
+        params: the parsed query string
+
+    Returns:
+        The general statistics
+    """
+    stats = api.stats(dbConn)
+    return {"stations": stats.num_stations, "stops": stats.num_stops, "ride_entries": stats.num_rides,
+            "first_date": stats.first_date, "last_date": stats.last_date, "total_ridership": stats.total}
+
+def get_stations(dbConn, params):
+    """
+    This function answers /stations?name=
+
+    Args:
+        dbConn: connection to the CTA database
+        params: the parsed query string
+
+    Returns:
+        The matching stations, sorted by name
+    """
+    return [match.as_dict() for match in api.find_stations(dbConn, get_param(params, "name"))]
+
+def get_weekstats(dbConn, params):
+    """
+    This function answers /weekstats?station=
+
+    Args:
+        dbConn: connection to the CTA database
+        params: the parsed query string
+
+    Returns:
+        The ridership of the station (exact name) for each type of day
+    """
+    station_name = get_param(params, "station")
+    ridership = api.week_stats(dbConn, station_name)
+    if(ridership == None):
+        raise service_error(404, f"No data found: {station_name}")
+    return dict(ridership.as_dict(), total=ridership.total)
+
+def get_rank(dbConn, params):
+    """
+    This function answers /rank?day_types=&start=&end=&top=
+
+    Args:
+        dbConn: connection to the CTA database
+        params: the parsed query string
+
+    Returns:
+        The stations ranked by ridership, highest first
+    """
+    day_types = [day_type for day_type in ranking.DAY_TYPES if day_type in get_param(params, "day_types", "W").upper()]
+    if(len(day_types) == 0):
+        raise service_error(400, "Enter day types from W, A and U")
+    top = None
+    if("top" in params):
+        top = int(get_float(params, "top"))
+    return [share.as_dict() for share in api.rank_stations(dbConn, day_types, get_date_range(params), top)]
+
+def get_yearly(dbConn, params):
+    """
+    This function answers /yearly?station=
+
+    Args:
+        dbConn: connection to the CTA database
+        params: the parsed query string
+
+    Returns:
+        The ridership of the station for each year
+    """
+    station = find_station(dbConn, get_param(params, "station"))
+    points = api.yearly_ridership(dbConn, station.station_id)
+    return dict(station.as_dict(), years=[{"year": point.period, "riders": point.riders} for point in points])
+
+def get_monthly(dbConn, params):
+    """
+    This function answers /monthly?station=&year=
+
+    Args:
+        dbConn: connection to the CTA database
+        params: the parsed query string
+
+    Returns:
+        The ridership of the station for each month of the year
+    """
+    station = find_station(dbConn, get_param(params, "station"))
+    year = get_param(params, "year")
+    points = api.monthly_ridership(dbConn, station.station_id, year)
+    return dict(station.as_dict(), year=year, months=[{"month": point.period, "riders": point.riders} for point in points])
+
+def get_compare(dbConn, params):
+    """
+    This function answers /compare?station=&station=&year= (or start=&end=)
+
+    Args:
+        dbConn: connection to the CTA database
+        params: the parsed query string
+
+    Returns:
+        The daily ridership of each station
+    """
+    date_range = get_date_range(params)
+    if(date_range == None):
+        raise service_error(400, "Enter a year or start and end days (YYYY-MM-DD)")
+    matches = [find_station(dbConn, pattern) for pattern in params.get("station", [])]
+    if(len(matches) == 0):
+        raise service_error(400, "Missing parameter: station")
+    daily = api.daily_ridership(dbConn, [match.station_id for match in matches], date_range)
+    return {"start": date_range[0], "end": date_range[1],
+            "stations": [dict(match.as_dict(), days=[{"date": point.period, "riders": point.riders}
+                                                    for point in daily[match.station_id]])
+                         for match in matches]}
+
+def get_nearby(dbConn, params):
+    """
+    This function answers /nearby?lat=&lon=&radius=
+
+    Args:
+        dbConn: connection to the CTA database
+        params: the parsed query string
+
+    Returns:
+        The stations within the radius (default 1 mile)
+
+    Raises:
+        service_error (400) if the location or the radius is out of bounds
+    """
+    latitude = get_float(params, "lat")
+    longitude = get_float(params, "lon")
+    miles = get_float(params, "radius", "1")
+    if(latitude < 40 or latitude > 43): #same bounds as command 9
+        raise service_error(400, "Latitude is out of bounds")
+    if(longitude < -88 or longitude > -87):
+        raise service_error(400, "Longitude is out of bounds")
+    if(miles <= 0 or miles > MAX_RADIUS_MILES):
+        raise service_error(400, f"Radius must be above 0 and at most {MAX_RADIUS_MILES} miles")
+    return [station.as_dict() for station in api.stations_nearby(dbConn, latitude, longitude, miles)]
+
+ENDPOINTS = {
+    "/stats": get_stats,
+    "/stations": get_stations,
+    "/weekstats": get_weekstats,
+    "/rank": get_rank,
+    "/yearly": get_yearly,
+    "/monthly": get_monthly,
+    "/compare": get_compare,
+    "/nearby": get_nearby,
+}
+
+
+def answer(dbConn, handler, params):
+    """
+    This function runs an endpoint on a pooled connection and encodes the response.
+    It runs in a worker thread, so the JSON encoding stays off the event loop too.
+
+    Args:
+        dbConn: a read-only connection from the pool
+        handler: the endpoint function
+        params: the parsed query string
+
+    Returns:
+        A tuple with the HTTP status and the JSON body as bytes
+    """
+    try:
+        return (200, json.dumps(handler(dbConn, params)).encode())
+    except service_error as error:
+        return (error.status, json.dumps({"error": error.message}).encode())
+    except Exception as error: #report it to the client and keep serving
+        return (500, json.dumps({"error": str(error)}).encode())
+
+async def dispatch(pool, method, target):
+    """
+    This function answers one request.
+
+    Args:
+        pool: the database.connection_pool
+        method: the HTTP method
+        target: the request target (path and query string)
+
+    Returns:
+        A tuple with the HTTP status and the JSON body as bytes
+    """
+    url = urllib.parse.urlsplit(target)
+    handler = ENDPOINTS.get(url.path.rstrip("/") or "/")
+    if(handler == None):
+        return (404, json.dumps({"error": f"Unknown endpoint: {url.path}", "endpoints": sorted(ENDPOINTS)}).encode())
+    if(method != "GET"):
+        return (405, json.dumps({"error": "Only GET is supported"}).encode())
+
+    params = urllib.parse.parse_qs(url.query)
+    future = pool.submit(lambda dbConn: answer(dbConn, handler, params))
+    return await asyncio.wrap_future(future)
+
+async def handle_connection(pool, reader, writer):
+    """
+    This function serves the requests of one client connection until it closes.
+
+    Args:
+        pool: the database.connection_pool
+        reader: the asyncio.StreamReader of the connection
+        writer: the asyncio.StreamWriter of the connection
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if(request_line == b""): #the client closed the connection
+                break
+            parts = request_line.decode("latin-1").split()
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if(line in (b"\r\n", b"\n", b"")):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get("content-length", "0") or "0")
+            if(length > 0): #a GET has no body, but skip one if sent
+                await reader.readexactly(length)
+
+            if(len(parts) != 3):
+                status, body = (400, json.dumps({"error": "Bad request line"}).encode())
+                keep_alive = False
+            else:
+                method, target, version = parts
+                status, body = await dispatch(pool, method, target)
+                connection = headers.get("connection", "").lower()
+                if(version == "HTTP/1.1"):
+                    keep_alive = connection != "close"
+                else:
+                    keep_alive = connection == "keep-alive"
+
+            head = (f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+            if(not keep_alive):
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+        pass #the client went away or sent something unreadable
+    finally:
+        writer.close()
+
+async def run_server(pool, host, port):
+    """
+    This function accepts connections until the task is cancelled.
+
+    Args:
+        pool: the database.connection_pool
+        host: the address to listen on
+        port: the port to listen on
+    """
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(pool, reader, writer),
+                                        host, port, limit=MAX_LINE_BYTES)
+    address = server.sockets[0].getsockname()
+    print(f"Serving on http://{address[0]}:{address[1]} (Ctrl-C to stop)", flush=True)
+    async with server:
+        await server.serve_forever()
+
+def serve(pool, host="127.0.0.1", port=8341):
+    """
+    This function runs the HTTP service until it is interrupted.
+
+    Args:
+        pool: the database.connection_pool to answer the requests with
+        host: the address to listen on
+        port: the port to listen on
+    """
+    try:
+        asyncio.run(run_server(pool, host, port))
+    except KeyboardInterrupt:
+        print() # new line
@@ -0,0 +1,228 @@
+"""
+In-memory spatial index over the stop coordinates.
+
+The stops are bucketed into a grid of square cells (CELL_MILES on a side).
+A radius query only looks at the cells that overlap the circle, and a
+k-nearest query looks at rings of cells around the point until no closer
+stop can exist. Distances are great-circle distances (haversine) in miles.
+
+The index is built once per session from Stops joined to Stations, see
+get_stop_index(). get_station_positions() likewise keeps the middle of
+each station's stops for the session (the network map).
+"""
+
+import math
+
+import database
+import sql
+
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_LAT_DEGREE = 69.0
+CELL_MILES = 0.25
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    This function computes the great-circle distance between two points.
+
+    Args:
+        lat1: latitude of the first point
+        lon1: longitude of the first point
+        lat2: latitude of the second point
+        lon2: longitude of the second point
+
+    Returns:
+        The distance in miles
+    """
+    lat1 = math.radians(lat1)
+    lat2 = math.radians(lat2)
+    d_lat = lat2 - lat1
+    d_lon = math.radians(lon2 - lon1)
+    a = math.sin(d_lat/2)**2 + math.cos(lat1)*math.cos(lat2)*math.sin(d_lon/2)**2
+    return 2*EARTH_RADIUS_MILES*math.asin(math.sqrt(a))
+
+
+class stop_index:
+    """
+    A grid index of (station name, latitude, longitude) points.
+    """
+    def __init__(self, points):
+        self.names = []
+        self.latitudes = []
+        self.longitudes = []
+        self.cells = {} #(row, column) -> list of point numbers
+
+        if(len(points) == 0):
+            self.lat_step = CELL_MILES/MILES_PER_LAT_DEGREE
+            self.lon_step = self.lat_step
+            return
+
+        #size the cells in degrees so they are at least CELL_MILES wide everywhere,
+        #which is at the latitude farthest from the equator
+        max_lat = max(abs(point[1]) for point in points)
+        self.lat_step = CELL_MILES/MILES_PER_LAT_DEGREE
+        self.lon_step = CELL_MILES/(MILES_PER_LAT_DEGREE*math.cos(math.radians(max_lat)))
+
+        for number, (name, latitude, longitude) in enumerate(points):
+            self.names.append(name)
+            self.latitudes.append(latitude)
+            self.longitudes.append(longitude)
+            self.cells.setdefault(self.cell(latitude, longitude), []).append(number)
+
+    def __len__(self):
+        return len(self.names)
+
+    def cell(self, latitude, longitude):
+        return (math.floor(latitude/self.lat_step), math.floor(longitude/self.lon_step))
+
+    def point(self, number, distance):
+        return (self.names[number], self.latitudes[number], self.longitudes[number], distance)
+
+    def within(self, latitude, longitude, miles=1.0):
+        """
+        This function finds the points within a radius of a location.
+
+        Args:
+            latitude: latitude of the location
+            longitude: longitude of the location
+            miles: the radius in miles
+
+        Returns:
+            A list of (station name, latitude, longitude, distance) tuples sorted by
+            name, latitude and longitude (north to south, east to west)
+        """
+        #cells overlapping the bounding box of the circle
+        row_min, col_min = self.cell(latitude - miles/MILES_PER_LAT_DEGREE, longitude - miles*self.lon_step/CELL_MILES)
+        row_max, col_max = self.cell(latitude + miles/MILES_PER_LAT_DEGREE, longitude + miles*self.lon_step/CELL_MILES)
+
+        #walk the box when it has fewer cells than are occupied (small radii), otherwise
+        #only the occupied cells inside it, so a large radius costs no more than a full scan
+        if((row_max - row_min + 1)*(col_max - col_min + 1) <= len(self.cells)):
+            cells = [(row, col) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)]
+        else:
+            cells = [(row, col) for row, col in self.cells
+                     if row_min <= row <= row_max and col_min <= col <= col_max]
+
+        found = []
+        for cell in cells:
+            for number in self.cells.get(cell, ()):
+                distance = haversine(latitude, longitude, self.latitudes[number], self.longitudes[number])
+                if(distance <= miles):
+                    found.append(self.point(number, distance))
+
+        found.sort(key=lambda point: (point[0], -point[1], -point[2]))
+        return found
+
+    def nearest(self, latitude, longitude, k=1):
+        """
+        This function finds the k points closest to a location.
+        The occupied cells are searched in rings outward from the location until the
+        next ring is farther away than the k-th closest point found so far.
+
+        Args:
+            latitude: latitude of the location
+            longitude: longitude of the location
+            k: the number of points to find
+
+        Returns:
+            A list of up to k (station name, latitude, longitude, distance) tuples, closest first
+        """
+        if(len(self.names) == 0 or k <= 0):
+            return []
+
+        #the occupied cells, nearest ring (Chebyshev distance in cells) first
+        center_row, center_col = self.cell(latitude, longitude)
+        rings = sorted((max(abs(row - center_row), abs(col - center_col)), row, col) for row, col in self.cells)
+
+        found = []
+        searched_ring = -1
+        for ring, row, col in rings:
+            #every point in this ring or beyond is at least (ring - 1) * CELL_MILES away
+            if(ring != searched_ring and len(found) >= k):
+                found.sort()
+                if(found[k - 1][0] <= (ring - 1)*CELL_MILES):
+                    break
+            searched_ring = ring
+            for number in self.cells[(row, col)]:
+                distance = haversine(latitude, longitude, self.latitudes[number], self.longitudes[number])
+                found.append((distance, number))
+
+        found.sort()
+        return [self.point(number, distance) for distance, number in found[:k]]
+
+    def within_many(self, locations, miles=1.0):
+        """
+        This function runs a radius query for each of many locations.
+
+        Args:
+            locations: an iterable of (latitude, longitude) pairs
+            miles: the radius in miles
+
+        Returns:
+            A list with the result of within() for each location
+        """
+        return [self.within(latitude, longitude, miles) for latitude, longitude in locations]
+
+    def nearest_many(self, locations, k=1):
+        """
+        This function runs a k-nearest query for each of many locations.
+
+        Args:
+            locations: an iterable of (latitude, longitude) pairs
+            k: the number of points to find for each location
+
+        Returns:
+            A list with the result of nearest() for each location
+        """
+        return [self.nearest(latitude, longitude, k) for latitude, longitude in locations]
+
+
+def build_stop_index(dbConn):
+    """
+    This function loads the stop coordinates and builds the spatial index.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The stop_index
+    """
+    return stop_index(sql.execute(dbConn, "stop_points").fetchall())
+
+def get_stop_index(dbConn):
+    """
+    This function returns the spatial index for the session, building it on first use.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The stop_index
+    """
+    return database.session_cached(dbConn, "stop_index", build_stop_index)
+
+def build_station_positions(dbConn):
+    """
+    This function finds where every station is, as the middle of its stops.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A dictionary mapping each Station_ID to a (latitude, longitude) tuple
+    """
+    return {station_id: (latitude, longitude)
+            for station_id, latitude, longitude in sql.execute(dbConn, "station_positions").fetchall()}
+
+def get_station_positions(dbConn):
+    """
+    This function returns the station positions for the session, finding them on first use.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        A dictionary mapping each Station_ID to a (latitude, longitude) tuple
+    """
+    return database.session_cached(dbConn, "station_positions", build_station_positions)
@@ -0,0 +1,474 @@
+"""
+The registry of SQL statements run against the CTA database.
+
+Every query and update the program runs on the CTA database is a named
+entry in STATEMENTS, and runs through execute() (or executemany()):
+
+    sql.execute(dbConn, "yearly_rollup", [station_id])
+
+The values always go in as ? parameters, never into the text, so each
+statement has one fixed text. SQLite's statement cache (sized with
+CACHED_STATEMENTS when the connections are opened) then parses and plans it
+once per connection, however often it runs and whatever the values are,
+and names like "Harlem-O'Hare" need no quoting. The only thing filled into
+a text is the run of ? of an IN (...) list, marked {placeholders}, so there
+is one text per list length.
+
+execute() counts how many times each statement runs; execution_counts()
+returns the counts (shown by --profile).
+
+Left out of the registry: the schema scripts (CREATE TABLE ...), the
+connection PRAGMAs, CREATE INDEX for the fixed list in indexes.py, and the
+result cache, which is a database of its own (cache.py).
+"""
+
+import threading
+
+
+CACHED_STATEMENTS = 256 #prepared statements kept per connection, room for every entry and its IN list lengths
+
+counts = {} #statement name -> number of times run
+counts_lock = threading.Lock() #pooled connections run statements from several threads
+expanded = {} #(statement name, IN list length) -> text
+
+
+STATEMENTS = {
+    #
+    # database.py
+    #
+    "attach_sidecar": "ATTACH DATABASE ? AS rollup;",
+    "last_rowid": "Select MAX(rowid) From main.Ridership;",
+
+    #
+    # indexes.py
+    #
+    "index_list": "Select name From pragma_index_list(?);",
+    "index_columns": "Select name From pragma_index_info(?) Order By seqno;",
+
+    #
+    # stations.py, spatial.py and topology.py: the tables loaded once per session
+    #
+    "stations": "Select Station_ID, Station_Name From Stations;",
+    "stop_points": """Select Stations.Station_Name as Name, Stops.Latitude as Latitude, Stops.Longitude as Longitude
+                        From Stations
+                        Join Stops on Stations.Station_ID=Stops.Station_ID
+                       Group By Name, Latitude, Longitude;""",
+    "line_colors": "Select Color From Lines;",
+    "line_stops": """Select Lines.Color, Stops.Direction, Stops.Stop_ID, Stops.Stop_Name,
+                            Stops.ADA, Stops.Station_ID, Stops.Latitude, Stops.Longitude
+                       From Lines
+                       Join StopDetails ON Lines.Line_ID = StopDetails.Line_ID
+                       Join Stops ON StopDetails.Stop_ID = Stops.Stop_ID;""",
+    "stop_count": "Select COUNT(Stop_ID) From Stops;",
+    "station_positions": """Select Station_ID, AVG(Latitude), AVG(Longitude)
+                              From Stops
+                             Group By Station_ID;""",
+
+    #
+    # columnar.py
+    #
+    "ridership_count": "Select count(*) From Ridership;",
+    "ridership_columns": """Select Station_ID,
+                                   CAST(julianday(substr(Ride_Date, 1, 10)) - 2440587.5 AS INTEGER),
+                                   instr(?, Type_of_Day) - 1,
+                                   Num_Riders
+                              From Ridership
+                             Order By Station_ID, Ride_Date;""",
+
+    #
+    # queries.py
+    #
+    "day_types_rollup": """Select Type_of_Day, Num_Riders From rollup.Station_DayType
+                            Where Station_ID = ?;""",
+    "day_types": """Select Type_of_Day, Sum(Num_Riders) From Ridership
+                     Where Station_ID = ?
+                     Group By Type_of_Day;""",
+    "station_position": """Select AVG(Latitude), AVG(Longitude) From Stops
+                            Where Station_ID = ?;""",
+    "range_totals": """Select Type_of_Day, SUM(Num_Riders), COUNT(*) From Ridership
+                        Where Station_ID = ? and Ride_Date >= ? and Ride_Date < ?
+                        Group By Type_of_Day;""",
+    "yearly_rollup": """Select Year, Num_Riders as Total
+                          From rollup.Station_Year
+                         Where Station_ID = ?
+                         Order By Year ASC;""",
+    "yearly": """Select strftime('%Y', Ride_Date) as Year, SUM(Num_Riders) as Total
+                   From Ridership
+                  Where Station_ID = ?
+                  Group By Year
+                  Order By Year ASC;""",
+    "monthly_rollup": """Select Month || '/' || Year as Date, SUM(Num_Riders) as Total
+                           From rollup.Station_Month
+                          Where Station_ID = ? and Year = ?
+                          Group By Date
+                          Order By Date ASC;""",
+    "monthly": """Select strftime('%m/%Y', Ride_Date) as Date, SUM(Num_Riders) as Total
+                    From Ridership
+                   Where Station_ID = ? and Ride_Date >= ? and Ride_Date < ?
+                   Group By Date
+                   Order By Date ASC;""",
+    "daily": """Select Station_ID, strftime('%Y-%m-%d', Ride_Date) as Date, Sum(Num_Riders)
+                  From Ridership
+                 Where Station_ID In ({placeholders}) and Ride_Date >= ? and Ride_Date < ?
+                 Group By Station_ID, Date
+                 Order By Station_ID, Date ASC;""",
+    "yearly_pivot_rollup": """Select Station_ID, Year, Num_Riders
+                                From rollup.Station_Year
+                               Where Station_ID In ({placeholders})
+                               Order By Station_ID, Year ASC;""",
+    "yearly_pivot": """Select Station_ID, strftime('%Y', Ride_Date) as Year, SUM(Num_Riders)
+                         From Ridership
+                        Where Station_ID In ({placeholders})
+                        Group By Station_ID, Year
+                        Order By Station_ID, Year ASC;""",
+    "monthly_pivot_rollup": """Select Station_ID, Month || '/' || Year as Date, SUM(Num_Riders)
+                                 From rollup.Station_Month
+                                Where Station_ID In ({placeholders}) and Year = ?
+                                Group By Station_ID, Date
+                                Order By Station_ID, Date ASC;""",
+    "monthly_pivot": """Select Station_ID, strftime('%m/%Y', Ride_Date) as Date, SUM(Num_Riders)
+                          From Ridership
+                         Where Station_ID In ({placeholders}) and Ride_Date >= ? and Ride_Date < ?
+                         Group By Station_ID, Date
+                         Order By Station_ID, Date ASC;""",
+    #every station's ridership for each month of a range, for a list of day types
+    "network_months_rollup": """Select Station_ID, Year || '-' || Month As Period, SUM(Num_Riders)
+                                  From rollup.Station_Month
+                                 Where Type_of_Day In ({placeholders})
+                                   and Year || '-' || Month >= ? and Year || '-' || Month < ?
+                                 Group By Station_ID, Period
+                                 Order By Station_ID, Period;""",
+    "network_months": """Select Station_ID, strftime('%Y-%m', Ride_Date) As Period, SUM(Num_Riders)
+                           From Ridership
+                          Where Type_of_Day In ({placeholders}) and Ride_Date >= ? and Ride_Date < ?
+                          Group By Station_ID, Period
+                          Order By Station_ID, Period;""",
+
+    #
+    # ranking.py: Station_ID, total and share of the total, for a list of day types.
+    # A negative limit means no limit.
+    #
+    "ranking_rollup": """Select Station_ID, Total, Total * 100.0 / SUM(Total) Over () As Share
+                           From (Select Station_ID, SUM(Num_Riders) As Total
+                                   From rollup.Station_DayType
+                                  Where Type_of_Day In ({placeholders})
+                                  Group By Station_ID)
+                          Order By Total DESC, Station_ID ASC
+                          Limit ?;""",
+    "ranking_months_rollup": """Select Station_ID, Total, Total * 100.0 / SUM(Total) Over () As Share
+                                  From (Select Station_ID, SUM(Num_Riders) As Total
+                                          From rollup.Station_Month
+                                         Where Type_of_Day In ({placeholders})
+                                           and Year || '-' || Month >= ? and Year || '-' || Month < ?
+                                         Group By Station_ID)
+                                 Order By Total DESC, Station_ID ASC
+                                 Limit ?;""",
+    "ranking_range": """Select Station_ID, Total, Total * 100.0 / SUM(Total) Over () As Share
+                          From (Select Station_ID, SUM(Num_Riders) As Total
+                                  From Ridership
+                                 Where Type_of_Day In ({placeholders}) and Ride_Date >= ? and Ride_Date < ?
+                                 Group By Station_ID)
+                         Order By Total DESC, Station_ID ASC
+                         Limit ?;""",
+    "ranking": """Select Station_ID, Total, Total * 100.0 / SUM(Total) Over () As Share
+                    From (Select Station_ID, SUM(Num_Riders) As Total
+                            From Ridership
+                           Where Type_of_Day In ({placeholders})
+                           Group By Station_ID)
+                   Order By Total DESC, Station_ID ASC
+                   Limit ?;""",
+
+    #
+    # rollups.py
+    #
+    "get_meta": "Select Value From rollup.Meta Where Key = ?;",
+    "set_meta": "Insert Or Replace Into rollup.Meta (Key, Value) Values (?, ?);",
+    "clear_station_month": "Delete From rollup.Station_Month;",
+    "clear_station_year": "Delete From rollup.Station_Year;",
+    "clear_station_daytype": "Delete From rollup.Station_DayType;",
+    "clear_totals": "Delete From rollup.Totals;",
+    "build_station_month": """Insert Into rollup.Station_Month
+                                Select Station_ID,
+                                       strftime('%Y', Ride_Date) As Year,
+                                       strftime('%m', Ride_Date) As Month,
+                                       Type_of_Day,
+                                       SUM(Num_Riders),
+                                       COUNT(*)
+                                  From main.Ridership
+                                 Group By Station_ID, Year, Month, Type_of_Day;""",
+    "build_station_year": """Insert Into rollup.Station_Year
+                               Select Station_ID, Year, SUM(Num_Riders)
+                                 From rollup.Station_Month
+                                Group By Station_ID, Year;""",
+    "build_station_daytype": """Insert Into rollup.Station_DayType
+                                  Select Station_ID, Type_of_Day, SUM(Num_Riders), SUM(Num_Days)
+                                    From rollup.Station_Month
+                                   Group By Station_ID, Type_of_Day;""",
+    "build_totals": """Insert Into rollup.Totals
+                         Select Type_of_Day, SUM(Num_Riders), SUM(Num_Days)
+                           From rollup.Station_DayType
+                          Group By Type_of_Day;""",
+    #running totals of each station and type of day, one row per day
+    "clear_station_cumulative": "Delete From rollup.Station_Cumulative;",
+    "build_station_cumulative": """Insert Into rollup.Station_Cumulative
+                                     Select Station_ID, Type_of_Day, substr(Ride_Date, 1, 10) As Day,
+                                            SUM(SUM(Num_Riders)) Over days,
+                                            SUM(COUNT(*)) Over days
+                                       From main.Ridership
+                                      Group By Station_ID, Type_of_Day, Day
+                                     Window days As (Partition By Station_ID, Type_of_Day Order By substr(Ride_Date, 1, 10));""",
+    "cumulative_before": """Select Cum_Riders, Cum_Days
+                              From rollup.Station_Cumulative
+                             Where Station_ID = ? and Type_of_Day = ? and Ride_Date < ?
+                             Order By Ride_Date DESC
+                             Limit 1;""",
+    "count_stations": "Select count(*) From Stations;",
+    "count_stops": "Select count(Stop_ID) From Stops;",
+    "ride_totals_rollup": "Select SUM(Num_Days), SUM(Num_Riders) From rollup.Totals;",
+    "ride_totals": "Select count(*), SUM(Num_Riders) From Ridership;",
+    #MIN and MAX on their own can be answered with a single index lookup each
+    "first_date": "Select strftime('%Y-%m-%d', MIN(Ride_Date)) From Ridership;",
+    "last_date": "Select strftime('%Y-%m-%d', MAX(Ride_Date)) From Ridership;",
+    "get_stats": """Select Num_Stations, Num_Stops, Num_Ride_Entries, First_Date, Last_Date, Total_Riders
+                      From rollup.Stats
+                     Where Version = ?;""",
+    "clear_stats": "Delete From rollup.Stats;",
+    "set_stats": "Insert Into rollup.Stats Values (?, ?, ?, ?, ?, ?, ?);",
+
+    #
+    # ingest.py
+    #
+    "sample_date": "Select Ride_Date From Ridership Limit 1;",
+    "stage_row": "Insert Or Replace Into temp.Staging Values (?, ?, ?, ?, ?);",
+    "add_new_stations": """Insert Into Stations (Station_ID, Station_Name)
+                             Select Station_ID, MAX(Station_Name)
+                               From temp.Staging
+                              Where Station_Name != ''
+                                and Station_ID Not In (Select Station_ID From Stations)
+                              Group By Station_ID;""",
+    #the days that are already in Ridership (found with the Station_ID, Ride_Date index)
+    "save_replaced_days": """Insert Into temp.Replaced
+                               Select Station_ID, Ride_Date, Type_of_Day, Num_Riders
+                                 From Ridership
+                                Where Exists (Select 1 From temp.Staging
+                                               Where Staging.Station_ID = Ridership.Station_ID
+                                                 and Staging.Ride_Date = Ridership.Ride_Date);""",
+    "delete_replaced_days": """Delete From Ridership
+                                Where Exists (Select 1 From temp.Staging
+                                               Where Staging.Station_ID = Ridership.Station_ID
+                                                 and Staging.Ride_Date = Ridership.Ride_Date);""",
+    "skip_existing_days": """Delete From temp.Staging
+                              Where Exists (Select 1 From Ridership
+                                             Where Ridership.Station_ID = Staging.Station_ID
+                                               and Ridership.Ride_Date = Staging.Ride_Date);""",
+    "insert_staged_days": """Insert Into Ridership (Station_ID, Ride_Date, Type_of_Day, Num_Riders)
+                               Select Station_ID, Ride_Date, Type_of_Day, Num_Riders
+                                 From temp.Staging
+                                Order By Station_ID, Ride_Date;""",
+    "add_staged_months": """Insert Into rollup.Station_Month
+                              Select Station_ID,
+                                     strftime('%Y', Ride_Date) As Year,
+                                     strftime('%m', Ride_Date) As Month,
+                                     Type_of_Day,
+                                     SUM(Num_Riders),
+                                     COUNT(*)
+                                From temp.Staging
+                               Where true
+                               Group By Station_ID, Year, Month, Type_of_Day
+                              On Conflict (Station_ID, Year, Month, Type_of_Day) Do Update
+                                 Set Num_Riders = Num_Riders + excluded.Num_Riders,
+                                     Num_Days = Num_Days + excluded.Num_Days;""",
+    "subtract_replaced_months": """Insert Into rollup.Station_Month
+                                     Select Station_ID,
+                                            strftime('%Y', Ride_Date) As Year,
+                                            strftime('%m', Ride_Date) As Month,
+                                            Type_of_Day,
+                                            -SUM(Num_Riders),
+                                            -COUNT(*)
+                                       From temp.Replaced
+                                      Where true
+                                      Group By Station_ID, Year, Month, Type_of_Day
+                                     On Conflict (Station_ID, Year, Month, Type_of_Day) Do Update
+                                        Set Num_Riders = Num_Riders + excluded.Num_Riders,
+                                            Num_Days = Num_Days + excluded.Num_Days;""",
+    "drop_empty_months": "Delete From rollup.Station_Month Where Num_Days = 0;",
+    "clear_changed_years": "Delete From rollup.Station_Year Where Station_ID In (Select Station_ID From temp.Staging);",
+    "derive_changed_years": """Insert Into rollup.Station_Year
+                                 Select Station_ID, Year, SUM(Num_Riders)
+                                   From rollup.Station_Month
+                                  Where Station_ID In (Select Station_ID From temp.Staging)
+                                  Group By Station_ID, Year;""",
+    #the running totals of a changed station are re-derived from its first changed day on
+    "clear_changed_cumulative": """With Changed As (Select Station_ID, MIN(substr(Ride_Date, 1, 10)) As First_Day
+                                                      From (Select Station_ID, Ride_Date From temp.Staging
+                                                            Union All
+                                                            Select Station_ID, Ride_Date From temp.Replaced)
+                                                     Group By Station_ID)
+                                   Delete From rollup.Station_Cumulative
+                                    Where Station_ID In (Select Station_ID From Changed)
+                                      and Ride_Date >= (Select First_Day From Changed
+                                                         Where Changed.Station_ID = Station_Cumulative.Station_ID);""",
+    "derive_changed_cumulative": """With Changed As (Select Station_ID, MIN(substr(Ride_Date, 1, 10)) As First_Day
+                                                       From (Select Station_ID, Ride_Date From temp.Staging
+                                                             Union All
+                                                             Select Station_ID, Ride_Date From temp.Replaced)
+                                                      Group By Station_ID)
+                                    Insert Into rollup.Station_Cumulative
+                                    Select Station_ID, Type_of_Day, Day,
+                                           COALESCE((Select Cum_Riders From rollup.Station_Cumulative As Earlier
+                                                      Where Earlier.Station_ID = Changed_Days.Station_ID
+                                                        and Earlier.Type_of_Day = Changed_Days.Type_of_Day
+                                                      Order By Earlier.Ride_Date DESC Limit 1), 0) + SUM(Riders) Over days,
+                                           COALESCE((Select Cum_Days From rollup.Station_Cumulative As Earlier
+                                                      Where Earlier.Station_ID = Changed_Days.Station_ID
+                                                        and Earlier.Type_of_Day = Changed_Days.Type_of_Day
+                                                      Order By Earlier.Ride_Date DESC Limit 1), 0) + SUM(Num_Days) Over days
+                                      From (Select Ridership.Station_ID, Ridership.Type_of_Day, substr(Ridership.Ride_Date, 1, 10) As Day,
+                                                   SUM(Ridership.Num_Riders) As Riders, COUNT(*) As Num_Days
+                                              From Ridership
+                                              Join Changed On Ridership.Station_ID = Changed.Station_ID
+                                             Where Ridership.Ride_Date >= Changed.First_Day
+                                             Group By Ridership.Station_ID, Ridership.Type_of_Day, Day) As Changed_Days
+                                    Window days As (Partition By Station_ID, Type_of_Day Order By Day);""",
+    "clear_changed_daytypes": "Delete From rollup.Station_DayType Where Station_ID In (Select Station_ID From temp.Staging);",
+    "derive_changed_daytypes": """Insert Into rollup.Station_DayType
+                                    Select Station_ID, Type_of_Day, SUM(Num_Riders), SUM(Num_Days)
+                                      From rollup.Station_Month
+                                     Where Station_ID In (Select Station_ID From temp.Staging)
+                                     Group By Station_ID, Type_of_Day;""",
+}
+
+#
+# export.py: a series for each granularity, from the rollups (full history only)
+# or from Ridership, for every station or a list of them, and from Ridership
+# optionally within a date range. Named series_<granularity>[_rollup][_range][_stations].
+#
+SERIES = {
+    ("daily", False): ("Select Station_ID, strftime('%Y-%m-%d', Ride_Date), Type_of_Day, SUM(Num_Riders) From Ridership",
+                       "Group By Station_ID, Ride_Date Order By Station_ID, Ride_Date"),
+    ("monthly", False): ("Select Station_ID, strftime('%Y-%m', Ride_Date) As Period, SUM(Num_Riders) From Ridership",
+                         "Group By Station_ID, Period Order By Station_ID, Period"),
+    ("yearly", False): ("Select Station_ID, strftime('%Y', Ride_Date) As Period, SUM(Num_Riders) From Ridership",
+                        "Group By Station_ID, Period Order By Station_ID, Period"),
+    ("daytype", False): ("Select Station_ID, Type_of_Day, SUM(Num_Riders) From Ridership",
+                         "Group By Station_ID, Type_of_Day Order By Station_ID, Type_of_Day"),
+    ("monthly", True): ("Select Station_ID, Year || '-' || Month, SUM(Num_Riders) From rollup.Station_Month",
+                        "Group By Station_ID, Year, Month Order By Station_ID, Year, Month"),
+    ("yearly", True): ("Select Station_ID, Year, Num_Riders From rollup.Station_Year",
+                       "Order By Station_ID, Year"),
+    ("daytype", True): ("Select Station_ID, Type_of_Day, Num_Riders From rollup.Station_DayType",
+                        "Order By Station_ID, Type_of_Day"),
+}
+
+def series_name(granularity, rollup=False, date_range=False, station_list=False):
+    """
+    This function names the export statement for a series.
+
+    Args:
+        granularity: "daily", "monthly", "yearly" or "daytype"
+        rollup: True to read the rollups
+        date_range: True to filter on a date range (Ridership only)
+        station_list: True to filter on a list of Station_IDs
+
+    Returns:
+        The statement name (e.g. series_monthly_range_stations)
+    """
+    return ("series_" + granularity + ("_rollup" if rollup else "") + ("_range" if date_range else "")
+            + ("_stations" if station_list else ""))
+
+def add_series_statements():
+    """
+    This function adds the export statements of every series in SERIES to STATEMENTS.
+    """
+    for (granularity, rollup), (select, group) in SERIES.items():
+        for date_range in ((False,) if rollup else (False, True)):
+            for station_list in (False, True):
+                where = []
+                if(date_range):
+                    where.append("Ride_Date >= ? and Ride_Date < ?")
+                if(station_list):
+                    where.append("Station_ID In ({placeholders})")
+                sql_query = select
+                if(len(where) > 0):
+                    sql_query += " Where " + " and ".join(where)
+                STATEMENTS[series_name(granularity, rollup, date_range, station_list)] = sql_query + " " + group + ";"
+
+add_series_statements()
+
+def text(name, placeholders=None):
+    """
+    This function finds the SQL of a statement.
+
+    Args:
+        name: the statement name
+        placeholders: the length of the IN list, for statements with one
+
+    Returns:
+        The SQL
+
+    Raises:
+        KeyError if there is no such statement
+    """
+    if(placeholders == None):
+        return STATEMENTS[name]
+    key = (name, placeholders)
+    sql_query = expanded.get(key)
+    if(sql_query == None):
+        sql_query = STATEMENTS[name].replace("{placeholders}", ", ".join("?"*placeholders))
+        expanded[key] = sql_query
+    return sql_query
+
+def count(name):
+    """
+    This function counts a run of a statement.
+
+    Args:
+        name: the statement name
+    """
+    with counts_lock:
+        counts[name] = counts.get(name, 0) + 1
+
+def execute(dbConn, name, parameters=(), placeholders=None):
+    """
+    This function runs a statement from the registry.
+
+    Args:
+        dbConn: connection to the CTA database
+        name: the statement name
+        parameters: the values of its ? parameters
+        placeholders: the length of the IN list, for statements with one
+
+    Returns:
+        The cursor, ready to fetch the rows
+    """
+    sql_query = text(name, placeholders)
+    count(name)
+    return dbConn.execute(sql_query, parameters)
+
+def executemany(dbConn, name, seq_of_parameters):
+    """
+    This function runs a statement from the registry once for each set of parameters.
+
+    Args:
+        dbConn: connection to the CTA database
+        name: the statement name
+        seq_of_parameters: an iterable of parameter lists
+
+    Returns:
+        The cursor
+    """
+    sql_query = text(name)
+    count(name)
+    return dbConn.executemany(sql_query, seq_of_parameters)
+
+def execution_counts():
+    """
+    This function reports how many times each statement ran.
+
+    Returns:
+        A list of (statement name, number of runs) tuples, most run first
+    """
+    with counts_lock:
+        rows = list(counts.items())
+    rows.sort(key=lambda row: (-row[1], row[0]))
+    return rows
@@ -0,0 +1,158 @@
+"""
+In-memory station name resolver.
+
+The Stations table is loaded once per session (see get_station_resolver())
+and kept sorted by name, so looking up a station does not need a query.
+Patterns follow SQL LIKE semantics, the same as "Station_Name Like ?":
+% matches any run of characters, _ matches one character, and letters
+match without regard to (ASCII) case. The literal text before the first
+wildcard is used to narrow the search with a binary search over the
+lower-cased names.
+"""
+
+import bisect
+import re
+
+import database
+import sql
+
+
+ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+def like_to_regex(pattern):
+    """
+    This function converts a SQL LIKE pattern into a compiled regular expression.
+
+    Args:
+        pattern: the LIKE pattern (wildcards _ and %)
+
+    Returns:
+        The compiled regular expression, to be used with fullmatch()
+    """
+    regex = ""
+    for char in pattern:
+        if(char == '%'):
+            regex += ".*"
+        elif(char == '_'):
+            regex += "."
+        else:
+            regex += re.escape(char)
+    return re.compile(regex, re.IGNORECASE | re.ASCII | re.DOTALL)
+
+def literal_prefix(pattern):
+    """
+    This function finds the part of a LIKE pattern before the first wildcard.
+
+    Args:
+        pattern: the LIKE pattern (wildcards _ and %)
+
+    Returns:
+        The literal prefix (may be empty)
+    """
+    for index, char in enumerate(pattern):
+        if(char == '%' or char == '_'):
+            return pattern[:index]
+    return pattern
+
+def ascii_lower(text):
+    """
+    This function lower-cases only the ASCII letters of a string, like SQLite's LIKE does.
+
+    Args:
+        text: the string
+
+    Returns:
+        The string with A-Z lower-cased
+    """
+    return text.translate(ASCII_LOWER)
+
+class station_resolver:
+    """
+    The Stations table, sorted by name, with LIKE-style lookups.
+    """
+    def __init__(self, rows):
+        self.stations = sorted(rows, key=lambda row: (row[1], row[0])) #(Station_ID, Station_Name) by name
+        self.ids_by_name = {} #exact name -> list of Station_IDs
+        self.names_by_id = {} #Station_ID -> name
+        for station_id, station_name in self.stations:
+            self.ids_by_name.setdefault(station_name, []).append(station_id)
+            self.names_by_id[station_id] = station_name
+        self.folded = sorted((ascii_lower(row[1]), number) for number, row in enumerate(self.stations))
+        self.folded_names = [row[0] for row in self.folded]
+
+    def __len__(self):
+        return len(self.stations)
+
+    def match(self, pattern):
+        """
+        This function finds the stations whose names match a LIKE pattern.
+
+        Args:
+            pattern: the station name (wildcards _ and %)
+
+        Returns:
+            A list of (Station_ID, Station_Name) tuples sorted by name
+        """
+        prefix = ascii_lower(literal_prefix(pattern))
+        regex = like_to_regex(pattern)
+
+        #only the names starting with the literal prefix can match
+        numbers = []
+        start = bisect.bisect_left(self.folded_names, prefix)
+        for folded_name, number in self.folded[start:]:
+            if(not folded_name.startswith(prefix)):
+                break
+            if(regex.fullmatch(self.stations[number][1])):
+                numbers.append(number)
+
+        numbers.sort()
+        return [self.stations[number] for number in numbers]
+
+    def exact(self, station_name):
+        """
+        This function finds the IDs of the stations with exactly the given name.
+
+        Args:
+            station_name: the station name (no wildcards, case-sensitive)
+
+        Returns:
+            A list of Station_IDs, empty if there is no such station
+        """
+        return self.ids_by_name.get(station_name, [])
+
+    def name(self, station_id):
+        """
+        This function finds the name of a station.
+
+        Args:
+            station_id: the Station_ID
+
+        Returns:
+            The station name, None if there is no such station
+        """
+        return self.names_by_id.get(station_id)
+
+
+def build_station_resolver(dbConn):
+    """
+    This function loads the Stations table and builds the resolver.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The station_resolver
+    """
+    return station_resolver(sql.execute(dbConn, "stations").fetchall())
+
+def get_station_resolver(dbConn):
+    """
+    This function returns the station resolver for the session, building it on first use.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The station_resolver
+    """
+    return database.session_cached(dbConn, "station_resolver", build_station_resolver)
@@ -0,0 +1,155 @@
+"""
+Synthetic CTA database generator.
+
+Builds a database with the same tables as CTA2_L_daily_ridership.db
+(Stations, Stops, StopDetails, Lines, Ridership) at any scale, so the
+commands can be timed on more stations and longer histories than the real
+data has:
+
+    python synthetic.py bench.db --stations 300 --years 2001-2030
+
+Stations are scattered over the area of chicago.png, each with two stops
+(one per direction) on one or two lines. Ridership has one row per station
+per day, with weekday/Saturday/Sunday-holiday levels, a seasonal cycle and a
+slow trend per station, so the commands see realistically shaped data.
+The same seed always produces the same database.
+"""
+
+import argparse
+import datetime
+import math
+import os
+import random
+import sqlite3
+
+
+SCHEMA_SQL = """
+CREATE TABLE Stations (Station_ID INTEGER PRIMARY KEY, Station_Name TEXT);
+CREATE TABLE Stops (Stop_ID INTEGER PRIMARY KEY, Station_ID INTEGER, Stop_Name TEXT,
+                    Direction TEXT, ADA INTEGER, Latitude REAL, Longitude REAL);
+CREATE TABLE Lines (Line_ID INTEGER PRIMARY KEY, Color TEXT);
+CREATE TABLE StopDetails (Stop_ID INTEGER, Line_ID INTEGER);
+CREATE TABLE Ridership (Station_ID INTEGER, Ride_Date TEXT, Type_of_Day TEXT, Num_Riders INTEGER);
+"""
+
+COLORS = ["Red", "Blue", "Green", "Brown", "Purple", "Purple-Express", "Yellow", "Pink", "Orange"]
+BOUNDS = (41.7012, 42.0868, -87.9277, -87.5569) #latitude and longitude range of chicago.png
+FIRST_STATION_ID = 40000
+FIRST_STOP_ID = 30000
+BATCH_ROWS = 50000 #Ridership rows inserted per executemany
+
+
+def type_of_day(day):
+    """
+    This function finds the CTA type of day of a date.
+
+    Args:
+        day: a datetime.date
+
+    Returns:
+        'W' for a weekday, 'A' for a Saturday, 'U' for a Sunday or holiday
+    """
+    if((day.month, day.day) in ((1, 1), (7, 4), (12, 25)) or day.weekday() == 6):
+        return 'U'
+    elif(day.weekday() == 5):
+        return 'A'
+    return 'W'
+
+def ridership_rows(station_ids, first_day, last_day, seed):
+    """
+    This function generates the daily ridership of every station, station by station.
+
+    Args:
+        station_ids: a list of Station_IDs
+        first_day: the first datetime.date
+        last_day: the last datetime.date
+        seed: the random seed
+
+    Returns:
+        A generator of (Station_ID, Ride_Date, Type_of_Day, Num_Riders) tuples
+    """
+    levels = {'W': 1.0, 'A': 0.55, 'U': 0.4} #share of the weekday level
+    num_days = (last_day - first_day).days + 1
+
+    for station_id in station_ids:
+        rand = random.Random(seed * 1000003 + station_id)
+        weekday_level = rand.lognormvariate(8, 0.8) #a few busy stations, many quiet ones
+        trend = rand.uniform(-0.03, 0.05) #change per year
+
+        for number in range(num_days):
+            day = first_day + datetime.timedelta(days=number)
+            day_type = type_of_day(day)
+            season = 1 + 0.12 * math.sin(2 * math.pi * (day.timetuple().tm_yday - 100) / 365.25)
+            growth = (1 + trend) ** (number / 365.25)
+            riders = weekday_level * levels[day_type] * season * growth * rand.uniform(0.85, 1.15)
+            yield (station_id, day.isoformat() + "T00:00:00.000", day_type, int(riders))
+
+def generate_database(db_file, num_stations=150, first_year=2001, last_year=2021, seed=341):
+    """
+    This function writes a synthetic CTA database, replacing any file at the path.
+
+    Args:
+        db_file: the path of the database to create
+        num_stations: the number of stations
+        first_year: the first year with ridership
+        last_year: the last year with ridership
+        seed: the random seed
+
+    Returns:
+        The number of Ridership rows
+    """
+    if(os.path.exists(db_file)):
+        os.remove(db_file)
+    rand = random.Random(seed)
+
+    dbConn = sqlite3.connect(db_file)
+    dbConn.execute("PRAGMA journal_mode = OFF;") #a new file, nothing to roll back to
+    dbConn.execute("PRAGMA synchronous = OFF;")
+    dbConn.executescript(SCHEMA_SQL)
+
+    with dbConn:
+        dbConn.executemany("Insert Into Lines Values (?, ?);", enumerate(COLORS, start=1))
+
+        station_ids = []
+        stop_id = FIRST_STOP_ID
+        for number in range(1, num_stations + 1):
+            station_id = FIRST_STATION_ID + number * 10
+            station_name = f"Station-{number:04d}"
+            station_ids.append(station_id)
+            dbConn.execute("Insert Into Stations Values (?, ?);", [station_id, station_name])
+
+            latitude = rand.uniform(BOUNDS[0], BOUNDS[1])
+            longitude = rand.uniform(BOUNDS[2], BOUNDS[3])
+            line_ids = rand.sample(range(1, len(COLORS) + 1), rand.choice((1, 1, 1, 2)))
+            for direction in rand.choice((("N", "S"), ("E", "W"))):
+                stop_id += 1
+                dbConn.execute("Insert Into Stops Values (?, ?, ?, ?, ?, ?, ?);",
+                               [stop_id, station_id, f"{station_name} ({direction}-bound)", direction,
+                                int(rand.random() < 0.7), round(latitude, 6), round(longitude, 6)])
+                dbConn.executemany("Insert Into StopDetails Values (?, ?);", [(stop_id, line_id) for line_id in line_ids])
+
+    rows = ridership_rows(station_ids, datetime.date(first_year, 1, 1), datetime.date(last_year, 12, 31), seed)
+    count = 0
+    with dbConn:
+        while True:
+            batch = [row for _, row in zip(range(BATCH_ROWS), rows)]
+            if(len(batch) == 0):
+                break
+            dbConn.executemany("Insert Into Ridership Values (?, ?, ?, ?);", batch)
+            count += len(batch)
+
+    dbConn.close()
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic CTA L ridership database.")
+    parser.add_argument("db", help="path of the database to create (replaced if it exists)")
+    parser.add_argument("--stations", type=int, default=150, help="number of stations (default 150)")
+    parser.add_argument("--years", default="2001-2021", help="first-last year of ridership (default 2001-2021)")
+    parser.add_argument("--seed", type=int, default=341, help="random seed (default 341)")
+    args = parser.parse_args()
+
+    first_year, _, last_year = args.years.partition("-")
+    count = generate_database(args.db, args.stations, int(first_year), int(last_year or first_year), args.seed)
+    print(f"Wrote {args.stations:,} stations and {count:,} ridership rows to {args.db}")
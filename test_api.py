@@ -0,0 +1,61 @@
+"""
+Tests of the library API on a small synthetic database.
+
+    python -m pytest -q
+"""
+
+import sqlite3
+
+import pytest
+
+import api
+import cache
+import columnar
+
+
+@pytest.fixture
+def shared_name_db(db_file):
+    """
+    The synthetic database with two stations sharing a name, like the real
+    stations that were split into one Station_ID per platform.
+    """
+    dbConn = sqlite3.connect(db_file)
+    with dbConn:
+        dbConn.execute("Update Stations Set Station_Name = 'Shared' Where Station_ID In (40020, 40070);")
+    dbConn.close()
+    return db_file
+
+def weekday_rows(db_file, numpy_engine, monkeypatch):
+    """
+    This function runs command 3 on a new connection with one of the engines.
+
+    Returns:
+        A list of (name, riders, percentage rounded as printed) tuples
+    """
+    monkeypatch.setattr(cache, "enabled", False)
+    monkeypatch.setattr(columnar, "enabled", numpy_engine)
+    dbConn = sqlite3.connect(db_file)
+    try:
+        return [(share.station_name, share.riders, f"{share.percentage:.2f}")
+                for share in api.weekday_ridership(dbConn)]
+    finally:
+        dbConn.close()
+
+@pytest.mark.skipif(not columnar.available(), reason="NumPy is not installed")
+def test_weekday_ridership_same_on_both_engines(shared_name_db, monkeypatch):
+    sqlite_rows = weekday_rows(shared_name_db, False, monkeypatch)
+    numpy_rows = weekday_rows(shared_name_db, True, monkeypatch)
+    assert sqlite_rows == numpy_rows
+    assert len(sqlite_rows) == 11 #12 stations, two of them under one name
+
+def test_weekday_ridership_groups_by_name(shared_name_db, monkeypatch):
+    rows = weekday_rows(shared_name_db, False, monkeypatch)
+    dbConn = sqlite3.connect(shared_name_db)
+    expected = dbConn.execute("""Select Stations.Station_Name As Name, SUM(Ridership.Num_Riders) As Total
+                                   From Stations
+                                   Join Ridership On Stations.Station_ID = Ridership.Station_ID
+                                  Where Ridership.Type_of_Day = 'W'
+                                  Group By Name
+                                  Order By Total DESC;""").fetchall()
+    dbConn.close()
+    assert [(name, riders) for name, riders, percentage in rows] == expected
@@ -0,0 +1,90 @@
+"""
+Tests of the incremental rollup and prefix-sum updates of ingest.py against a full rebuild.
+
+    python -m pytest -q
+"""
+
+import csv
+import datetime
+import shutil
+
+import pytest
+
+import ingest
+import main
+import rollups
+
+
+ROLLUP_TABLES = ["Station_Month", "Station_Year", "Station_DayType", "Totals", "Station_Cumulative"]
+
+
+def write_csv(csv_file):
+    """
+    This function writes a CSV of new ridership: new days for two stations, a new station,
+    days that are already in the database and a day repeated with a different count.
+    """
+    rows = []
+    for number in range(20):
+        day = datetime.date(2021, 1, 1) + datetime.timedelta(days=number)
+        day_type = "U" if day.weekday() == 6 else ("A" if day.weekday() == 5 else "W")
+        rows.append((40010, "Station-0001", day.isoformat(), day_type, 1000 + number))
+        rows.append((40020, "Station-0002", day.isoformat(), day_type, 2000 + number))
+        rows.append((49990, "New Station", day.isoformat(), day_type, 300 + number))
+    for number in range(10): #already in the database
+        day = datetime.date(2020, 6, 1) + datetime.timedelta(days=number)
+        day_type = "U" if day.weekday() == 6 else ("A" if day.weekday() == 5 else "W")
+        rows.append((40030, "Station-0003", day.isoformat(), day_type, 7))
+    rows.append((40010, "Station-0001", "2021-01-05", "W", 5)) #repeated, the last row is kept
+
+    with open(csv_file, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Station_ID", "Station_Name", "Date", "Type_of_Day", "Num_Riders"])
+        writer.writerows(rows)
+
+def rollup_tables(dbConn):
+    """
+    This function reads every rollup table, the prefix-sum index and the general statistics.
+
+    Returns:
+        A dictionary of table name -> sorted rows
+    """
+    tables = {}
+    for table in ROLLUP_TABLES:
+        tables[table] = sorted(dbConn.execute(f"Select * From rollup.{table};").fetchall())
+    tables["Stats"] = rollups.general_stats(dbConn)
+    return tables
+
+@pytest.mark.parametrize("replace", [False, True])
+def test_ingest_matches_full_rebuild(db_file, tmp_path, monkeypatch, replace):
+    csv_file = str(tmp_path / "new.csv")
+    write_csv(csv_file)
+
+    dbConn = main.open_database(db_file) #builds the rollups and the prefix-sum index
+    assert rollups.rollups_current(dbConn)
+    assert rollups.cumulative_current(dbConn)
+    rollups.general_stats(dbConn)
+
+    #the rollups must be updated in place, not rebuilt
+    def no_rebuild(dbConn):
+        raise AssertionError("the rollups were rebuilt")
+    monkeypatch.setattr(rollups, "build_rollups", no_rebuild)
+    monkeypatch.setattr(rollups, "build_cumulative", no_rebuild)
+
+    counts = ingest.ingest_files(dbConn, [csv_file], replace)
+    assert counts["inserted"] == (70 if replace else 60)
+    assert counts["stations"] == 1
+    assert rollups.rollups_current(dbConn)
+    assert rollups.cumulative_current(dbConn)
+    updated = rollup_tables(dbConn)
+    dbConn.close()
+    monkeypatch.undo()
+
+    #the same data with the rollups built from scratch
+    fresh_file = str(tmp_path / "fresh.db")
+    shutil.copyfile(db_file, fresh_file)
+    dbConn = main.open_database(fresh_file)
+    rebuilt = rollup_tables(dbConn)
+    dbConn.close()
+
+    for table in rebuilt:
+        assert updated[table] == rebuilt[table], table
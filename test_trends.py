@@ -0,0 +1,44 @@
+"""
+Tests of the network-wide trends on a small synthetic database.
+
+    python -m pytest -q
+"""
+
+import datetime
+import sqlite3
+
+import pytest
+
+import api
+import columnar
+
+
+pytestmark = pytest.mark.skipif(not columnar.available(), reason="NumPy is not installed")
+
+LATE_STATION = 40050 #opens halfway through the history
+LATE_OPENING = "2020-07-01"
+
+
+@pytest.fixture
+def dbConn(db_file):
+    """
+    The synthetic database (a single year of history) with one station that opens in July.
+    """
+    dbConn = sqlite3.connect(db_file)
+    with dbConn:
+        dbConn.execute("Delete From Ridership Where Station_ID = ? and Ride_Date < ?;", [LATE_STATION, LATE_OPENING])
+    yield dbConn
+    dbConn.close()
+
+def days_after(date_text, first_date):
+    """
+    This function counts the days between two YYYY-MM-DD dates.
+    """
+    return (datetime.date.fromisoformat(date_text) - datetime.date.fromisoformat(first_date)).days
+
+def test_no_outliers_without_a_full_baseline(dbConn):
+    outliers = api.outlier_days(dbConn, 2020, threshold=2.0)
+    for outlier in outliers:
+        assert days_after(outlier.date, "2020-01-01") >= 60 #the start of the history
+        if(outlier.station_id == LATE_STATION):
+            assert days_after(outlier.date, LATE_OPENING) >= 60 #the start of the station's history
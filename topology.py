@@ -0,0 +1,106 @@
+"""
+In-memory topology of the CTA L lines.
+
+The Lines, StopDetails and Stops tables are loaded once per session
+(see get_line_topology()) into a map of line color -> direction -> stops,
+where each stop carries its ID, name, handicap accessibility, station and
+coordinates. The line commands are answered from this map without any
+further queries.
+"""
+
+import database
+import sql
+
+
+class line_topology:
+    """
+    The stops of every line by direction, plus the total number of stops.
+    """
+    def __init__(self, colors, rows, total_stops):
+        self.total_stops = total_stops
+        self.lines = {} #color -> direction -> list of stops sorted by name
+        for color in colors:
+            self.lines[color] = {}
+        for color, direction, stop_id, stop_name, ada, station_id, latitude, longitude in rows:
+            stop = (stop_id, stop_name, ada, station_id, latitude, longitude)
+            self.lines.setdefault(color, {}).setdefault(direction, []).append(stop)
+        for directions in self.lines.values():
+            for stops in directions.values():
+                stops.sort(key=lambda stop: (stop[1], stop[0]))
+
+    def has_line(self, color):
+        """
+        This function checks if there is a line with the given color.
+
+        Args:
+            color: the line color (e.g. Red or Purple-Express)
+
+        Returns:
+            True if the line exists
+            False otherwise
+        """
+        return color in self.lines
+
+    def stops(self, color, direction):
+        """
+        This function finds the stops of a line in one direction.
+
+        Args:
+            color: the line color
+            direction: the direction (N/S/E/W)
+
+        Returns:
+            A list of (Stop_ID, Stop_Name, ADA, Station_ID, Latitude, Longitude) tuples
+            sorted by stop name, empty if the line does not run in that direction
+        """
+        return self.lines.get(color, {}).get(direction, [])
+
+    def directions(self, color):
+        """
+        This function finds the directions a line runs in.
+
+        Args:
+            color: the line color
+
+        Returns:
+            A sorted list of directions
+        """
+        return sorted(self.lines.get(color, {}))
+
+    def colors(self):
+        """
+        This function lists the line colors.
+
+        Returns:
+            A sorted list of line colors
+        """
+        return sorted(self.lines)
+
+
+def build_line_topology(dbConn):
+    """
+    This function loads the lines and their stops and builds the topology.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The line_topology
+    """
+    colors = [row[0] for row in sql.execute(dbConn, "line_colors").fetchall()]
+    rows = sql.execute(dbConn, "line_stops").fetchall()
+    total_stops = sql.execute(dbConn, "stop_count").fetchone()[0]
+
+    return line_topology(colors, rows, total_stops)
+
+def get_line_topology(dbConn):
+    """
+    This function returns the line topology for the session, building it on first use.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The line_topology
+    """
+    return database.session_cached(dbConn, "line_topology", build_line_topology)
@@ -0,0 +1,234 @@
+"""
+Network-wide ridership trends over a station x day matrix.
+
+The Ridership columns (see columnar.py) are scattered once into dense
+matrices with one row per station and one column per day of the history:
+riders, whether the day has data, and its type of day. Every trend is then
+array math over whole matrices, for all of the stations at once:
+
+    rolling averages   trailing window sums from a cumulative sum along the days
+    year over year     average riders per day with data, summed by year with reduceat
+    day-type mix       each type of day's share of the year, and how far it moved
+    outlier days       riders against the mean and standard deviation of the same
+                       type of day over the previous BASELINE_DAYS
+
+The matrix is kept for the session and rebuilt when the data changes. It
+needs NumPy, like the NumPy engine, but not --engine numpy.
+"""
+
+try:
+    import numpy as np
+except ImportError: #api.py imports this module only for the trend commands, which check for NumPy
+    np = None
+
+import columnar
+import database
+
+
+BASELINE_DAYS = 91 #days before an outlier candidate that its expected ridership comes from
+BASELINE_SHARE = 0.75 #share of a full baseline's days of the same type needed to judge a day
+DAYS_PER_WEEK = (5, 1, 1) #days of each type in a week (columnar.DAY_TYPES order), holidays aside
+NO_DAY_TYPE = 255 #day type of a day without data
+
+
+def trailing_sums(values, window, include_current=True):
+    """
+    This function sums each row of a matrix over a trailing window of columns.
+
+    Args:
+        values: a 2-D array
+        window: the number of columns in the window
+        include_current: True to end the window at each column, False to end it just before
+
+    Returns:
+        A float array the shape of values
+    """
+    sums = np.zeros((values.shape[0], values.shape[1] + 1))
+    np.cumsum(values, axis=1, out=sums[:, 1:])
+    ends = np.arange(values.shape[1]) + (1 if include_current else 0)
+    starts = np.maximum(ends - window, 0)
+    return sums[:, ends] - sums[:, starts]
+
+
+class station_day_matrix:
+    """
+    The ridership of every station on every day, as dense matrices.
+    """
+    def __init__(self, columns):
+        self.station_ids = columns.station_ids
+        rows = np.repeat(np.arange(len(self.station_ids)), columns.ends - columns.starts)
+
+        if(len(columns) == 0):
+            self.first_day = 0
+            num_days = 0
+        else:
+            self.first_day = int(columns.day.min())
+            num_days = int(columns.day.max()) - self.first_day + 1
+        cols = columns.day - self.first_day
+        shape = (len(self.station_ids), num_days)
+
+        cells = rows.astype(np.int64) * num_days + cols
+        self.riders = np.bincount(cells, weights=columns.riders, minlength=shape[0]*shape[1]).reshape(shape)
+        self.present = np.bincount(cells, minlength=shape[0]*shape[1]).reshape(shape) > 0
+        self.day_type = np.full(shape, NO_DAY_TYPE, dtype=np.uint8)
+        self.day_type[rows, cols] = columns.day_type
+
+        #the year of each column, and the first column of each year
+        dates = (np.arange(num_days) + self.first_day).astype("datetime64[D]")
+        self.years = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+        self.year_starts = np.flatnonzero(np.r_[True, self.years[1:] != self.years[:-1]]) if num_days > 0 else np.zeros(0, dtype=np.int64)
+        self.year_list = self.years[self.year_starts].tolist()
+
+        self.yearly_totals = None #computed by yearly() on first use
+        self.scores = None #computed by z_scores() on first use
+
+    def row(self, station_id):
+        """
+        This function finds the row of a station.
+
+        Args:
+            station_id: the Station_ID
+
+        Returns:
+            The row number, or None if the station has no ridership
+        """
+        number = int(np.searchsorted(self.station_ids, station_id))
+        if(number == len(self.station_ids) or self.station_ids[number] != station_id):
+            return None
+        return number
+
+    def date(self, column):
+        """
+        This function converts a column number into a date.
+
+        Args:
+            column: the column number
+
+        Returns:
+            The date (YYYY-MM-DD)
+        """
+        return str(np.datetime64(self.first_day + int(column), "D"))
+
+    def year_number(self, year=None):
+        """
+        This function finds the position of a year in the history.
+
+        Args:
+            year: the year as a number or text, or None for the last year
+
+        Returns:
+            The index into year_list, or None if the year is not in the history
+        """
+        if(len(self.year_list) == 0):
+            return None
+        if(year == None):
+            return len(self.year_list) - 1
+        if(not str(year).strip().isdigit() or int(year) not in self.year_list):
+            return None
+        return self.year_list.index(int(year))
+
+    def year_columns(self, number):
+        """
+        This function finds the columns of a year.
+
+        Args:
+            number: the index of the year in year_list (see year_number())
+
+        Returns:
+            A slice of the columns
+        """
+        end = int(self.year_starts[number + 1]) if number + 1 < len(self.year_starts) else self.riders.shape[1]
+        return slice(int(self.year_starts[number]), end)
+
+    def rolling_average(self, window):
+        """
+        This function finds each station's average riders per day with data over a trailing
+        window of days.
+
+        Args:
+            window: the window in days
+
+        Returns:
+            A float matrix (station x day), NaN where the window has no data
+        """
+        sums = trailing_sums(self.riders, window)
+        counts = trailing_sums(self.present, window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def yearly(self):
+        """
+        This function sums each station's riders and days with data by year and type of day.
+
+        Returns:
+            A tuple with the riders and the days with data, both arrays of
+            station x year x type of day (columnar.DAY_TYPES order)
+        """
+        if(self.yearly_totals != None):
+            return self.yearly_totals
+        shape = (self.riders.shape[0], len(self.year_list), len(columnar.DAY_TYPES))
+        riders = np.zeros(shape)
+        days = np.zeros(shape)
+        if(shape[1] > 0):
+            for number in range(len(columnar.DAY_TYPES)):
+                of_type = self.day_type == number
+                riders[:, :, number] = np.add.reduceat(np.where(of_type, self.riders, 0), self.year_starts, axis=1)
+                days[:, :, number] = np.add.reduceat(of_type, self.year_starts, axis=1)
+        self.yearly_totals = (riders, days)
+        return self.yearly_totals
+
+    def z_scores(self):
+        """
+        This function compares each day with the same type of day over the previous BASELINE_DAYS.
+
+        Returns:
+            A float matrix (station x day) of (riders - mean) / standard deviation,
+            NaN where the day has no data or too short a baseline (fewer than
+            BASELINE_SHARE of the days of its type a full BASELINE_DAYS window holds,
+            e.g. in a station's first weeks, when a few days would make ordinary days
+            look like outliers)
+        """
+        if(self.scores is not None): #an array, so not != None
+            return self.scores
+        scores = np.full(self.riders.shape, np.nan)
+        for number in range(len(columnar.DAY_TYPES)):
+            of_type = self.day_type == number
+            min_baseline = BASELINE_SHARE * BASELINE_DAYS * DAYS_PER_WEEK[number] / 7
+            values = np.where(of_type, self.riders, 0.0)
+            counts = trailing_sums(of_type, BASELINE_DAYS, include_current=False)
+            sums = trailing_sums(values, BASELINE_DAYS, include_current=False)
+            squares = trailing_sums(values * values, BASELINE_DAYS, include_current=False)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = sums / counts
+                std = np.sqrt(np.maximum(squares / counts - mean * mean, 0))
+                judged = of_type & (counts >= min_baseline) & (std > 0)
+                scores = np.where(judged, (self.riders - mean) / std, scores)
+        self.scores = scores
+        return scores
+
+
+def build_station_day_matrix(dbConn):
+    """
+    This function builds the station x day matrix from the Ridership columns.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The station_day_matrix
+    """
+    #shares the columns with the NumPy engine if it already loaded them
+    columns = database.session_cached(dbConn, "ridership_columns", columnar.load_columns)
+    return station_day_matrix(columns)
+
+def get_station_day_matrix(dbConn):
+    """
+    This function returns the station x day matrix for the session, building it on first use.
+
+    Args:
+        dbConn: connection to the CTA database
+
+    Returns:
+        The station_day_matrix
+    """
+    return database.session_cached(dbConn, "station_day_matrix", build_station_day_matrix)